@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ECommerceAPI.settings')
+# serve /login/ and /register/ with the async views (ecommerce/views/auth_async.py)
+os.environ.setdefault('ASYNC_AUTH_VIEWS', '1')
 
 application = get_asgi_application()
@@ -14,6 +14,8 @@ from pathlib import Path
 from datetime import timedelta
 import os
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -42,12 +44,13 @@ INSTALLED_APPS = [
     "ecommerce.apps.EcommerceConfig",
     "rest_framework",
     "django_filters",
-    "debug_toolbar",
     "rest_framework_simplejwt",
     "corsheaders",
 ]
 
 MIDDLEWARE = [
+    # outermost, so the timings include every other middleware
+    "ecommerce.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -55,10 +58,17 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
-    "corsheaders.middleware.CorsMiddleware"
+    "corsheaders.middleware.CorsMiddleware",
+    "ecommerce.routers.ReplicaRoutingMiddleware",
 ]
 
+# the HTML debug toolbar for local work, off unless asked for (see /metrics for numbers)
+DEBUG_TOOLBAR = DEBUG and os.environ.get("DEBUG_TOOLBAR") == "1"
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.append("debug_toolbar.middleware.DebugToolbarMiddleware")
+    INTERNAL_IPS = ["127.0.0.1"]
+
 ROOT_URLCONF = "ECommerceAPI.urls"
 
 TEMPLATES = [
@@ -143,8 +153,24 @@ REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
+    # token buckets per user (or IP) for the expensive endpoints, see ecommerce/throttling.py
+    "DEFAULT_THROTTLE_RATES": {
+        "login": "10/min",  # PBKDF2 per attempt
+        "register": "5/min",
+        "add_item": "60/min",  # add_item and batch
+        "checkout": "10/min",  # a Stripe call per checkout
+    },
+    "DEFAULT_RENDERER_CLASSES": [
+        # orjson when installed, same bytes as rest_framework's JSONRenderer
+        "ecommerce.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
 }
 
+# product list and cart reads build their JSON from values() rows instead of
+# the ModelSerializers, see ecommerce/serializers/fast.py
+FAST_SERIALIZERS = True
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
@@ -152,6 +178,39 @@ SIMPLE_JWT = {
     "BLACKLIST_AFTER_ROTATION": True,
 }
 
+# cache for the user loaded by CookiesJWTAuthentication (see ecommerce/authentication.py)
+AUTH_USER_CACHE = {
+    "TIMEOUT": 30,  # seconds
+    "MAX_SIZE": 4096,  # users kept in each process
+    "SHARED_CACHE": None,  # a CACHES alias (e.g. "default") to share across workers
+}
+
+# revoked refresh/access tokens (logout, rotation), see ecommerce/revocation.py
+REVOKED_TOKENS = {
+    "SYNC_INTERVAL": 5,  # seconds between pulls of other workers' revocations
+    "PRUNE_INTERVAL": 3600,  # seconds between deletes of expired rows
+    "CAPACITY": 100_000,  # expected revoked tokens, sizes the Bloom filter
+    "ERROR_RATE": 0.001,  # Bloom false positives fall through to the table
+}
+
+# async login/register views, on by default under asgi.py (see ecommerce/hashing.py)
+ASYNC_AUTH_VIEWS = os.environ.get("ASYNC_AUTH_VIEWS") == "1"
+AUTH_HASHING = {
+    "MAX_WORKERS": min(4, os.cpu_count() or 1),  # threads running PBKDF2
+    "MAX_PENDING": 32,  # hashes running or queued before answering 503
+    "RETRY_AFTER": 1,  # seconds, sent with the 503
+}
+
+# per-route request metrics served at /metrics, see ecommerce/metrics.py
+METRICS = {
+    "PREFIX": "ecommerce_",  # prepended to every metric name
+    "TOKEN": os.environ.get("METRICS_TOKEN"),  # bearer token for /metrics; without it, 404 unless DEBUG
+    "SERVER_TIMING": os.environ.get("SERVER_TIMING") == "1",  # add a Server-Timing header
+    "DURATION_BUCKETS": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),  # seconds
+    "QUERY_BUCKETS": (0, 1, 2, 3, 5, 10, 20, 50, 100),
+    "SIZE_BUCKETS": (256, 1024, 4096, 16384, 65536, 262144, 1048576),  # bytes
+}
+
 # --- CORS CONFIGURATION --- #
 # to make django does not block frontend form security rules (CORS)
 CORS_ALLOW_CREDENTIALS = True
@@ -162,10 +221,59 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:5500",
     "http://localhost:3000",  # React (common port)
 ]
+# let frontends send Idempotency-Key with cart/checkout POSTs
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
+
+# --- CACHE --- #
+# locmem is per process; point REDIS_URL at a shared server in production so
+# every worker sees the same catalog version
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+if os.environ.get("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+    }
+
+CATALOG_CACHE_TIMEOUT = 300  # seconds a cached product page/detail is served
+CATALOG_CACHE_LOCK_TIMEOUT = 5  # seconds other requests wait for a page being built
+
+# --- INVENTORY --- #
+# how long items sitting in an active cart hold their stock
+CART_RESERVATION_TTL = timedelta(minutes=30)
+# how much longer they hold it once checkout started a payment that hasn't
+# been answered yet; abandoned checkouts give the stock back after this
+CART_PAYMENT_HOLD = timedelta(hours=24)
+
+# Idempotency-Key on cart/checkout POSTs, see ecommerce/idempotency.py
+IDEMPOTENCY = {
+    "TTL": timedelta(hours=24),  # how long a stored response is replayed
+    "WAIT": 10,  # seconds a duplicate waits for the first request before a 409
+    "LOCK_TIMEOUT": 60,  # seconds after which a key left in progress is taken over
+    "PRUNE_INTERVAL": 3600,  # seconds between deletes of expired keys
+}
 
 # --- STRIPE CONFIGURATION --- #
 STRIPE_PUBLISHABLE_KEY = os.environ.get("STRIPE_PUBLISHABLE_KEY")
 STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY")
+# signing secret of the /webhooks/stripe/ endpoint (whsec_...)
+STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET")
+
+# checkout payments, see ecommerce/payments.py
+PAYMENT_GATEWAY = {
+    # ecommerce.payments.FakeGateway keeps intents in memory (tests, load runs)
+    "BACKEND": os.environ.get("PAYMENT_GATEWAY", "ecommerce.payments.StripeGateway"),
+    "CONNECT_TIMEOUT": 3,  # seconds
+    "READ_TIMEOUT": 10,  # seconds
+    "MAX_RETRIES": 2,  # network retries, sent with the same idempotency key
+    "POOL_SIZE": 10,  # pooled connections to Stripe per process
+    "BREAKER_THRESHOLD": 5,  # consecutive failures before checkout fails fast
+    "BREAKER_RESET": 30,  # seconds before a trial call is let through
+    "LATENCY": 0,  # seconds, FakeGateway only
+}
 
 # --- POSTGRESQL DB --- #
 DATABASES = {
@@ -176,5 +284,23 @@ DATABASES = {
         "PASSWORD": os.environ.get("DATABASE_PASSWORD"),
         "HOST": os.environ.get("DATABASE_HOST"),
         "PORT": os.environ.get("DATABASE_PORT"),
+        # keep connections open between requests instead of one per request
+        "CONN_MAX_AGE": int(os.environ.get("DATABASE_CONN_MAX_AGE", 60)),  # seconds
+        "CONN_HEALTH_CHECKS": True,  # drop a reused connection the server closed
     }
-}
\ No newline at end of file
+}
+
+# --- READ REPLICAS --- #
+# DATABASE_REPLICA_HOSTS="replica-1,replica-2" adds one alias per host, with
+# the primary's credentials; catalog reads go there (ecommerce/routers.py)
+DATABASE_ROUTERS = ["ecommerce.routers.ReplicaRouter"]
+REPLICA_ROUTING = {
+    "ALIASES": [],
+    "STICKY_SECONDS": 5,  # reads stay on the primary this long after a write
+    "COOKIE_NAME": "db_primary",  # marks a client that just wrote
+}
+for number, host in enumerate(filter(None, os.environ.get("DATABASE_REPLICA_HOSTS", "").split(",")), start=1):
+    alias = f"replica_{number}"
+    # tests read the primary's test database through the replica aliases
+    DATABASES[alias] = {**DATABASES["default"], "HOST": host.strip(), "TEST": {"MIRROR": "default"}}
+    REPLICA_ROUTING["ALIASES"].append(alias)
@@ -1,9 +1,13 @@
 from django.contrib import admin
 
-from .models import Product, Category, Cart, CartItem
+from .models import Product, Category, Cart, CartItem, Order, OrderLine, PaymentEvent, StockReservation
 
 # Register your models here.
 admin.site.register(Product)
 admin.site.register(Category)
 admin.site.register(Cart)
 admin.site.register(CartItem)
+admin.site.register(StockReservation)
+admin.site.register(PaymentEvent)
+admin.site.register(Order)
+admin.site.register(OrderLine)
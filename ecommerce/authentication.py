@@ -1,4 +1,89 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .revocation import revoked_tokens
+
+
+# --- User cache --- #
+# Loading request.user is one auth_user SELECT per request. Users are kept in
+# a small per-process LRU keyed on (user id, token jti) for a few seconds, and
+# optionally in a shared cache so other workers skip the query too. Saving a
+# user (password change, deactivation, ...) drops them from both, see
+# signals.py; other processes' LRUs catch up within the TTL.
+class UserCache:
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def options(self):
+        return settings.AUTH_USER_CACHE
+
+    def shared(self):
+        alias = self.options.get("SHARED_CACHE")
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def shared_key(user_id):
+        return f"auth:user:{user_id}"
+
+    def get(self, user_id, jti):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((user_id, jti))
+            if entry is not None:
+                user, expires = entry
+                if expires > now:
+                    self._entries.move_to_end((user_id, jti))
+                    return copy.copy(user)
+                del self._entries[(user_id, jti)]
+
+        shared = self.shared()
+        if shared is not None:
+            user = shared.get(self.shared_key(user_id))
+            if user is not None:
+                self._remember(user_id, jti, user)
+                return copy.copy(user)
+        return None
+
+    def set(self, user_id, jti, user):
+        self._remember(user_id, jti, user)
+        shared = self.shared()
+        if shared is not None:
+            shared.set(self.shared_key(user_id), user, timeout=self.options["TIMEOUT"])
+
+    def _remember(self, user_id, jti, user):
+        expires = time.monotonic() + self.options["TIMEOUT"]
+        with self._lock:
+            self._entries[(user_id, jti)] = (copy.copy(user), expires)
+            self._entries.move_to_end((user_id, jti))
+            while len(self._entries) > self.options["MAX_SIZE"]:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+        shared = self.shared()
+        if shared is not None:
+            shared.delete(self.shared_key(user_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
 
 
 # Custom authentication class to extract JWT token from cookies
@@ -20,6 +105,25 @@ class CookiesJWTAuthentication(JWTAuthentication):
 
         try:
             validated_token = self.get_validated_token(raw_token)
-            return self.get_user(validated_token), validated_token
+            if revoked_tokens.is_revoked(validated_token.get(api_settings.JTI_CLAIM, "")):
+                return None
+            if self.use_stateless_user(request):
+                return TokenUser(validated_token), validated_token
+            return self.get_cached_user(validated_token), validated_token
         except Exception:
             return None
+
+    def use_stateless_user(self, request):
+        # views that only read public data can opt in with `stateless_auth = True`
+        # and get a user built from the token claims, without any query
+        view = (getattr(request, "parser_context", None) or {}).get("view")
+        return request.method in SAFE_METHODS and getattr(view, "stateless_auth", False)
+
+    def get_cached_user(self, validated_token):
+        user_id = str(validated_token.get(api_settings.USER_ID_CLAIM, ""))
+        jti = validated_token.get(api_settings.JTI_CLAIM, "")
+        user = user_cache.get(user_id, jti)
+        if user is None:
+            user = self.get_user(validated_token)
+            user_cache.set(user_id, jti, user)
+        return user
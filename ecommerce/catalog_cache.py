@@ -0,0 +1,89 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import urlencode
+
+
+# Catalog responses are cached under keys that embed a catalog version.
+# Any Product/Category write bumps the version (see signals.py), so stale
+# entries are never read again and simply age out; no key scanning needed.
+
+VERSION_KEY = "catalog:version"
+CHANGED_KEY = "catalog:changed"  # set for a few seconds after every bump
+LOCK_WAIT = 0.05
+
+
+def catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # start from the clock so a lost version key can't resurrect old entries
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    # read replicas may not have the write yet, see routers.py
+    cache.set(CHANGED_KEY, 1, timeout=settings.REPLICA_ROUTING["STICKY_SECONDS"])
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        catalog_version()
+        return cache.incr(VERSION_KEY)
+
+
+def catalog_recently_changed():
+    return cache.get(CHANGED_KEY) is not None
+
+
+def normalized_query(query_params):
+    pairs = [
+        (key, value)
+        for key, values in query_params.lists()
+        for value in values
+        if value != ""
+    ]
+    return urlencode(sorted(pairs))
+
+
+def catalog_key(request, action, pk=None):
+    raw = f"{request.get_host()}|{action}|{pk}|{normalized_query(request.query_params)}"
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f"catalog:v{catalog_version()}:{digest}"
+
+
+def get_or_compute(key, compute, timeout=None):
+    """
+    Return the cached value for `key`, computing it at most once at a time.
+
+    Concurrent misses wait for the request holding the lock to fill the
+    entry instead of all hitting the database (cache stampede).
+    """
+    if timeout is None:
+        timeout = settings.CATALOG_CACHE_TIMEOUT
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f"{key}:lock"
+    lock_timeout = settings.CATALOG_CACHE_LOCK_TIMEOUT
+    if cache.add(lock_key, 1, timeout=lock_timeout):
+        try:
+            value = compute()
+            cache.set(key, value, timeout=timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_WAIT)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if cache.get(lock_key) is None:
+            # the lock holder failed (e.g. a 404) without filling the entry
+            break
+    return compute()
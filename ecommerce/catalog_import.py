@@ -0,0 +1,232 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .catalog_cache import bump_catalog_version
+from .inventory import shard_stock
+from .models import Cart, CartItem, Category, Product
+
+
+# Bulk catalog import used by the import_products command. Rows are streamed
+# from CSV or JSON Lines, validated one by one, and written in batches: one
+# upsert on Product.sku, one DELETE and one INSERT for the category links,
+# and one UPDATE for the totals of the active carts holding products whose
+# price changed. Rows that don't validate go to a reject file with the
+# reason, the rest still loads.
+#
+# Row fields: sku, name, description, price, in_stock, categories. In CSV,
+# categories is a "|" separated list of names; in JSONL, a list or string.
+# in_stock counts the units on hand, including those sitting in active carts:
+# those are already taken from Product.in_stock and go back to it when the
+# cart lets go of them, so they are subtracted before the row is written.
+
+CATEGORY_SEPARATOR = "|"
+UPDATE_FIELDS = ["name", "description", "price", "in_stock", "updated_at"]
+PRICE_LIMIT = Decimal("99999999.99")  # Product.price: 10 digits, 2 decimals
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(f, fmt):
+    """Yield (line number, row dict) from an open text file, one at a time."""
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, {"_raw": line.rstrip("\n"), "_error": f"invalid JSON: {e}"}
+            continue
+        if not isinstance(row, dict):
+            row = {"_raw": line.rstrip("\n"), "_error": "not an object"}
+        yield number, row
+
+
+class RejectWriter:
+    """Rejected rows in the input's format, each with an `error` field."""
+
+    def __init__(self, f, fmt):
+        self.f = f
+        self.fmt = fmt
+        self.csv = None
+        self.count = 0
+
+    def write(self, number, row, error):
+        self.count += 1
+        if self.fmt == "jsonl":
+            self.f.write(json.dumps({"line": number, "error": error, "row": row}, default=str) + "\n")
+            return
+        if self.csv is None:
+            fields = [key for key in row if key is not None] + ["line", "error"]
+            self.csv = csv.DictWriter(self.f, fieldnames=fields, extrasaction="ignore")
+            self.csv.writeheader()
+        self.csv.writerow({**row, "line": number, "error": error})
+
+
+class ProductImporter:
+    def __init__(self, batch_size=1000, create_categories=True, rejects=None, progress=None):
+        self.batch_size = batch_size
+        self.create_categories = create_categories
+        self.rejects = rejects
+        self.progress = progress  # called with the stats after every batch
+        # name -> id for every category, loaded once
+        self.categories = dict(Category.objects.values_list("name", "id"))
+        # sku -> shard count of the (few) products with sharded stock
+        self.sharded = dict(
+            Product.objects.filter(stock_shards__gt=0).values_list("sku", "stock_shards")
+        )
+        self.stats = {"rows": 0, "imported": 0, "rejected": 0, "batches": 0}
+
+    def run(self, rows):
+        batch = {}
+        for number, row in rows:
+            self.stats["rows"] += 1
+            try:
+                product, names = self.parse(row)
+            except RowError as e:
+                self.reject(number, row, str(e))
+                continue
+            # a sku repeated within a batch: the last row wins
+            batch[product.sku] = (number, row, product, names)
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = {}
+        if batch:
+            self.flush(batch)
+        if self.stats["imported"]:
+            bump_catalog_version()  # bulk writes send no signals
+        return self.stats
+
+    def reject(self, number, row, error):
+        self.stats["rejected"] += 1
+        if self.rejects is not None:
+            self.rejects.write(number, row, error)
+
+    # --- validation --- #
+    def parse(self, row):
+        if "_error" in row:
+            raise RowError(row["_error"])
+        sku = str(row.get("sku") or "").strip()
+        if not sku or len(sku) > 64:
+            raise RowError("sku is required (at most 64 characters)")
+        name = str(row.get("name") or "").strip()
+        if not name or len(name) > 100:
+            raise RowError("name is required (at most 100 characters)")
+        try:
+            price = Decimal(str(row.get("price", "")).strip()).quantize(Decimal("0.01"))
+        except (InvalidOperation, ValueError):
+            raise RowError(f"invalid price {row.get('price')!r}")
+        if not price.is_finite() or not Decimal("0") <= price <= PRICE_LIMIT:
+            raise RowError(f"price out of range {price}")
+        try:
+            in_stock = int(str(row.get("in_stock", "0") or "0").strip())
+        except ValueError:
+            raise RowError(f"invalid in_stock {row.get('in_stock')!r}")
+        if in_stock < 0:
+            raise RowError("in_stock can't be negative")
+
+        names = row.get("categories") or []
+        if isinstance(names, str):
+            names = names.split(CATEGORY_SEPARATOR)
+        names = sorted({str(n).strip() for n in names if str(n).strip()})
+        unknown = [n for n in names if n not in self.categories]
+        if unknown and not self.create_categories:
+            raise RowError(f"unknown categories {unknown}")
+        if any(len(n) > 100 for n in unknown):
+            raise RowError("category names are at most 100 characters")
+
+        product = Product(
+            sku=sku,
+            name=name,
+            description=str(row.get("description") or ""),
+            price=price,
+            in_stock=in_stock,
+        )
+        return product, names
+
+    # --- writing --- #
+    def resolve_categories(self, names):
+        missing = sorted(names - self.categories.keys())
+        if missing:
+            Category.objects.bulk_create([Category(name=n) for n in missing], ignore_conflicts=True)
+            self.categories.update(
+                Category.objects.filter(name__in=missing).values_list("name", "id")
+            )
+
+    def lock_existing(self, skus):
+        """sku -> (price, units held by active carts), the product rows locked."""
+        held = (
+            CartItem.objects.filter(product=OuterRef("pk"), cart__status="Active")
+            .values("product")
+            .annotate(units=Sum("quantity"))
+            .values("units")
+        )
+        rows = (
+            Product.objects.select_for_update()
+            .filter(sku__in=skus)
+            .values_list("sku", "price", Coalesce(Subquery(held), 0))
+        )
+        return {sku: (price, units) for sku, price, units in rows}
+
+    def flush(self, batch):
+        entries = list(batch.values())
+        products = [product for _, _, product, _ in entries]
+        with transaction.atomic():
+            # locked so add_item can't take stock between the read and the upsert
+            existing = self.lock_existing(batch)
+            repriced = set()
+            for product in products:
+                if product.sku in existing:
+                    price, held = existing[product.sku]
+                    product.in_stock = max(product.in_stock - held, 0)
+                    if product.price != price:
+                        repriced.add(product.sku)
+            self.resolve_categories({n for *_, names in entries for n in names})
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=["sku"],
+                update_fields=UPDATE_FIELDS,
+            )
+            if any(product.pk is None for product in products):
+                # backends that don't return ids from an upsert
+                ids = dict(Product.objects.filter(sku__in=batch).values_list("sku", "pk"))
+                for product in products:
+                    product.pk = ids[product.sku]
+
+            ids = [product.pk for product in products]
+            Through = Product.category.through
+            Through.objects.filter(product_id__in=ids).delete()
+            Through.objects.bulk_create(
+                [
+                    Through(product_id=product.pk, category_id=self.categories[n])
+                    for _, _, product, names in entries
+                    for n in names
+                ]
+            )
+            for product in products:
+                if product.sku in self.sharded:
+                    # the imported stock goes to the shards
+                    shard_stock(product.pk, self.sharded[product.sku], total=product.in_stock)
+            if repriced:
+                # active carts are priced live; rebuilding bumps their revision,
+                # which a pending payment is checked against, so only when needed
+                Cart.objects.filter(
+                    status="Active",
+                    items__product_id__in=[p.pk for p in products if p.sku in repriced],
+                ).rebuild_totals()
+        self.stats["imported"] += len(products)
+        self.stats["batches"] += 1
+        if self.progress is not None:
+            self.progress(self.stats)
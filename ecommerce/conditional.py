@@ -0,0 +1,37 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+# Helpers for answering If-None-Match / If-Modified-Since with a 304 before
+# any serializer or heavy query runs. Validators are computed by the views
+# from cheap state (catalog version, cart revision, stock level).
+
+
+def make_etag(*parts):
+    raw = "|".join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def _timestamp(last_modified):
+    return int(last_modified.timestamp()) if last_modified is not None else None
+
+
+def set_validators(response, etag=None, last_modified=None):
+    if etag is not None:
+        response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(_timestamp(last_modified))
+    return response
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """Return a 304 (or 412) response when the request's validators match, else None."""
+    django_request = getattr(request, "_request", request)
+    response = get_conditional_response(
+        django_request, etag=etag, last_modified=_timestamp(last_modified)
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+import zlib
+
+from django.db.models import Prefetch
+
+from .catalog_import import CATEGORY_SEPARATOR
+from .models import Category, Product, product_stock
+
+
+# Whole-catalog export for partners, streamed by /products/export/. Products
+# are read with iterator(chunk_size=...), a server-side cursor on Postgres,
+# and categories are prefetched once per chunk, so memory and query count
+# per chunk stay flat however large the catalog is. Columns match what
+# import_products reads, plus id and timestamps.
+#
+# Incremental exports (`since`) pick rows by updated_at, which the stock
+# UPDATEs in inventory.py don't touch (a sharded product's row isn't even
+# written), so their rows carry no in_stock: a stale figure would look
+# current. Stock comes from a full export.
+
+FIELDS = ["id", "sku", "name", "description", "price", "in_stock", "categories", "created_at", "updated_at"]
+INCREMENTAL_FIELDS = [field for field in FIELDS if field != "in_stock"]
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_queryset(since=None):
+    queryset = Product.objects.order_by("pk").prefetch_related(
+        Prefetch("category", queryset=Category.objects.only("name"))
+    )
+    if since is not None:
+        return queryset.filter(updated_at__gte=since)
+    return queryset.annotate(stock=product_stock())  # sharded products included
+
+
+def product_row(product, fields=FIELDS):
+    row = {
+        "id": product.pk,
+        "sku": product.sku,
+        "name": product.name,
+        "description": product.description,
+        "price": str(product.price),
+        "categories": sorted(category.name for category in product.category.all()),
+        "created_at": product.created_at.isoformat(),
+        "updated_at": product.updated_at.isoformat(),
+    }
+    if "in_stock" in fields:
+        row["in_stock"] = product.stock
+    return row
+
+
+def ndjson_chunks(rows):
+    for chunk in rows:
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in chunk)
+
+
+def csv_chunks(rows, fields=FIELDS):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for chunk in rows:
+        for row in chunk:
+            writer.writerow({**row, "categories": CATEGORY_SEPARATOR.join(row["categories"])})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # header only when nothing matched
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_catalog(output="ndjson", since=None, chunk_size=2000, gzip=False):
+    """
+    Bytes/str chunks of the catalog in `output` format ("ndjson" or "csv").
+    Rows changed since `since` leave out in_stock, see above.
+    """
+    fields = FIELDS if since is None else INCREMENTAL_FIELDS
+
+    def rows():
+        chunk = []
+        for product in export_queryset(since).iterator(chunk_size=chunk_size):
+            chunk.append(product_row(product, fields))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    chunks = csv_chunks(rows(), fields) if output == "csv" else ndjson_chunks(rows())
+    return gzip_chunks(chunks) if gzip else chunks
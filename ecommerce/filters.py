@@ -1,7 +1,9 @@
 from django_filters.rest_framework import FilterSet
 from django_filters import NumberFilter
+from rest_framework.filters import SearchFilter
 
 from .models import Product
+from .search import search_products
 
 
 class ProductFilter(FilterSet):
@@ -11,3 +13,20 @@ class ProductFilter(FilterSet):
     class Meta:
         model = Product
         fields = ["name", "category", "min_price", "max_price"]
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    `?search=` backed by the database full-text index (see search.py), ranked
+    by relevance unless `?ordering=` says otherwise. Falls back to the
+    icontains search over `search_fields` where no index is available.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = " ".join(self.get_search_terms(request))
+        if not terms:
+            return queryset
+        results = search_products(queryset, terms)
+        if results is None:
+            return super().filter_queryset(request, queryset, view)
+        return results
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+# PBKDF2 takes tens of milliseconds of pure CPU per call. The async auth views
+# (views/auth_async.py) run it on this small dedicated pool instead of the
+# event loop or Django's shared sync thread, so catalog requests keep being
+# served during a login spike. At most MAX_PENDING hashes may be running or
+# queued; past that callers get HashingSaturated and answer 503 right away
+# rather than letting the queue (and every client's latency) grow.
+
+
+class HashingSaturated(Exception):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__("Password hashing is saturated.")
+
+
+class HashingPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+
+    @property
+    def options(self):
+        return settings.AUTH_HASHING
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.options["MAX_WORKERS"], thread_name_prefix="auth-hashing"
+                )
+                self._slots = threading.BoundedSemaphore(self.options["MAX_PENDING"])
+            return self._executor, self._slots
+
+    async def run(self, func, *args):
+        executor, slots = self._ensure_started()
+        if not slots.acquire(blocking=False):
+            raise HashingSaturated(self.options["RETRY_AFTER"])
+        try:
+            future = executor.submit(func, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # free the slot when the hash is really done, even if the request
+        # was cancelled while waiting for it
+        future.add_done_callback(lambda _: slots.release())
+        return await asyncio.wrap_future(future)
+
+    def reset(self):
+        with self._lock:
+            executor, self._executor, self._slots = self._executor, None, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+hashing_pool = HashingPool()
@@ -0,0 +1,163 @@
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+# Idempotency-Key support for the cart/checkout POSTs that clients retry.
+# The first request with a key claims a row (unique per user and key, so it
+# holds across workers) and stores its rendered response there, in the same
+# transaction as the view's writes; a retry with the same key gets that
+# response back without running the view again, so no stock is taken twice
+# and no second PaymentIntent is created. A duplicate arriving while the
+# first is still running waits for it (up to WAIT seconds, then 409).
+#
+# 5xx responses and exceptions are not stored, so the retry runs the request
+# again; an exception also rolls back what the view wrote. A key reused for a
+# different request (method, path or body) is refused with 422.
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05  # seconds between checks of a key in progress
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+_next_prune = 0
+
+
+class KeyInProgress(Exception):
+    pass
+
+
+class KeyMismatch(Exception):
+    pass
+
+
+def options():
+    return settings.IDEMPOTENCY
+
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, "lists"):  # form data
+        data = dict(data.lists())
+    raw = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def claim(user, key, fingerprint):
+    """
+    Return (record, True) when this request is the one to run for `key`, or
+    (record, False) with the response stored by the request that ran first.
+    """
+    deadline = time.monotonic() + options()["WAIT"]
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=fingerprint, created_at=now
+                )
+            return record, True
+        except IntegrityError:
+            pass
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None:
+            continue  # deleted in between (failed or pruned), claim it again
+        if record.created_at < now - options()["TTL"]:
+            # expired: drop it, the key starts over
+            IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+            continue
+        if record.fingerprint != fingerprint:
+            raise KeyMismatch()
+        if record.status_code is not None:
+            return record, False
+        if record.created_at < now - timedelta(seconds=options()["LOCK_TIMEOUT"]):
+            # the request holding it died without an answer, take over
+            taken = IdempotencyKey.objects.filter(
+                pk=record.pk, created_at=record.created_at, status_code=None
+            ).update(created_at=now)
+            if taken:
+                return record, True
+            continue
+        if time.monotonic() >= deadline:
+            raise KeyInProgress()
+        time.sleep(POLL_INTERVAL)
+
+
+def replay(record):
+    response = HttpResponse(record.content, status=record.status_code, content_type=record.content_type)
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def prune():
+    """Delete expired keys, at most once per PRUNE_INTERVAL in each process."""
+    global _next_prune
+    if time.monotonic() < _next_prune:
+        return
+    _next_prune = time.monotonic() + options()["PRUNE_INTERVAL"]
+    IdempotencyKey.objects.filter(created_at__lt=timezone.now() - options()["TTL"]).delete()
+
+
+def idempotent(handler):
+    """Make a DRF view (action) method replay its response for a repeated Idempotency-Key."""
+
+    @functools.wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return handler(self, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        prune()
+        try:
+            record, created = claim(request.user, key, request_fingerprint(request))
+        except KeyMismatch:
+            return Response(
+                {"error": f"{HEADER} was already used for a different request."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        except KeyInProgress:
+            return Response(
+                {"error": f"A request with this {HEADER} is still in progress."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if not created:
+            return replay(record)
+
+        try:
+            # the view's writes and its stored response commit together: a
+            # crash in between would let the retry run the request again
+            with transaction.atomic():
+                response = handler(self, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    IdempotencyKey.objects.filter(pk=record.pk).delete()
+                    return response
+                # render now to store the bytes; dispatch() finalizes it again, a no-op
+                response = self.finalize_response(request, response, *args, **kwargs)
+                response.render()
+                IdempotencyKey.objects.filter(pk=record.pk).update(
+                    status_code=response.status_code,
+                    content_type=response.get("Content-Type", ""),
+                    content=response.content,
+                )
+        except BaseException:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            raise
+        return response
+
+    return wrapper
@@ -0,0 +1,271 @@
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+
+from .models import (
+    PAYMENT_FAILED,
+    Cart,
+    CartItem,
+    PaymentEvent,
+    Product,
+    StockReservation,
+    StockShard,
+    product_stock,
+)
+
+
+# All stock mutations go through here. Each one is a single conditional
+# UPDATE evaluated by the database, so concurrent requests can neither lose
+# updates nor take the stock below zero.
+#
+# Hot products can be sharded (shard_stock()): their stock is split over
+# StockShard rows and the functions below take from and give back to those
+# instead, see "Sharded stock". The UPDATEs on Product skip sharded rows, so
+# unsharded products pay nothing for it.
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, available):
+        self.product_id = product_id
+        self.available = available
+        super().__init__(f"Insufficient stock. Only {available} left.")
+
+
+def take_stock(product_id, quantity):
+    """Decrement stock by `quantity`, or raise InsufficientStock."""
+    if quantity <= 0:
+        return
+    updated = Product.objects.filter(
+        pk=product_id, stock_shards=0, in_stock__gte=quantity
+    ).update(in_stock=F("in_stock") - quantity)
+    if not updated:
+        product = Product.objects.filter(pk=product_id).values("in_stock", "stock_shards").first()
+        if product is not None and product["stock_shards"]:
+            take_shard_stock(product_id, quantity)
+            return
+        raise InsufficientStock(product_id, max(product["in_stock"] if product else 0, 0))
+
+
+def restock(product_id, quantity):
+    if quantity <= 0:
+        return
+    if not Product.objects.filter(pk=product_id, stock_shards=0).update(
+        in_stock=F("in_stock") + quantity
+    ):
+        restock_shards({product_id: quantity})
+
+
+def restock_many(lines):
+    """Give back stock for (product_id, quantity) pairs in one UPDATE."""
+    totals = defaultdict(int)
+    for product_id, quantity in lines:
+        totals[product_id] += quantity
+    totals = {pk: qty for pk, qty in totals.items() if qty > 0}
+    if not totals:
+        return 0
+
+    delta = Case(
+        *[When(pk=pk, then=Value(qty)) for pk, qty in totals.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    updated = Product.objects.filter(pk__in=totals, stock_shards=0).update(
+        in_stock=F("in_stock") + delta
+    )
+    if updated < len(totals):
+        updated += restock_shards(totals)
+    return updated
+
+
+def adjust_stock(product_id, diff):
+    """Apply a signed change in reserved quantity (positive takes stock)."""
+    if diff > 0:
+        take_stock(product_id, diff)
+    elif diff < 0:
+        restock(product_id, -diff)
+
+
+# --- Sharded stock --- #
+def split_evenly(total, parts):
+    base, extra = divmod(total, parts)
+    return [base + (i < extra) for i in range(parts)]
+
+
+def shard_stock(product_id, shards, total=None):
+    """
+    Spread a product's stock over `shards` StockShard rows, or put it back on
+    the Product row with shards=0. `total` sets the stock, which is kept by
+    default. Returns the stock.
+    """
+    if shards < 0:
+        raise ValueError("shards can't be negative")
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product_id)
+        current = list(
+            StockShard.objects.select_for_update().filter(product=product).order_by("shard")
+        )
+        if total is None:
+            total = product.in_stock + sum(shard.in_stock for shard in current)
+        StockShard.objects.filter(product=product).delete()
+        if shards:
+            StockShard.objects.bulk_create(
+                [
+                    StockShard(product=product, shard=i, in_stock=in_stock)
+                    for i, in_stock in enumerate(split_evenly(total, shards))
+                ]
+            )
+        Product.objects.filter(pk=product_id).update(
+            stock_shards=shards, in_stock=0 if shards else total
+        )
+    return total
+
+
+def take_shard_stock(product_id, quantity):
+    # one UPDATE on a random shard among those holding enough
+    pick = (
+        StockShard.objects.filter(product_id=product_id, in_stock__gte=quantity)
+        .order_by("?")
+        .values("pk")[:1]
+    )
+    updated = StockShard.objects.filter(pk=Subquery(pick), in_stock__gte=quantity).update(
+        in_stock=F("in_stock") - quantity
+    )
+    if not updated:
+        # no shard holds enough on its own (or a concurrent buyer drained
+        # the one picked): pool the shards
+        rebalance(product_id, take=quantity)
+
+
+def restock_shards(totals):
+    """Give back {product id: quantity} to a random shard of each sharded product."""
+    shards = dict(
+        Product.objects.filter(pk__in=totals, stock_shards__gt=0).values_list("pk", "stock_shards")
+    )
+    for product_id, count in shards.items():
+        if not StockShard.objects.filter(product_id=product_id, shard=random.randrange(count)).update(
+            in_stock=F("in_stock") + totals[product_id]
+        ):
+            restock(product_id, totals[product_id])  # unsharded in between
+    return len(shards)
+
+
+def rebalance(product_id, take=0):
+    """
+    Take `take` units from a sharded product's stock, or raise
+    InsufficientStock, and spread the rest evenly over its shards again.
+
+    Locks every shard of the product, so it's the slow path: run when the
+    shards have run too low to serve a request on their own.
+    """
+    with transaction.atomic():
+        shards = list(
+            StockShard.objects.select_for_update().filter(product_id=product_id).order_by("shard")
+        )
+        if not shards:
+            return take_stock(product_id, take)  # unsharded in between
+        total = sum(shard.in_stock for shard in shards)
+        if total < take:
+            raise InsufficientStock(product_id, max(total, 0))
+        for shard, in_stock in zip(shards, split_evenly(total - take, len(shards))):
+            shard.in_stock = in_stock
+        StockShard.objects.bulk_update(shards, ["in_stock"])
+
+
+def stock_level(product_id):
+    """A product's stock, sharded or not."""
+    return (
+        Product.objects.filter(pk=product_id)
+        .annotate(stock=product_stock())
+        .values_list("stock", flat=True)
+        .first()
+    )
+
+
+# --- Reservations --- #
+def reservation_expiry(now=None):
+    return (now or timezone.now()) + settings.CART_RESERVATION_TTL
+
+
+def reserve(cart_item):
+    """Start (or restart) the hold on a cart item's stock."""
+    StockReservation.objects.update_or_create(
+        cart_item=cart_item, defaults={"expires_at": reservation_expiry()}
+    )
+
+
+def reserve_many(cart_items):
+    """reserve() for several cart items with a single upsert."""
+    expires_at = reservation_expiry()
+    StockReservation.objects.bulk_create(
+        [StockReservation(cart_item=item, expires_at=expires_at) for item in cart_items],
+        update_conflicts=True,
+        unique_fields=["cart_item"],
+        update_fields=["expires_at"],
+    )
+
+
+def extend_reservations(cart):
+    """Restart the hold on every item in `cart`, e.g. while it is being paid."""
+    return StockReservation.objects.filter(cart_item__cart=cart).update(
+        expires_at=reservation_expiry()
+    )
+
+
+def expired_reservations(now):
+    """
+    Reservations on active carts whose hold is over. A cart being paid (a
+    PaymentIntent created at checkout and no failure recorded for it) keeps
+    its stock CART_PAYMENT_HOLD longer: the success webhook may still come.
+    """
+    awaiting_payment = ~Q(cart_item__cart__payment_intent_id="") & ~Exists(
+        PaymentEvent.objects.filter(
+            payment_intent_id=OuterRef("cart_item__cart__payment_intent_id"), type=PAYMENT_FAILED
+        )
+    )
+    return StockReservation.objects.filter(cart_item__cart__status="Active").filter(
+        Q(expires_at__lte=now - settings.CART_PAYMENT_HOLD) | (Q(expires_at__lte=now) & ~awaiting_payment)
+    )
+
+
+def expire_reservations(batch_size=1000, now=None):
+    """
+    Give back the stock held by expired reservations on active carts, see
+    expired_reservations().
+
+    Works in batches of `batch_size` cart items; each batch is one transaction
+    made of a handful of set-based statements. Returns run metrics.
+    """
+    now = now or timezone.now()
+    stats = {"batches": 0, "items": 0, "units": 0, "carts": 0}
+
+    while True:
+        with transaction.atomic():
+            expired = expired_reservations(now)
+            cart_ids = list(
+                Cart.objects.select_for_update(skip_locked=True)
+                .filter(pk__in=expired.values("cart_item__cart"))
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            lines = list(
+                CartItem.objects.filter(
+                    cart__in=cart_ids, reservation__in=expired
+                ).values_list("pk", "cart_id", "product_id", "quantity")[:batch_size]
+            )
+            if not lines:
+                break
+
+            touched_carts = {cart_id for _, cart_id, _, _ in lines}
+            restock_many((product_id, qty) for _, _, product_id, qty in lines)
+            CartItem.objects.filter(pk__in=[pk for pk, _, _, _ in lines]).delete()
+            Cart.objects.filter(pk__in=touched_carts).rebuild_totals()
+
+        stats["batches"] += 1
+        stats["items"] += len(lines)
+        stats["units"] += sum(qty for _, _, _, qty in lines)
+        stats["carts"] += len(touched_carts)
+
+    return stats
@@ -0,0 +1,197 @@
+import json
+import platform
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ...catalog_cache import bump_catalog_version
+from ...models import Category, Product
+from .generate_dataset import ADJECTIVES, NOUNS, USER_PREFIX
+
+# name -> (method, catalog read?)
+SCENARIOS = {
+    "products_list": ("GET", True),
+    "products_filter": ("GET", True),
+    "products_search": ("GET", True),
+    "products_ordering": ("GET", True),
+    "product_detail": ("GET", True),
+    "add_item": ("POST", False),
+    "my_cart": ("GET", False),
+    "checkout": ("POST", False),
+}
+# only these can regress a comparison, the rest is context
+COMPARED_METRICS = ["p95_ms", "queries"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the real URL routes against a generate_dataset dataset through the "
+        "test client and report latency percentiles, serial throughput and "
+        "queries per request. Writes are rolled back; checkout uses the fake "
+        "payment gateway. --save writes a JSON baseline, --compare checks one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Timed requests per scenario (default: 200).")
+        parser.add_argument("--warmup", type=int, default=20, help="Untimed requests per scenario (default: 20).")
+        parser.add_argument(
+            "--scenario", action="append", choices=list(SCENARIOS), help="Run only these (repeatable)."
+        )
+        parser.add_argument("--cold-cache", action="store_true", help="Empty the catalog cache before every catalog read.")
+        parser.add_argument("--seed", type=int, default=1, help="Random seed for request parameters (default: 1).")
+        parser.add_argument("--save", metavar="PATH", help="Write the results as a JSON baseline.")
+        parser.add_argument("--compare", metavar="PATH", help="Compare against a saved baseline.")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Allowed relative increase before --compare fails (default: 0.2).",
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1:
+            raise CommandError("--requests must be at least 1.")
+        self.rng = random.Random(options["seed"])
+        self.cold_cache = options["cold_cache"]
+        self.load_fixtures()
+
+        gateway = {**settings.PAYMENT_GATEWAY, "BACKEND": "ecommerce.payments.FakeGateway"}
+        results = {}
+        with override_settings(ALLOWED_HOSTS=["testserver"], PAYMENT_GATEWAY=gateway), transaction.atomic():
+            self.client = Client()
+            for name in options["scenario"] or SCENARIOS:
+                self.run_scenario(name, options["warmup"], record=False)
+                results[name] = self.run_scenario(name, options["requests"])
+            transaction.set_rollback(True)
+
+        self.report(results)
+        report = {"meta": self.meta(options), "scenarios": results}
+        if options["save"]:
+            with open(options["save"], "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(f"baseline written to {options['save']}")
+        if options["compare"]:
+            self.compare(results, options["compare"], options["tolerance"])
+
+    def load_fixtures(self):
+        users = list(
+            User.objects.filter(
+                username__startswith=USER_PREFIX, carts__status="Active", carts__item_count__gt=0
+            ).order_by("pk")[:50]
+        )
+        if not users:
+            raise CommandError("No synthetic dataset found, run generate_dataset first.")
+        self.auth = [{"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user)}"} for user in users]
+        self.product_ids = list(
+            Product.objects.filter(in_stock__gte=50).order_by("pk").values_list("pk", flat=True)[:2000]
+        )
+        self.category_ids = list(Category.objects.values_list("pk", flat=True))
+        self.product_count = Product.objects.count()
+        self.pages = max(1, min(50, self.product_count // settings.REST_FRAMEWORK["PAGE_SIZE"]))
+
+    # --- requests --- #
+    def build(self, name):
+        rng = self.rng
+        if name == "products_list":
+            return "/products/", {"page": rng.randint(1, self.pages)}, {}
+        if name == "products_filter":
+            low = rng.randint(1, 400)
+            return "/products/", {
+                "category": rng.choice(self.category_ids),
+                "min_price": low,
+                "max_price": low + 50,
+            }, {}
+        if name == "products_search":
+            return "/products/", {"search": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"}, {}
+        if name == "products_ordering":
+            return "/products/", {
+                "ordering": rng.choice(["price", "-price", "-created_at"]),
+                "page": rng.randint(1, self.pages),
+            }, {}
+        if name == "product_detail":
+            return f"/products/{rng.choice(self.product_ids)}/", {}, {}
+        if name == "add_item":
+            return "/cart/add_item/", {"product_id": rng.choice(self.product_ids), "quantity": 1}, rng.choice(self.auth)
+        if name == "my_cart":
+            return "/cart/my_cart/", {}, rng.choice(self.auth)
+        return "/cart/checkout/", {}, rng.choice(self.auth)
+
+    def run_scenario(self, name, count, record=True):
+        method, catalog = SCENARIOS[name]
+        timings, queries, errors = [], 0, 0
+        for _ in range(count):
+            path, data, headers = self.build(name)
+            if catalog and self.cold_cache:
+                bump_catalog_version()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                if method == "GET":
+                    response = self.client.get(path, data, **headers)
+                else:
+                    response = self.client.post(path, data, content_type="application/json", **headers)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries += len(captured)
+            errors += response.status_code >= 400
+        if not record:
+            return None
+
+        percentiles = statistics.quantiles(timings, n=100, method="inclusive") if count > 1 else timings * 99
+        return {
+            "requests": count,
+            "errors": errors,
+            "p50_ms": round(percentiles[49], 3),
+            "p95_ms": round(percentiles[94], 3),
+            "p99_ms": round(percentiles[98], 3),
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "throughput_rps": round(count / (sum(timings) / 1000), 1),
+            "queries": round(queries / count, 2),
+        }
+
+    # --- output --- #
+    def meta(self, options):
+        return {
+            "created": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "products": self.product_count,
+            "python": platform.python_version(),
+            "requests": options["requests"],
+            "cold_cache": self.cold_cache,
+            "seed": options["seed"],
+        }
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'scenario':<18} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'queries':>8} {'errors':>7}"
+        )
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:<18} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+                f"{r['throughput_rps']:>8.1f} {r['queries']:>8.2f} {r['errors']:>7}"
+            )
+
+    def compare(self, results, path, tolerance):
+        with open(path) as f:
+            baseline = json.load(f)["scenarios"]
+        regressions = []
+        for name, current in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            for metric in COMPARED_METRICS:
+                before, after = previous[metric], current[metric]
+                change = (after - before) / before if before else (1.0 if after else 0.0)
+                self.stdout.write(f"{name:<18} {metric:<8} {before:>9.2f} -> {after:>9.2f} ({change:+.0%})")
+                if change > tolerance:
+                    regressions.append(f"{name} {metric} {change:+.0%}")
+        if regressions:
+            raise CommandError("Regressions past tolerance: " + ", ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions past tolerance."))
@@ -0,0 +1,111 @@
+import asyncio
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+from django.test.utils import override_settings
+from django.urls import include, path
+
+from ...hashing import hashing_pool
+from ...views import AsyncLoginView, LoginView
+
+# the command serves as its own urlconf so both login views can be compared
+urlpatterns = [
+    path("bench/sync-login/", LoginView.as_view()),
+    path("bench/async-login/", AsyncLoginView.as_view()),
+    path("", include("ecommerce.urls")),
+]
+
+USERNAME = "benchmark-login-storm"
+PASSWORD = "benchmark-password"
+
+
+class Command(BaseCommand):
+    help = (
+        "Time catalog reads through the ASGI handler while a storm of logins "
+        "hits the sync LoginView, then the async AsyncLoginView."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=20, help="Catalog reads per case (default: 20).")
+        parser.add_argument("--concurrency", type=int, default=8, help="Logins in flight (default: 8).")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be at least 1.")
+        self.requests = options["requests"]
+        self.concurrency = options["concurrency"]
+
+        # the storm is one client logging in far past the "login" rate
+        rest_framework = {
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {**settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"], "login": None},
+        }
+
+        User.objects.filter(username=USERNAME).delete()  # left over from an interrupted run
+        user = User.objects.create_user(username=USERNAME, password=PASSWORD)
+        try:
+            with override_settings(
+                ROOT_URLCONF=__name__, ALLOWED_HOSTS=["testserver"], REST_FRAMEWORK=rest_framework
+            ):
+                hashing_pool.reset()
+                cases = [
+                    ("no logins", None),
+                    ("sync login", "/bench/sync-login/"),
+                    ("async login", "/bench/async-login/"),
+                ]
+                self.stdout.write(
+                    f"{'case':<12} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'logins':>7} {'503s':>6}"
+                )
+                for label, login_url in cases:
+                    timings, logins, rejected = asyncio.run(self.run_case(login_url))
+                    p95 = statistics.quantiles(timings, n=20, method="inclusive")[-1] if len(timings) > 1 else timings[0]
+                    self.stdout.write(
+                        f"{label:<12} {statistics.median(timings):>8.2f} {p95:>8.2f} "
+                        f"{max(timings):>8.2f} {logins:>7} {rejected:>6}"
+                    )
+        finally:
+            hashing_pool.reset()
+            user.delete()
+
+    async def run_case(self, login_url):
+        client = AsyncClient()
+        await client.get("/products/")  # warm the catalog cache
+        stop = asyncio.Event()
+        counts = {"logins": 0, "rejected": 0}
+
+        async def storm():
+            while not stop.is_set():
+                response = await client.post(
+                    login_url,
+                    {"username": USERNAME, "password": PASSWORD},
+                    content_type="application/json",
+                )
+                if response.status_code == 503:
+                    counts["rejected"] += 1
+                    await asyncio.sleep(0.01)
+                elif response.status_code == 200:
+                    counts["logins"] += 1
+                else:
+                    raise CommandError(f"{login_url} returned {response.status_code}")
+
+        workers = []
+        if login_url:
+            workers = [asyncio.create_task(storm()) for _ in range(self.concurrency)]
+            await asyncio.sleep(0.2)  # let the storm build up
+
+        timings = []
+        try:
+            for _ in range(self.requests):
+                started = time.perf_counter()
+                response = await client.get("/products/")
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f"/products/ returned {response.status_code}")
+        finally:
+            stop.set()
+            await asyncio.gather(*workers)
+        return timings, counts["logins"], counts["rejected"]
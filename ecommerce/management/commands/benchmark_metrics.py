@@ -0,0 +1,118 @@
+import statistics
+import time
+from contextlib import contextmanager, nullcontext
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework.serializers import BaseSerializer
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ...metrics import db_execute_wrapper, registry
+from ...models import Cart, CartItem, Category, Product
+
+METRICS_MIDDLEWARE = "ecommerce.metrics.MetricsMiddleware"
+ROUTES = ["product-list", "product-detail", "cart-my-cart"]
+BENCH_USER = "bench-metrics"
+
+
+@contextmanager
+def metrics_disabled():
+    # no middleware client, no database wrapper, the original serializer `.data`
+    data = BaseSerializer.data
+    BaseSerializer.data = property(data.fget.original)
+    connection.execute_wrappers.remove(db_execute_wrapper)
+    try:
+        yield
+    finally:
+        connection.execute_wrappers.insert(0, db_execute_wrapper)
+        BaseSerializer.data = data
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what the metrics middleware costs: the same requests with the "
+        "instrumentation on and off, in alternating rounds. Seeded rows are "
+        "rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500, help="Timed requests per route and mode (default: 500).")
+        parser.add_argument("--rounds", type=int, default=10, help="Alternating on/off rounds (default: 10).")
+        parser.add_argument(
+            "--max-overhead",
+            type=float,
+            help="Fail when the median overhead of a route exceeds this percentage.",
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < options["rounds"] or options["rounds"] < 1:
+            raise CommandError("--requests must be at least --rounds, and --rounds at least 1.")
+        per_round = options["requests"] // options["rounds"]
+
+        with override_settings(ALLOWED_HOSTS=["testserver"]), transaction.atomic():
+            connection.ensure_connection()
+            paths = self.seed()
+            clients = {"on": Client(), "off": self.client_without_metrics()}
+            failures = []
+            self.stdout.write(f"{'route':<16} {'off µs':>9} {'on µs':>9} {'overhead µs':>12} {'overhead':>9}")
+            for route in ROUTES:
+                path, headers = paths[route]
+                timings = {"on": [], "off": []}
+                for mode, client in clients.items():
+                    self.run(client, mode, path, headers, 20)  # warm up
+                for _ in range(options["rounds"]):
+                    for mode, client in clients.items():
+                        timings[mode].extend(self.run(client, mode, path, headers, per_round))
+                off, on = statistics.median(timings["off"]), statistics.median(timings["on"])
+                overhead = (on - off) / off * 100
+                self.stdout.write(
+                    f"{route:<16} {off * 1e6:>9.0f} {on * 1e6:>9.0f} {(on - off) * 1e6:>12.0f} {overhead:>8.1f}%"
+                )
+                if options["max_overhead"] is not None and overhead > options["max_overhead"]:
+                    failures.append(f"{route} {overhead:.1f}%")
+            transaction.set_rollback(True)
+        registry.reset()  # the benchmark's own requests
+        if failures:
+            raise CommandError("Overhead past --max-overhead: " + ", ".join(failures))
+
+    def client_without_metrics(self):
+        client = Client()
+        middleware = [name for name in settings.MIDDLEWARE if name != METRICS_MIDDLEWARE]
+        # the handler builds its middleware chain once, on the first request
+        with override_settings(MIDDLEWARE=middleware):
+            client.get("/products/")
+        return client
+
+    def seed(self):
+        category = Category.objects.create(name="Bench metrics")
+        products = Product.objects.bulk_create(
+            [Product(name=f"Bench {i}", description="", price=Decimal("9.99"), in_stock=100) for i in range(10)]
+        )
+        category.products.add(*products)
+        User.objects.filter(username=BENCH_USER).delete()
+        user = User.objects.create_user(username=BENCH_USER)
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=p, quantity=1) for p in products[:3]])
+        Cart.objects.filter(pk=cart.pk).rebuild_totals()
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user)}"}
+        return {
+            "product-list": ("/products/", {}),
+            "product-detail": (f"/products/{products[0].pk}/", {}),
+            "cart-my-cart": ("/cart/my_cart/", auth),
+        }
+
+    def run(self, client, mode, path, headers, count):
+        timings = []
+        with metrics_disabled() if mode == "off" else nullcontext():
+            for _ in range(count):
+                started = time.perf_counter()
+                response = client.get(path, **headers)
+                timings.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise CommandError(f"{path} answered {response.status_code}.")
+        return timings
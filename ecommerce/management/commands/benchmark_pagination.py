@@ -0,0 +1,99 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from ...catalog_cache import bump_catalog_version
+from ...models import Product
+from ...pagination import ProductPagination
+from ...views import ProductViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Time /products/ page 1 against a deep page with page-number and keyset "
+        "pagination. Seeded rows are rolled back unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page", type=int, default=10000, help="Deep page number (default: 10000).")
+        parser.add_argument("--ordering", default="price", help="?ordering= value (default: price).")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case (default: 5).")
+        parser.add_argument("--keep", action="store_true", help="Keep the seeded products.")
+
+    def handle(self, *args, **options):
+        page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+        deep_page = options["page"]
+        if deep_page < 2:
+            raise CommandError("--page must be at least 2.")
+        self.ordering = options["ordering"]
+        self.repeat = options["repeat"]
+        self.view = ProductViewSet.as_view({"get": "list"})
+        self.factory = APIRequestFactory()
+
+        # requests are built in-process, let their test host through
+        with override_settings(ALLOWED_HOSTS=["testserver"]), transaction.atomic():
+            self.seed(deep_page * page_size)
+            cursor = self.cursor_for_offset((deep_page - 1) * page_size - 1)
+            cases = [
+                ("page-number", "page 1", {"page": 1}),
+                ("page-number", f"page {deep_page}", {"page": deep_page}),
+                ("keyset", "page 1", {"paginate": "cursor"}),
+                ("keyset", f"page {deep_page}", {"cursor": cursor}),
+            ]
+            self.stdout.write(f"{'scheme':<12} {'page':<12} {'median ms':>10} {'queries':>8}")
+            for scheme, label, params in cases:
+                median, queries = self.measure(params)
+                self.stdout.write(f"{scheme:<12} {label:<12} {median:>10.2f} {queries:>8}")
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+    def seed(self, total):
+        missing = total - Product.objects.count()
+        if missing <= 0:
+            return
+        self.stdout.write(f"seeding {missing} products...")
+        batch = []
+        for i in range(missing):
+            batch.append(
+                Product(
+                    name=f"Bench product {i}",
+                    description="benchmark row",
+                    price=Decimal(i % 5000) / 10,
+                    in_stock=100,
+                )
+            )
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+
+    def cursor_for_offset(self, offset):
+        paginator = ProductPagination()
+        paginator.field, paginator.descending = paginator.get_ordering(
+            Request(self.factory.get("/", {"ordering": self.ordering})), ProductViewSet
+        )
+        prefix = "-" if paginator.descending else ""
+        row = Product.objects.order_by(f"{prefix}{paginator.field}", f"{prefix}id")[offset]
+        return paginator.encode_cursor(row, reverse=False)
+
+    def measure(self, params):
+        timings = []
+        for _ in range(self.repeat):
+            # start every run from a cold catalog cache
+            bump_catalog_version()
+            request = self.factory.get("/products/", {"ordering": self.ordering, **params})
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = self.view(request)
+                response.render()
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f"{params} returned {response.status_code}")
+        return statistics.median(timings), len(queries)
@@ -0,0 +1,105 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from ...models import Cart, CartItem, Category, Product
+from ...renderers import FastJSONRenderer
+from ...serializers import CartSerializer, ProductSerializer
+from ...serializers.fast import CART_VALUES, PRODUCT_LIST_VALUES, cart_rows, product_list_rows
+from ...views import ProductViewSet
+
+BENCH_USER = "bench-serializers"
+
+
+class Command(BaseCommand):
+    help = (
+        "CPU time per request of the product list page and the cart read: "
+        "ModelSerializers + JSONRenderer against the values() fast path + "
+        "FastJSONRenderer, database reads included. Fails if the two outputs "
+        "differ. Seeded rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=100, help="Products per page (default: 100).")
+        parser.add_argument("--cart-items", type=int, default=20, help="Items in the cart (default: 20).")
+        parser.add_argument("--repeat", type=int, default=50, help="Timed runs per case (default: 50).")
+
+    def handle(self, *args, **options):
+        if min(options["page_size"], options["cart_items"], options["repeat"]) < 1:
+            raise CommandError("--page-size, --cart-items and --repeat must be at least 1.")
+        size = options["page_size"]
+        self.repeat = options["repeat"]
+
+        with transaction.atomic():
+            cart = self.seed(size, options["cart_items"])
+            page = Product.objects.order_by("pk")[:size]
+            carts = Cart.objects.filter(pk=cart.pk)
+            cases = [
+                (
+                    f"products x{size}",
+                    lambda: ProductSerializer(ProductViewSet.queryset.order_by("pk")[:size], many=True).data,
+                    lambda: product_list_rows(page.values(*PRODUCT_LIST_VALUES)),
+                ),
+                (
+                    f"cart x{options['cart_items']}",
+                    lambda: CartSerializer(carts.with_items(), many=True).data,
+                    lambda: cart_rows(carts.values(*CART_VALUES)),
+                ),
+            ]
+            self.stdout.write(
+                f"{'case':<16} {'path':<6} {'build ms':>9} {'render ms':>10} {'total ms':>9} {'bytes':>8}"
+            )
+            for label, slow, fast in cases:
+                slow_result = self.measure(label, "slow", slow, JSONRenderer())
+                fast_result = self.measure(label, "fast", fast, FastJSONRenderer())
+                if slow_result[1] != fast_result[1]:
+                    raise CommandError(f"{label}: the fast path output differs from the serializer's.")
+                saved = (slow_result[0] - fast_result[0]) / slow_result[0]
+                self.stdout.write(f"{'':<16} CPU saved per request: {slow_result[0] - fast_result[0]:.2f} ms ({saved:.0%})")
+            transaction.set_rollback(True)
+
+    def seed(self, size, cart_items):
+        missing = size - Product.objects.count()
+        if missing > 0:
+            categories = [Category.objects.get_or_create(name=f"Bench serializers {i}")[0] for i in range(3)]
+            products = Product.objects.bulk_create(
+                [
+                    Product(name=f"Bench {i}", description="", price=Decimal("19.99"), in_stock=100)
+                    for i in range(missing)
+                ]
+            )
+            Through = Product.category.through
+            Through.objects.bulk_create(
+                [
+                    Through(product_id=product.pk, category_id=category.pk)
+                    for product in products
+                    for category in categories[:2]
+                ]
+            )
+        User.objects.filter(username=BENCH_USER).delete()
+        cart = Cart.objects.create(user=User.objects.create_user(username=BENCH_USER))
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product=product, quantity=2) for product in Product.objects.order_by("pk")[:cart_items]]
+        )
+        Cart.objects.filter(pk=cart.pk).rebuild_totals()
+        return cart
+
+    def measure(self, label, path, build, renderer):
+        builds, renders = [], []
+        for _ in range(self.repeat):
+            started = time.process_time()
+            data = build()
+            built = time.process_time()
+            body = renderer.render(data)
+            builds.append(built - started)
+            renders.append(time.process_time() - built)
+        build_ms, render_ms = statistics.median(builds) * 1000, statistics.median(renders) * 1000
+        self.stdout.write(
+            f"{label:<16} {path:<6} {build_ms:>9.2f} {render_ms:>10.2f} {build_ms + render_ms:>9.2f} {len(body):>8}"
+        )
+        return build_ms + render_ms, body
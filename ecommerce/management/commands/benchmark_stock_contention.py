@@ -0,0 +1,91 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from ... import inventory
+from ...models import Product
+
+BENCH_PRODUCT = "Bench stock contention"
+
+
+class Command(BaseCommand):
+    help = (
+        "Threads buying one hot product, each purchase a transaction that "
+        "takes one unit then holds it for --hold-ms like the rest of add_item "
+        "does: throughput with the stock on the product row, then sharded. "
+        "Meant for PostgreSQL; SQLite locks the whole database on a write, so "
+        "sharding can't help there. Checks that nothing was oversold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent buyers (default: 8).")
+        parser.add_argument("--shards", type=int, default=8, help="Counter rows in the sharded case (default: 8).")
+        parser.add_argument("--seconds", type=float, default=3, help="Duration of each case (default: 3).")
+        parser.add_argument(
+            "--hold-ms", type=float, default=2, help="Time each purchase keeps its transaction open (default: 2)."
+        )
+        parser.add_argument("--stock", type=int, default=1_000_000, help="Units on sale (default: 1000000).")
+
+    def handle(self, *args, **options):
+        if min(options["threads"], options["shards"], options["stock"]) < 1 or options["seconds"] <= 0:
+            raise CommandError("--threads, --shards, --stock and --seconds must be positive.")
+        self.options = options
+
+        Product.objects.filter(name=BENCH_PRODUCT).delete()  # left over from an interrupted run
+        product = Product.objects.create(
+            name=BENCH_PRODUCT, description="", price=Decimal("1.00"), in_stock=options["stock"]
+        )
+        try:
+            self.stdout.write(f"{'case':<12} {'takes/s':>9} {'taken':>8} {'retries':>8}")
+            results = {}
+            for label, shards in (("single row", 0), (f"{options['shards']} shards", options["shards"])):
+                inventory.shard_stock(product.pk, shards, total=options["stock"])
+                taken, retries = self.run_case(product.pk)
+                left = inventory.stock_level(product.pk)
+                if left + taken != options["stock"]:
+                    raise CommandError(f"{label}: {taken} taken but {options['stock'] - left} units gone.")
+                results[label] = taken / options["seconds"]
+                self.stdout.write(f"{label:<12} {results[label]:>9.0f} {taken:>8} {retries:>8}")
+            single, sharded = results.values()
+            self.stdout.write(f"sharded / single row: {sharded / single:.2f}x")
+        finally:
+            product.delete()
+
+    def run_case(self, product_id):
+        hold = self.options["hold_ms"] / 1000
+        deadline = time.monotonic() + self.options["seconds"]
+        start = threading.Barrier(self.options["threads"])
+        counts = {"taken": 0, "retries": 0}
+        lock = threading.Lock()
+
+        def buyer():
+            taken = retries = 0
+            start.wait()
+            try:
+                while time.monotonic() < deadline:
+                    try:
+                        with transaction.atomic():
+                            inventory.take_stock(product_id, 1)
+                            time.sleep(hold)  # the cart writes of add_item
+                    except inventory.InsufficientStock:
+                        break
+                    except OperationalError:
+                        # SQLite serializes writers; retry when the database is locked
+                        retries += 1
+                        continue
+                    taken += 1
+            finally:
+                connection.close()
+                with lock:
+                    counts["taken"] += taken
+                    counts["retries"] += retries
+
+        threads = [threading.Thread(target=buyer) for _ in range(self.options["threads"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return counts["taken"], counts["retries"]
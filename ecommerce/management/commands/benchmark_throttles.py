@@ -0,0 +1,78 @@
+import itertools
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework.throttling import ScopedRateThrottle
+
+from ...throttling import ScopedTokenBucketThrottle
+
+SCOPE = "benchmark"
+
+
+class View:
+    throttle_scope = SCOPE
+
+
+class Command(BaseCommand):
+    help = (
+        "Per-check cost of the token-bucket throttle against DRF's "
+        "ScopedRateThrottle (a SimpleRateThrottle) on the default cache, for "
+        "a client just under its rate and one hammering past it. Time is "
+        "simulated, so the run is quick and both see the same traffic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checks", type=int, default=5000, help="Timed checks per case (default: 5000).")
+        parser.add_argument("--rate", default="1000/min", help="Rate of both throttles (default: 1000/min).")
+
+    def handle(self, *args, **options):
+        if options["checks"] < 1:
+            raise CommandError("--checks must be at least 1.")
+        self.rates = {SCOPE: options["rate"]}
+        rest_framework = {**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": self.rates}
+        num_requests, duration = ScopedRateThrottle().parse_rate(options["rate"])
+        self.request = Request(APIRequestFactory().post("/"))
+        self.addresses = (f"10.{i // 65536}.{i // 256 % 256}.{i % 256}" for i in itertools.count(1))
+
+        self.stdout.write(f"{'throttle':<20} {'client':<12} {'µs/check':>9} {'allowed':>8}")
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            for client, step in (
+                # one request a little slower than the rate: a full history for DRF
+                ("under limit", duration / num_requests * 1.01),
+                ("over limit", 1e-6),
+            ):
+                for name, throttle_class in (
+                    ("SimpleRateThrottle", ScopedRateThrottle),
+                    ("TokenBucketThrottle", ScopedTokenBucketThrottle),
+                ):
+                    # warm up to the steady state (DRF's history filled), then time
+                    address = next(self.addresses)
+                    self.run(throttle_class, address, step, num_requests, start=1_000_000.0)
+                    per_check, allowed = self.run(
+                        throttle_class, address, step, options["checks"], start=1_000_000.0 + num_requests * step
+                    )
+                    self.stdout.write(f"{name:<20} {client:<12} {per_check * 1e6:>9.1f} {allowed:>8}")
+                    cache.delete_many(
+                        [
+                            ScopedRateThrottle.cache_format % {"scope": SCOPE, "ident": address},
+                            ScopedTokenBucketThrottle.cache_format % {"scope": SCOPE, "ident": address},
+                        ]
+                    )
+
+    def run(self, throttle_class, address, step, checks, start):
+        self.request.META["REMOTE_ADDR"] = address
+        view = View()
+        clock = iter(start + i * step for i in range(checks))
+        allowed = 0
+        started = time.perf_counter()
+        for now in clock:
+            throttle = throttle_class()
+            throttle.THROTTLE_RATES = self.rates  # DRF reads its rates at import time
+            throttle.timer = lambda now=now: now
+            allowed += throttle.allow_request(self.request, view)
+        return (time.perf_counter() - started) / checks, allowed
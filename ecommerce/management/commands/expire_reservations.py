@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...inventory import expire_reservations
+
+
+class Command(BaseCommand):
+    help = "Give back the stock held by cart items whose reservation has expired."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Cart items released per transaction (default: 1000).",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep sweeping every --interval seconds instead of running once.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=60,
+            help="Seconds between sweeps with --loop (default: 60).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            stats = expire_reservations(batch_size=options["batch_size"])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"expired {stats['items']} item(s) in {stats['carts']} cart(s), "
+                f"reclaimed {stats['units']} unit(s) in {stats['batches']} batch(es) "
+                f"[{elapsed:.3f}s]"
+            )
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...orders import freeze_paid_carts
+
+
+class Command(BaseCommand):
+    help = (
+        "Move paid carts into Order/OrderLine snapshots, in batches, and delete "
+        "the carts. Carts paid before orders existed never stored their prices, "
+        "so their lines are priced at the current product price."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=500, help="Carts per transaction (default: 500)."
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        frozen, batches = freeze_paid_carts(options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Froze {frozen} paid cart(s) into orders in {batches} batch(es).")
+        )
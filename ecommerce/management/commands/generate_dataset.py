@@ -0,0 +1,177 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from ... import inventory
+from ...catalog_cache import bump_catalog_version
+from ...models import Cart, CartItem, Category, Product
+from ...orders import freeze_carts
+
+# synthetic rows are recognisable by these, so --clear only removes them
+USER_PREFIX = "synthetic-"
+CATEGORY_PREFIX = "Synthetic "
+DESCRIPTION_PREFIX = "Synthetic "
+PASSWORD = "synthetic-password"
+
+ADJECTIVES = [
+    "oak", "steel", "linen", "woolen", "ceramic", "leather", "bamboo", "copper",
+    "glass", "marble", "cotton", "walnut", "silver", "velvet", "granite", "cedar",
+]
+NOUNS = [
+    "lamp", "chair", "table", "mug", "bowl", "shelf", "rug", "vase", "clock",
+    "desk", "stool", "bench", "mirror", "basket", "kettle", "blanket", "frame",
+]
+STYLES = ["modern", "rustic", "vintage", "minimal", "classic", "industrial", "nordic"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a deterministic synthetic dataset (categories, products, users, "
+        "active carts and paid orders) with batched bulk inserts. The same --seed "
+        "always produces the same rows. Users log in with the password "
+        f"'{PASSWORD}'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100_000, help="Products (default: 100000).")
+        parser.add_argument("--categories", type=int, default=50, help="Categories (default: 50).")
+        parser.add_argument("--users", type=int, default=1_000, help="Users (default: 1000).")
+        parser.add_argument("--active-carts", type=int, default=500, help="Users with an active cart (default: 500).")
+        parser.add_argument("--orders", type=int, default=2_000, help="Paid orders (default: 2000).")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42).")
+        parser.add_argument("--batch-size", type=int, default=5_000, help="Rows per INSERT (default: 5000).")
+        parser.add_argument("--clear", action="store_true", help="Delete a previous synthetic dataset first.")
+
+    def handle(self, *args, **options):
+        if min(options["products"], options["categories"], options["users"]) < 1:
+            raise CommandError("--products, --categories and --users must be at least 1.")
+        if options["active_carts"] > options["users"]:
+            raise CommandError("--active-carts can't exceed --users.")
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+
+        if options["clear"]:
+            self.clear()
+        elif User.objects.filter(username__startswith=USER_PREFIX).exists():
+            raise CommandError("A synthetic dataset already exists, pass --clear to replace it.")
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            categories = self.step("categories", self.create_categories, options["categories"])
+            users = self.step("users", self.create_users, options["users"])
+            products = self.step("products", self.create_products, options["products"], categories)
+            self.step("active carts", self.create_active_carts, users[: options["active_carts"]], products)
+            self.step("orders", self.create_orders, options["orders"], users, products)
+            transaction.on_commit(bump_catalog_version)
+        self.stdout.write(
+            self.style.SUCCESS(f"Dataset ready in {time.perf_counter() - started:.1f}s.")
+        )
+
+    def step(self, label, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        count = result if isinstance(result, int) else len(result)
+        self.stdout.write(f"{label:<13} {count:>8} rows  {time.perf_counter() - started:>6.1f}s")
+        return result
+
+    def clear(self):
+        User.objects.filter(username__startswith=USER_PREFIX).delete()
+        Product.objects.filter(description__startswith=DESCRIPTION_PREFIX).delete()
+        Category.objects.filter(name__startswith=CATEGORY_PREFIX).delete()
+
+    def batches(self, rows):
+        for start in range(0, len(rows), self.batch_size):
+            yield rows[start : start + self.batch_size]
+
+    # --- steps --- #
+    def create_categories(self, count):
+        categories = [
+            Category(name=f"{CATEGORY_PREFIX}{self.rng.choice(STYLES).title()} {i:03d}")
+            for i in range(count)
+        ]
+        return Category.objects.bulk_create(categories, batch_size=self.batch_size)
+
+    def create_users(self, count):
+        # one hash for everyone, PBKDF2 per user would dominate the run
+        password = make_password(PASSWORD)
+        users = [
+            User(
+                username=f"{USER_PREFIX}{i:06d}",
+                email=f"{USER_PREFIX}{i:06d}@example.com",
+                password=password,
+            )
+            for i in range(count)
+        ]
+        return User.objects.bulk_create(users, batch_size=self.batch_size)
+
+    def sample(self, rows, most):
+        # between 1 and `most` distinct rows
+        return self.rng.sample(rows, min(len(rows), self.rng.randint(1, most)))
+
+    def create_products(self, count, categories):
+        Through = Product.category.through
+        products = []
+        for start in range(0, count, self.batch_size):
+            batch = []
+            for i in range(start, min(start + self.batch_size, count)):
+                adjective, noun, style = (
+                    self.rng.choice(ADJECTIVES), self.rng.choice(NOUNS), self.rng.choice(STYLES)
+                )
+                batch.append(
+                    Product(
+                        name=f"{adjective.title()} {noun} {i:06d}",
+                        description=f"{DESCRIPTION_PREFIX}{style} {adjective} {noun}.",
+                        price=Decimal(self.rng.randint(100, 50_000)) / 100,
+                        # what is left after the reservations made below
+                        in_stock=self.rng.randint(0, 500),
+                    )
+                )
+            Product.objects.bulk_create(batch)
+            Through.objects.bulk_create(
+                [
+                    Through(product_id=product.pk, category_id=category.pk)
+                    for product in batch
+                    for category in self.sample(categories, 2)
+                ]
+            )
+            products.extend(batch)
+        return products
+
+    def create_active_carts(self, users, products):
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users], batch_size=self.batch_size)
+        items = [
+            CartItem(cart=cart, product=product, quantity=self.rng.randint(1, 3))
+            for cart in carts
+            for product in self.sample(products, 8)
+        ]
+        for batch in self.batches(items):
+            CartItem.objects.bulk_create(batch)
+            inventory.reserve_many(batch)
+        Cart.objects.filter(status="Active", user__username__startswith=USER_PREFIX).rebuild_totals()
+        return carts
+
+    def create_orders(self, count, users, products):
+        # orders go through the real freeze path: paid carts, then freeze_carts()
+        now = timezone.now()
+        frozen = 0
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            carts = Cart.objects.bulk_create(
+                [Cart(user=self.rng.choice(users), status="Paid") for _ in range(size)]
+            )
+            items = []
+            for cart in carts:
+                # spread the history over the last year (freeze_carts uses it as paid_at)
+                cart.created_at = now - timedelta(minutes=self.rng.randint(0, 525_600))
+                for product in self.sample(products, 5):
+                    items.append(CartItem(cart=cart, product=product, quantity=self.rng.randint(1, 3)))
+            CartItem.objects.bulk_create(items)
+            frozen += len(freeze_carts(carts))
+        return frozen
@@ -0,0 +1,65 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...catalog_import import ProductImporter, RejectWriter, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream products from a CSV or JSON Lines file into the catalog, upserting "
+        "on sku in batches. Columns: sku, name, description, price, in_stock "
+        "(units available to sell), categories (names, '|' separated in CSV). "
+        "Invalid rows are written to a reject file and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or .jsonl file.")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Default: from the file extension.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per upsert (default: 1000).")
+        parser.add_argument("--rejects", help="Reject file (default: <path>.rejects.<format>).")
+        parser.add_argument(
+            "--no-create-categories",
+            action="store_true",
+            help="Reject rows naming unknown categories instead of creating them.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        fmt = options["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        rejects_path = options["rejects"] or f"{path}.rejects.{fmt}"
+
+        started = time.perf_counter()
+
+        def progress(stats):
+            if options["verbosity"] > 1:
+                rate = stats["rows"] / (time.perf_counter() - started)
+                self.stdout.write(f"{stats['rows']} rows read, {rate:.0f} rows/s")
+
+        with open(path, newline="", encoding="utf-8-sig") as source, open(
+            rejects_path, "w", newline="", encoding="utf-8"
+        ) as rejects:
+            importer = ProductImporter(
+                batch_size=options["batch_size"],
+                create_categories=not options["no_create_categories"],
+                rejects=RejectWriter(rejects, fmt),
+                progress=progress,
+            )
+            stats = importer.run(read_rows(source, fmt))
+
+        elapsed = time.perf_counter() - started
+        if not stats["rejected"]:
+            os.remove(rejects_path)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {stats['imported']} product(s) from {stats['rows']} row(s) in "
+                f"{stats['batches']} batch(es), {stats['rows'] / max(elapsed, 1e-9):.0f} rows/s."
+            )
+        )
+        if stats["rejected"]:
+            self.stdout.write(self.style.WARNING(f"{stats['rejected']} row(s) rejected, see {rejects_path}"))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+
+from ...models import Cart, cart_totals_subqueries
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored cart item_count/total_amount columns from cart items."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report carts whose stored totals are stale, do not write.",
+        )
+        parser.add_argument(
+            "--status",
+            choices=[choice for choice, _ in Cart.STATUS_CHOICES],
+            help="Limit to carts with this status.",
+        )
+
+    def handle(self, *args, **options):
+        carts = Cart.objects.all()
+        if options["status"]:
+            carts = carts.filter(status=options["status"])
+
+        expected = cart_totals_subqueries()
+        stale = carts.annotate(
+            expected_count=expected["item_count"],
+            expected_amount=expected["total_amount"],
+        ).filter(
+            ~Q(item_count=F("expected_count"))
+            | ~Q(total_amount=F("expected_amount"))
+        )
+        stale_ids = list(stale.values_list("pk", flat=True))
+
+        if options["verify"]:
+            if stale_ids:
+                raise CommandError(
+                    f"{len(stale_ids)} cart(s) have stale totals: {stale_ids[:20]}"
+                )
+            self.stdout.write(self.style.SUCCESS("All cart totals are up to date."))
+            return
+
+        updated = Cart.objects.filter(pk__in=stale_ids).rebuild_totals()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt totals for {updated} cart(s)."))
+
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...inventory import shard_stock
+from ...models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Spread the stock of hot products over counter rows, so buyers of a "
+        "flash sale don't queue on one row lock; --shards 0 puts it back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("product_ids", nargs="+", type=int, help="Products to (un)shard.")
+        parser.add_argument("--shards", type=int, default=8, help="Counter rows per product, 0 to unshard (default: 8).")
+
+    def handle(self, *args, **options):
+        shards = options["shards"]
+        if not 0 <= shards <= 1000:
+            raise CommandError("--shards must be between 0 and 1000.")
+        for product_id in options["product_ids"]:
+            try:
+                stock = shard_stock(product_id, shards)
+            except Product.DoesNotExist:
+                raise CommandError(f"Product {product_id} does not exist.")
+            where = f"over {shards} shard(s)" if shards else "on the product row"
+            self.stdout.write(f"product {product_id}: {stock} unit(s) {where}")
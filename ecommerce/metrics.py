@@ -0,0 +1,235 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+# Per-route request metrics, cheap enough to leave on in production. The
+# middleware opens a RequestMetrics for each request in a context variable;
+# a database execute wrapper (installed on every connection, see signals.py)
+# and the serializer `.data` hook add to it, and at the end everything is
+# folded into a per-process registry under the route's URL name
+# ("product-list", "cart-add-item", ...). GET /metrics serves the registry in
+# the Prometheus text format; each worker process exposes its own numbers.
+#
+# Streaming responses are timed up to the first byte and have no size.
+
+UNMATCHED = "unmatched"  # 404s and anything else that didn't resolve
+
+
+class RequestMetrics:
+    __slots__ = ("queries", "db", "serialize", "open")
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.open = set()  # spans being timed, nested ones aren't counted twice
+
+    def server_timing(self, total):
+        return (
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries", '
+            f"serialize;dur={self.serialize * 1000:.1f}, "
+            f"total;dur={total * 1000:.1f}"
+        )
+
+
+current = ContextVar("request_metrics", default=None)
+
+
+@contextmanager
+def timed(span):
+    metrics = current.get()
+    if metrics is None or span in metrics.open:
+        yield
+        return
+    metrics.open.add(span)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.open.discard(span)
+        setattr(metrics, span, getattr(metrics, span) + time.perf_counter() - started)
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db += time.perf_counter() - started
+
+
+def instrument_serializers():
+    """Time every top-level serializer `.data` (nested fields go through to_representation)."""
+    from rest_framework.serializers import BaseSerializer
+
+    data = BaseSerializer.data.fget
+    if hasattr(data, "original"):
+        return
+
+    def timed_data(self):
+        with timed("serialize"):
+            return data(self)
+
+    timed_data.original = data
+    BaseSerializer.data = property(timed_data)
+
+
+# --- Registry --- #
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def snapshot(self):
+        # cumulative (upper bound, count) pairs and the sum
+        buckets, total = [], 0
+        for bound, count in zip([*self.buckets, "+Inf"], self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets, self.sum
+
+
+class RouteStats:
+    __slots__ = ("duration", "queries", "size", "db", "serialize")
+
+    def __init__(self, options):
+        self.duration = Histogram(options["DURATION_BUCKETS"])
+        self.queries = Histogram(options["QUERY_BUCKETS"])
+        self.size = Histogram(options["SIZE_BUCKETS"])
+        self.db = 0.0
+        self.serialize = 0.0
+
+
+# name -> (type, help)
+FAMILIES = {
+    "http_request_duration_seconds": ("histogram", "Time to the response, per route."),
+    "http_request_db_queries": ("histogram", "Database queries per request."),
+    "http_request_db_seconds_total": ("counter", "Time spent in database queries."),
+    "http_request_serializer_seconds_total": ("counter", "Time spent in serializers."),
+    "http_response_size_bytes": ("histogram", "Response body size, streaming responses excluded."),
+}
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    @property
+    def options(self):
+        return settings.METRICS
+
+    def record(self, route, method, status, duration, metrics, size):
+        key = (route, method, status)
+        with self._lock:
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = RouteStats(self.options)
+            stats.duration.observe(duration)
+            stats.queries.observe(metrics.queries)
+            if size is not None:
+                stats.size.observe(size)
+            stats.db += metrics.db
+            stats.serialize += metrics.serialize
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self):
+        """The registry in the Prometheus text exposition format."""
+        prefix = self.options["PREFIX"]
+        with self._lock:
+            routes = [
+                (key, {
+                    "http_request_duration_seconds": stats.duration.snapshot(),
+                    "http_request_db_queries": stats.queries.snapshot(),
+                    "http_response_size_bytes": stats.size.snapshot(),
+                    "http_request_db_seconds_total": stats.db,
+                    "http_request_serializer_seconds_total": stats.serialize,
+                })
+                for key, stats in sorted(self._routes.items())
+            ]
+
+        lines = []
+        for name, (kind, description) in FAMILIES.items():
+            lines.append(f"# HELP {prefix}{name} {description}")
+            lines.append(f"# TYPE {prefix}{name} {kind}")
+            for (route, method, status), values in routes:
+                labels = f'view="{escape(route)}",method="{escape(method)}",status="{status}"'
+                if kind == "counter":
+                    lines.append(f"{prefix}{name}{{{labels}}} {values[name]}")
+                    continue
+                buckets, total = values[name]
+                for bound, count in buckets:
+                    lines.append(f'{prefix}{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f"{prefix}{name}_sum{{{labels}}} {total}")
+                lines.append(f"{prefix}{name}_count{{{labels}}} {buckets[-1][1]}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# --- Middleware --- #
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - started)
+
+    def finish(self, request, response, metrics, duration):
+        match = request.resolver_match
+        route = (match.url_name or match.view_name) if match is not None else UNMATCHED
+        size = None if response.streaming else len(response.content)
+        registry.record(route, request.method, response.status_code, duration, metrics, size)
+        if settings.METRICS["SERVER_TIMING"]:
+            response["Server-Timing"] = metrics.server_timing(duration)
+        return response
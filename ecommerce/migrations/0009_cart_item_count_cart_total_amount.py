@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:13
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_cart_totals(apps, schema_editor):
+    Cart = apps.get_model('ecommerce', 'Cart')
+    CartItem = apps.get_model('ecommerce', 'CartItem')
+    amount_field = models.DecimalField(max_digits=12, decimal_places=2)
+    items = CartItem.objects.filter(cart=OuterRef('pk')).values('cart')
+    Cart.objects.update(
+        item_count=Coalesce(
+            Subquery(items.annotate(total=Sum('quantity')).values('total')), 0
+        ),
+        total_amount=Coalesce(
+            Subquery(
+                items.annotate(
+                    total=Sum(F('quantity') * F('product__price'), output_field=amount_field)
+                ).values('total')
+            ),
+            Decimal('0.00'),
+            output_field=amount_field,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0008_alter_cart_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_cart_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def reserve_existing_items(apps, schema_editor):
+    # items already sitting in active carts get a fresh hold
+    CartItem = apps.get_model('ecommerce', 'CartItem')
+    StockReservation = apps.get_model('ecommerce', 'StockReservation')
+    expires_at = timezone.now() + settings.CART_RESERVATION_TTL
+    items = CartItem.objects.filter(cart__status='Active').values_list('pk', flat=True)
+    StockReservation.objects.bulk_create(
+        (StockReservation(cart_item_id=pk, expires_at=expires_at) for pk in items.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0009_cart_item_count_cart_total_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('cart_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reservation', to='ecommerce.cartitem')),
+            ],
+        ),
+        migrations.RunPython(reserve_existing_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:19
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    Product = apps.get_model('ecommerce', 'Product')
+    Product.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0010_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
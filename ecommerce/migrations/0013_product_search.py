@@ -0,0 +1,77 @@
+# Full-text search structures for Product, see ecommerce/search.py.
+
+from django.db import migrations
+
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE ecommerce_product ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX ecommerce_product_search_gin ON ecommerce_product USING gin (search_vector)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS ecommerce_product_search_gin",
+    "ALTER TABLE ecommerce_product DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE ecommerce_product_fts USING fts5(
+        name, description, content='ecommerce_product', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER ecommerce_product_fts_ai AFTER INSERT ON ecommerce_product BEGIN
+        INSERT INTO ecommerce_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER ecommerce_product_fts_ad AFTER DELETE ON ecommerce_product BEGIN
+        INSERT INTO ecommerce_product_fts(ecommerce_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER ecommerce_product_fts_au AFTER UPDATE OF name, description ON ecommerce_product BEGIN
+        INSERT INTO ecommerce_product_fts(ecommerce_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO ecommerce_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO ecommerce_product_fts(ecommerce_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS ecommerce_product_fts_ai",
+    "DROP TRIGGER IF EXISTS ecommerce_product_fts_ad",
+    "DROP TRIGGER IF EXISTS ecommerce_product_fts_au",
+    "DROP TABLE IF EXISTS ecommerce_product_fts",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0012_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run_for_vendor({'postgresql': POSTGRES_REVERSE, 'sqlite': SQLITE_REVERSE}),
+        ),
+    ]
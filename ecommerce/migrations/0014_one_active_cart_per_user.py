@@ -0,0 +1,73 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:24
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def merge_duplicate_active_carts(apps, schema_editor):
+    # fold every extra active cart of a user into their newest one
+    Cart = apps.get_model('ecommerce', 'Cart')
+    CartItem = apps.get_model('ecommerce', 'CartItem')
+    duplicated = (
+        Cart.objects.filter(status='Active')
+        .values('user')
+        .annotate(carts=Count('id'))
+        .filter(carts__gt=1)
+        .values_list('user', flat=True)
+    )
+    kept_ids = []
+    for user_id in duplicated:
+        keep, *extras = Cart.objects.filter(user_id=user_id, status='Active').order_by('-created_at', '-id')
+        kept = {item.product_id: item for item in CartItem.objects.filter(cart=keep)}
+        for item in CartItem.objects.filter(cart__in=extras):
+            if item.product_id in kept:
+                CartItem.objects.filter(pk=kept[item.product_id].pk).update(
+                    quantity=F('quantity') + item.quantity
+                )
+                item.delete()
+            else:
+                item.cart = keep
+                item.save(update_fields=['cart'])
+                kept[item.product_id] = item
+        Cart.objects.filter(pk__in=[cart.pk for cart in extras]).delete()
+        kept_ids.append(keep.pk)
+
+    amount_field = models.DecimalField(max_digits=12, decimal_places=2)
+    items = CartItem.objects.filter(cart=OuterRef('pk')).values('cart')
+    Cart.objects.filter(pk__in=kept_ids).update(
+        item_count=Coalesce(Subquery(items.annotate(total=Sum('quantity')).values('total')), 0),
+        total_amount=Coalesce(
+            Subquery(
+                items.annotate(
+                    total=Sum(F('quantity') * F('product__price'), output_field=amount_field)
+                ).values('total')
+            ),
+            Decimal('0.00'),
+            output_field=amount_field,
+        ),
+        revision=F('revision') + 1,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0013_product_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_active_carts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['user', 'status', '-created_at'], name='cart_user_status_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'Active')), fields=('user',), name='one_active_cart_per_user'),
+        ),
+    ]
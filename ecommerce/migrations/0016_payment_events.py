@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0015_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='payment_intent_id',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('event_id', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('type', models.CharField(max_length=100)),
+                ('payment_intent_id', models.CharField(db_index=True, max_length=255)),
+                ('created', models.DateTimeField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('cart', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_events', to='ecommerce.cart')),
+            ],
+        ),
+    ]
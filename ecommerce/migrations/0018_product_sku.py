@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:49
+
+import importlib
+
+from django.db import migrations, models
+
+# SQLite adds the column by rebuilding ecommerce_product, which drops the
+# full-text triggers created in 0013; put them back and reindex.
+product_search = importlib.import_module('ecommerce.migrations.0013_product_search')
+SQLITE_TRIGGERS = [
+    statement for statement in product_search.SQLITE_FORWARD if 'CREATE TRIGGER' in statement
+] + ["INSERT INTO ecommerce_product_fts(ecommerce_product_fts) VALUES ('rebuild')"]
+
+
+def restore_sqlite_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in product_search.SQLITE_REVERSE[:3] + SQLITE_TRIGGERS:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0017_orders'),
+    ]
+
+    operations = [
+        # unapplying removes the column with another rebuild, restore after it
+        migrations.RunPython(migrations.RunPython.noop, restore_sqlite_triggers),
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(restore_sqlite_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-17 07:23
+
+import importlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# SQLite adds the column by rebuilding ecommerce_product, which drops the
+# full-text triggers; 0018 puts them back.
+restore_sqlite_triggers = importlib.import_module(
+    'ecommerce.migrations.0018_product_sku'
+).restore_sqlite_triggers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0019_idempotency_keys'),
+    ]
+
+    operations = [
+        # unapplying removes the column with another rebuild, restore after it
+        migrations.RunPython(migrations.RunPython.noop, restore_sqlite_triggers),
+        migrations.AddField(
+            model_name='product',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(restore_sqlite_triggers, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('in_stock', models.IntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='ecommerce.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'shard'), name='stock_shard_per_product')],
+            },
+        ),
+    ]
@@ -1,4 +1,8 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils.text import slugify
 from django.conf import settings
 
@@ -12,22 +16,132 @@ class Category(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        if "price" not in kwargs:
+            return super().update(**kwargs)
+        # bulk repricing (admin actions, shell): resync the active carts like
+        # Product.save() does, only those holding a product whose price moved
+        # (rebuilding bumps the revision a pending payment is checked against)
+        with transaction.atomic(using=self.db):
+            before = dict(self.values_list("pk", "price"))
+            updated = super().update(**kwargs)
+            after = Product.objects.using(self.db).filter(pk__in=before).values_list("pk", "price")
+            repriced = [pk for pk, price in after if before[pk] != price]
+            if repriced:
+                Cart.objects.using(self.db).filter(
+                    status="Active", items__product__in=repriced
+                ).rebuild_totals()
+        return updated
+
+
 class Product(models.Model):
+    # supplier reference, the key import_products upserts on
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=100)
     description = models.TextField()
     category = models.ManyToManyField(Category, related_name="products")
     price = models.DecimalField(max_digits=10, decimal_places=2)
     # image = models.ImageField(upload_to="static/products/")
     in_stock = models.IntegerField()
+    # > 0: the stock is spread over this many StockShard rows, see inventory.py
+    stock_shards = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # save() and QuerySet.update() keep active carts' totals in sync with the
+    # price; bulk_update() and raw SQL don't (catalog_import does it itself)
+    objects = ProductQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the loaded price so save() can tell when it changed
+        instance._loaded_price = instance.__dict__.get("price")
+        return instance
+
+    def save(self, *args, **kwargs):
+        price_changed = (
+            getattr(self, "_loaded_price", None) is not None
+            and self._loaded_price != self.price
+        )
+        super().save(*args, **kwargs)
+        self._loaded_price = self.price
+        if price_changed:
+            # active carts are priced live, keep their stored totals in sync
+            Cart.objects.filter(
+                status="Active", items__product=self
+            ).rebuild_totals()
 
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [
+            # keyset pagination walks (ordering field, id), see pagination.py
+            models.Index(fields=["price", "id"], name="product_price_id_idx"),
+            models.Index(fields=["created_at", "id"], name="product_created_id_idx"),
+        ]
+
+
+def product_stock():
+    # a product's stock, whether on its row or spread over StockShard rows
+    shards = (
+        StockShard.objects.filter(product=OuterRef("pk"))
+        .values("product")
+        .annotate(total=Sum("in_stock"))
+        .values("total")
+    )
+    return F("in_stock") + Coalesce(Subquery(shards), 0)
+
+
+def cart_totals_subqueries():
+    # per-cart item count and amount, for use against Cart.objects
+    items = CartItem.objects.filter(cart=OuterRef("pk")).values("cart")
+    item_count = items.annotate(total=Sum("quantity")).values("total")
+    total_amount = items.annotate(
+        total=Sum(
+            F("quantity") * F("product__price"),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+    ).values("total")
+    return {
+        "item_count": Coalesce(Subquery(item_count), 0),
+        "total_amount": Coalesce(
+            Subquery(total_amount),
+            Decimal("0.00"),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ),
+    }
+
+
+def cart_items_prefetch():
+    # load items -> product -> category in a fixed number of queries
+    # so serializing a cart does not fan out per item
+    # (items and categories in id order, as serializers/fast.py lists them)
+    items = (
+        CartItem.objects.select_related("product")
+        .prefetch_related(
+            models.Prefetch("product__category", queryset=Category.objects.order_by("pk"))
+        )
+        .order_by("pk")
+    )
+    return models.Prefetch("items", queryset=items)
+
+
+class CartQuerySet(models.QuerySet):
+    def with_items(self):
+        return self.select_related("user").prefetch_related(cart_items_prefetch())
+
+    def rebuild_totals(self):
+        # recompute the stored totals from the cart items in one UPDATE
+        return self.update(**cart_totals_subqueries(), revision=F("revision") + 1)
+
 
 class Cart(models.Model):
     STATUS_CHOICES = [
         ("Active", "Active"),
+        # legacy: paid carts are frozen into Order rows (freeze_paid_carts)
         ("Paid", "Paid (Order History)"),
         # ("Cancelled", "Cancelled"),
     ]
@@ -37,11 +151,43 @@ class Cart(models.Model):
     )
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="Active")
     created_at = models.DateTimeField(auto_now_add=True)
+    # denormalized totals, maintained by adjust_totals() on every cart mutation
+    item_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # bumped on every change to the cart, used as its ETag
+    revision = models.PositiveIntegerField(default=0)
+    # latest intent created by checkout; the webhook marks the cart paid
+    payment_intent_id = models.CharField(max_length=255, blank=True, default="", db_index=True)
+
+    objects = CartQuerySet.as_manager()
 
     @property
     def total_price(self):
-        total = sum(item.subtotal for item in self.items.all())
-        return (total, 2)
+        return (self.total_amount, 2)
+
+    def adjust_totals(self, quantity, price):
+        # quantity is signed: positive when units are added, negative when removed
+        Cart.objects.filter(pk=self.pk).update(
+            item_count=F("item_count") + quantity,
+            total_amount=F("total_amount") + quantity * price,
+            revision=F("revision") + 1,
+        )
+
+    class Meta:
+        constraints = [
+            # get_active_cart() relies on this to stay race free
+            models.UniqueConstraint(
+                fields=["user"],
+                condition=models.Q(status="Active"),
+                name="one_active_cart_per_user",
+            ),
+        ]
+        indexes = [
+            # order history: filter by user, ordered by status then newest
+            models.Index(
+                fields=["user", "status", "-created_at"], name="cart_user_status_created_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"Cart for {self.user.username}"
@@ -61,3 +207,131 @@ class CartItem(models.Model):
 
     class Meta:
         unique_together = ("cart", "product")
+
+
+
+class Order(models.Model):
+    # A paid cart frozen at payment time. Prices and totals are copies, so the
+    # history doesn't move when the catalog does. Created by orders.py.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="orders"
+    )
+    # the cart this was frozen from, makes freezing idempotent
+    source_cart = models.PositiveIntegerField(unique=True)
+    payment_intent_id = models.CharField(max_length=255, blank=True, default="", db_index=True)
+    item_count = models.PositiveIntegerField()
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField()  # when the cart was opened
+    paid_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # order history: a user's orders, newest first
+            models.Index(fields=["user", "-paid_at", "-id"], name="order_user_paid_idx"),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.pk} for {self.user.username}"
+
+
+class OrderLine(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="lines")
+    # kept for linking back, the snapshot below is what the order shows
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
+    product_name = models.CharField(max_length=100)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField()
+
+    @property
+    def subtotal(self):
+        return self.quantity * self.unit_price
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name}"
+
+
+class StockReservation(models.Model):
+    # Stock for a cart item is taken from Product.in_stock when it is added,
+    # so in_stock is what is left after live reservations. A reservation that
+    # outlives its TTL is swept by inventory.expire_reservations(), which
+    # gives the stock back and drops the cart item.
+    cart_item = models.OneToOneField(
+        CartItem, on_delete=models.CASCADE, related_name="reservation"
+    )
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.cart_item} until {self.expires_at:%Y-%m-%d %H:%M}"
+
+
+class StockShard(models.Model):
+    # One of the counter rows a hot product's stock is split over (opt in with
+    # inventory.shard_stock()). Buyers take from a random shard, so during a
+    # flash sale they don't all queue on the lock of the one Product row;
+    # Product.in_stock stays 0 meanwhile.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="shards")
+    shard = models.PositiveSmallIntegerField()
+    in_stock = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["product", "shard"], name="stock_shard_per_product"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}#{self.shard}: {self.in_stock}"
+
+
+class RevokedToken(models.Model):
+    # JWTs (by jti) rejected before their expiry: logged out or rotated.
+    # Rows are pruned once the token would have expired anyway.
+    jti = models.CharField(max_length=64, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+
+PAYMENT_SUCCEEDED = "payment_intent.succeeded"
+PAYMENT_FAILED = "payment_intent.payment_failed"
+
+
+class PaymentEvent(models.Model):
+    # Stripe webhook events already handled, keyed by event id so a redelivered
+    # event is recognised and skipped.
+    event_id = models.CharField(max_length=255, primary_key=True)
+    type = models.CharField(max_length=100)
+    payment_intent_id = models.CharField(max_length=255, db_index=True)
+    cart = models.ForeignKey(
+        Cart, on_delete=models.SET_NULL, null=True, blank=True, related_name="payment_events"
+    )
+    created = models.DateTimeField()  # when Stripe created the event
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.type} {self.event_id}"
+
+
+class IdempotencyKey(models.Model):
+    # A client's Idempotency-Key and the response its first request got,
+    # replayed to retries with the same key (see idempotency.py). Rows older
+    # than IDEMPOTENCY["TTL"] are pruned.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # sha256 of method, path and body
+    # null while the first request is running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True, default="")
+    content = models.BinaryField(default=b"")
+    created_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="idempotency_key_per_user"),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code or 'in progress'})"
@@ -0,0 +1,93 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import Cart, CartItem, Order, OrderLine
+
+
+# Paid carts become Order/OrderLine rows holding copies of the prices they
+# were paid at, and the cart is deleted, so the Cart table only ever holds
+# live carts. The webhook freezes a cart the moment its payment succeeds,
+# with the amount actually charged as the order total; the freeze_paid_carts
+# command migrates carts paid before orders existed, priced at live prices.
+
+
+class OrderTotalMismatch(Exception):
+    pass
+
+
+def freeze_carts(carts, paid_at=None, amounts=None):
+    """
+    Snapshot `carts` into orders and delete them; returns the new orders.
+
+    Each cart's `payment_intent_id` is copied onto its order. `amounts`
+    ({cart id: Decimal}) are the totals charged: they become the orders'
+    totals, and OrderTotalMismatch is raised when the lines don't add up to
+    them. Without it (legacy Paid rows) the total is summed from the lines.
+    Carts frozen late pass no `paid_at` and get their creation time.
+    Call inside a transaction that holds the carts' rows.
+    """
+    carts = list(carts)
+    if not carts:
+        return []
+
+    lines_by_cart = defaultdict(list)
+    items = CartItem.objects.filter(cart__in=carts).select_related("product").order_by("pk")
+    for item in items:
+        lines_by_cart[item.cart_id].append(
+            OrderLine(
+                product=item.product,
+                product_name=item.product.name,
+                unit_price=item.product.price,
+                quantity=item.quantity,
+            )
+        )
+
+    orders = []
+    for cart in carts:
+        lines = lines_by_cart[cart.pk]
+        total = sum((line.subtotal for line in lines), Decimal("0.00"))
+        if amounts is not None:
+            if amounts[cart.pk] != total:
+                raise OrderTotalMismatch(
+                    f"Cart {cart.pk}: lines add up to {total}, {amounts[cart.pk]} was charged."
+                )
+            total = amounts[cart.pk]
+        orders.append(
+            Order(
+                user_id=cart.user_id,
+                source_cart=cart.pk,
+                payment_intent_id=cart.payment_intent_id,
+                item_count=sum(line.quantity for line in lines),
+                total_amount=total,
+                created_at=cart.created_at,
+                paid_at=paid_at or cart.created_at,
+            )
+        )
+    Order.objects.bulk_create(orders)
+
+    for order in orders:
+        for line in lines_by_cart[order.source_cart]:
+            line.order = order
+    OrderLine.objects.bulk_create(
+        [line for cart in carts for line in lines_by_cart[cart.pk]], batch_size=1000
+    )
+    Cart.objects.filter(pk__in=[cart.pk for cart in carts]).delete()
+    return orders
+
+
+def freeze_paid_carts(batch_size=500):
+    """Freeze every legacy Paid cart, one transaction per batch; returns (orders, batches)."""
+    frozen = batches = 0
+    while True:
+        with transaction.atomic():
+            carts = list(
+                Cart.objects.select_for_update(skip_locked=True)
+                .filter(status="Paid")
+                .order_by("pk")[:batch_size]
+            )
+            if not carts:
+                return frozen, batches
+            frozen += len(freeze_carts(carts))
+            batches += 1
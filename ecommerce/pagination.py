@@ -0,0 +1,164 @@
+import base64
+import json
+from decimal import Decimal
+
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def approximate_count(queryset, cap=10000):
+    """
+    Cheap row count for a queryset.
+
+    On Postgres this is the planner's estimate (no table scan); elsewhere the
+    exact count, stopped at `cap` rows.
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    return queryset[:cap].count()
+
+
+class ProductPagination(PageNumberPagination):
+    """
+    Page numbers by default; keyset (cursor) pagination on request.
+
+    `?paginate=cursor` (or any `?cursor=`) switches to keyset pages ordered by
+    the view's `?ordering=` field with `id` as a tiebreaker, which needs no
+    COUNT(*) and no OFFSET, so deep pages cost the same as the first one.
+    `?count=approx` adds an approximate total to keyset pages.
+    """
+
+    cursor_query_param = "cursor"
+    mode_query_param = "paginate"
+    count_query_param = "count"
+    default_ordering = "-created_at"
+    cursor_fields = {
+        "price": Decimal,
+        "created_at": parse_datetime,
+    }
+
+    def use_cursor(self, request):
+        return (
+            request.query_params.get(self.cursor_query_param)
+            or request.query_params.get(self.mode_query_param) == "cursor"
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = bool(self.use_cursor(request))
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request, view)
+
+        self.approx_count = None
+        if request.query_params.get(self.count_query_param) == "approx":
+            self.approx_count = approximate_count(queryset)
+
+        position = self.decode_cursor(request)
+        reverse = bool(position and position["r"])
+        # walking backwards means flipping the sort and the comparison
+        descending = self.descending != reverse
+        prefix = "-" if descending else ""
+        queryset = queryset.order_by(f"{prefix}{self.field}", f"{prefix}id")
+        if position:
+            value, pk = position["v"], position["id"]
+            op = "lt" if descending else "gt"
+            # (field, id) > (value, pk), with a plain range on the leading
+            # column so the planner can seek the (field, id) index
+            queryset = queryset.filter(
+                Q(**{f"{self.field}__{op}e": value}),
+                Q(**{f"{self.field}__{op}": value}) | Q(**{f"id__{op}": pk}),
+            )
+
+        rows = list(queryset[: self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = bool(rows), has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.rows = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        payload = {
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        }
+        if self.approx_count is not None:
+            payload = {"count": self.approx_count, "count_is_approximate": True, **payload}
+        return Response(payload)
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not (self.has_next and self.rows):
+            return None
+        return self.cursor_link(self.rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if not (self.has_previous and self.rows):
+            return None
+        return self.cursor_link(self.rows[0], reverse=True)
+
+    # --- cursor helpers --- #
+    def get_ordering(self, request, view):
+        allowed = set(getattr(view, "ordering_fields", None) or []) & set(self.cursor_fields)
+        for term in request.query_params.get("ordering", "").split(","):
+            term = term.strip()
+            if term.lstrip("-") in allowed:
+                return term.lstrip("-"), term.startswith("-")
+        return self.default_ordering.lstrip("-"), self.default_ordering.startswith("-")
+
+    def encode_cursor(self, obj, reverse):
+        # a model instance, or a values() row from the fast list path
+        if isinstance(obj, dict):
+            value, pk = obj[self.field], obj["id"]
+        else:
+            value, pk = getattr(obj, self.field), obj.pk
+        value = value.isoformat() if hasattr(value, "isoformat") else str(value)
+        raw = json.dumps({"v": value, "id": pk, "r": int(reverse)})
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position["v"] = self.cursor_fields[self.field](position["v"])
+            position["id"] = int(position["id"])
+            position["r"] = bool(position.get("r"))
+        except (TypeError, ValueError, KeyError, ArithmeticError):
+            raise NotFound("Invalid cursor.")
+        if position["v"] is None:
+            raise NotFound("Invalid cursor.")
+        return position
+
+    def cursor_link(self, obj, reverse):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(obj, reverse)
+        )
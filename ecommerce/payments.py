@@ -0,0 +1,232 @@
+import itertools
+import threading
+import time
+
+import requests
+import stripe
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+# Payment gateway used by checkout. The backend is chosen by
+# PAYMENT_GATEWAY["BACKEND"]: StripeGateway talks to Stripe through one
+# pooled HTTP session with strict timeouts; FakeGateway keeps intents in
+# memory for tests and load runs. Both are wrapped in a circuit breaker, so
+# when the provider is down checkout fails fast with PaymentUnavailable
+# instead of holding a worker for the whole timeout on every request.
+#
+# Intents are plain dicts: id, client_secret, status, amount, metadata.
+
+
+class PaymentError(Exception):
+    """The provider rejected the request (bad card, invalid params, ...)."""
+
+
+class PaymentUnavailable(PaymentError):
+    """The provider can't be reached right now; worth retrying later."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After `threshold` consecutive failures it opens
+    and refuses calls for `reset_timeout` seconds, then lets one trial call
+    through (half-open) which closes it again on success.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(now)
+            if state == "closed":
+                return
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return
+            retry_after = max(1, round(self.reset_timeout - (now - self._opened_at)))
+        raise PaymentUnavailable("Payment provider unavailable", retry_after=retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def call(self, func, *args, **kwargs):
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except PaymentUnavailable:
+            self.record_failure()
+            raise
+        except PaymentError:
+            # the provider answered, it is healthy
+            self.record_success()
+            raise
+        except BaseException:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+
+def intent_dict(intent):
+    return {
+        "id": intent["id"],
+        "client_secret": intent["client_secret"],
+        "status": intent["status"],
+        "amount": intent["amount"],
+        "metadata": dict(intent.get("metadata") or {}),
+    }
+
+
+class StripeGateway:
+    def __init__(self, options):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=options["POOL_SIZE"])
+        session.mount("https://", adapter)
+        self.client = stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY or "",
+            # Stripe retries connection errors and 409/5xx itself, re-sending our
+            # idempotency key so a retried create can't charge twice
+            max_network_retries=options["MAX_RETRIES"],
+            http_client=stripe.RequestsClient(
+                timeout=(options["CONNECT_TIMEOUT"], options["READ_TIMEOUT"]),
+                session=session,
+            ),
+        )
+
+    def _call(self, func, *args, **kwargs):
+        try:
+            return intent_dict(func(*args, **kwargs))
+        except (stripe.APIConnectionError, stripe.RateLimitError) as e:
+            raise PaymentUnavailable(str(e)) from e
+        except stripe.StripeError as e:
+            if e.http_status is None or e.http_status >= 500:
+                raise PaymentUnavailable(str(e)) from e
+            raise PaymentError(e.user_message or str(e)) from e
+
+    def create_intent(self, amount, currency, idempotency_key, metadata):
+        return self._call(
+            self.client.v1.payment_intents.create,
+            params={
+                "amount": amount,
+                "currency": currency,
+                "metadata": metadata,
+                "automatic_payment_methods": {"enabled": True, "allow_redirects": "never"},
+            },
+            options={"idempotency_key": idempotency_key},
+        )
+
+    def retrieve_intent(self, intent_id):
+        return self._call(self.client.v1.payment_intents.retrieve, intent_id)
+
+
+class FakeGateway:
+    """In-memory gateway; `LATENCY` seconds of sleep per call simulate the network."""
+
+    def __init__(self, options):
+        self.latency = options.get("LATENCY", 0)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.intents = {}
+        self.by_key = {}
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def create_intent(self, amount, currency, idempotency_key, metadata):
+        self._wait()
+        with self._lock:
+            if idempotency_key in self.by_key:
+                return dict(self.intents[self.by_key[idempotency_key]])
+            intent_id = f"pi_fake_{next(self._ids)}"
+            self.intents[intent_id] = {
+                "id": intent_id,
+                "client_secret": f"{intent_id}_secret",
+                "status": "requires_payment_method",
+                "amount": amount,
+                "metadata": dict(metadata),
+            }
+            self.by_key[idempotency_key] = intent_id
+            return dict(self.intents[intent_id])
+
+    def retrieve_intent(self, intent_id):
+        self._wait()
+        with self._lock:
+            if intent_id not in self.intents:
+                raise PaymentError(f"No such payment_intent: '{intent_id}'")
+            return dict(self.intents[intent_id])
+
+    def succeed(self, intent_id):
+        """Mark an intent as paid, as if the customer completed it."""
+        with self._lock:
+            self.intents[intent_id]["status"] = "succeeded"
+
+
+class PaymentGateway:
+    """The configured backend behind a circuit breaker."""
+
+    def __init__(self, options):
+        self.options = options
+        self.backend = import_string(options["BACKEND"])(options)
+        self.breaker = CircuitBreaker(options["BREAKER_THRESHOLD"], options["BREAKER_RESET"])
+
+    def create_intent(self, amount, currency, idempotency_key, metadata):
+        return self.breaker.call(
+            self.backend.create_intent, amount, currency, idempotency_key, metadata
+        )
+
+    def retrieve_intent(self, intent_id):
+        return self.breaker.call(self.backend.retrieve_intent, intent_id)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """The process-wide gateway, rebuilt whenever PAYMENT_GATEWAY changes."""
+    global _gateway
+    options = settings.PAYMENT_GATEWAY
+    with _gateway_lock:
+        if _gateway is None or _gateway.options is not options:
+            _gateway = PaymentGateway(options)
+        return _gateway
+
+
+def checkout_idempotency_key(cart, amount):
+    # the revision changes with every edit of the cart, so retrying checkout
+    # on an unchanged cart reuses the intent and an edited cart gets a new one
+    return f"checkout:{cart.pk}:{cart.revision}:{amount}"
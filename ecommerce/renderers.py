@@ -0,0 +1,41 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional, JSONRenderer's stdlib encoder is used instead
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer on orjson, when it is installed.
+
+    The bytes are the same as JSONRenderer's with the default compact,
+    unicode output: whatever orjson has no native encoding for (Decimal,
+    datetimes, lazy strings, querysets...) goes through DRF's JSONEncoder,
+    so a bare Decimal is still a float and a datetime still ends in "Z".
+    The one difference: NaN and infinities encode as null instead of raising.
+    Indented output (the browsable API, `; indent=`) and the non-default
+    ASCII/spaced settings are left to JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+        except orjson.JSONEncodeError:
+            # e.g. integers past 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+        # same escaping as JSONRenderer, keeps the output a JavaScript subset
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
@@ -0,0 +1,150 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+
+# Revoked JWTs live in the RevokedToken table. Every process keeps a Bloom
+# filter of the revoked jtis in front of it, so checking a token that was
+# never revoked (nearly all of them) is a few in-memory hash probes; only a
+# filter hit is confirmed against the table. The filter pulls rows revoked
+# by other processes every SYNC_INTERVAL seconds and is rebuilt when expired
+# rows are pruned. Refresh rotation doesn't go through the filter: claim()
+# revokes with an INSERT that only one request, on any worker, can win.
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class RevokedTokenStore:
+    # rows committed slightly out of order are caught by re-reading this window
+    SYNC_OVERLAP = timedelta(seconds=5)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._synced_at = None
+        self._next_sync = 0
+        self._next_prune = 0
+
+    @property
+    def options(self):
+        return settings.REVOKED_TOKENS
+
+    def revoke(self, token):
+        """Revoke a simplejwt token (access or refresh) until it expires."""
+        jti = token.get(api_settings.JTI_CLAIM)
+        exp = token.get("exp")
+        if not jti or not exp:
+            return
+        RevokedToken.objects.bulk_create(
+            [RevokedToken(jti=jti, expires_at=datetime.fromtimestamp(exp, tz=dt_timezone.utc))],
+            ignore_conflicts=True,
+        )
+        with self._lock:
+            self._ensure_loaded()
+            self._bloom.add(jti)
+
+    def claim(self, token):
+        """
+        Revoke `token` unless it already was; True for the one caller that
+        revoked it. For single-use tokens (refresh rotation): the primary key
+        decides between concurrent callers, without the filter's sync lag.
+        """
+        jti = token.get(api_settings.JTI_CLAIM)
+        exp = token.get("exp")
+        if not jti or not exp:
+            return False
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(
+                    jti=jti, expires_at=datetime.fromtimestamp(exp, tz=dt_timezone.utc)
+                )
+        except IntegrityError:
+            return False
+        with self._lock:
+            self._ensure_loaded()
+            self._bloom.add(jti)
+        return True
+
+    def is_revoked(self, jti, exact=False):
+        """`exact` asks the table directly, for rare paths that can't take the filter's lag."""
+        if exact:
+            return RevokedToken.objects.filter(jti=jti).exists()
+        with self._lock:
+            self._ensure_loaded()
+            self._maybe_refresh()
+            maybe = jti in self._bloom
+        return maybe and RevokedToken.objects.filter(jti=jti).exists()
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+
+    # --- internals, called with the lock held --- #
+    def _ensure_loaded(self):
+        if self._bloom is None:
+            self._rebuild()
+            self._next_prune = time.monotonic() + self.options["PRUNE_INTERVAL"]
+
+    def _rebuild(self):
+        now = timezone.now()
+        jtis = list(
+            RevokedToken.objects.filter(expires_at__gt=now).values_list("jti", flat=True)
+        )
+        # leave headroom so new revocations don't degrade the error rate
+        capacity = max(self.options["CAPACITY"], len(jtis) * 2)
+        bloom = BloomFilter(capacity, self.options["ERROR_RATE"])
+        for jti in jtis:
+            bloom.add(jti)
+        self._bloom = bloom
+        self._synced_at = now
+        self._next_sync = time.monotonic() + self.options["SYNC_INTERVAL"]
+
+    def _maybe_refresh(self):
+        clock = time.monotonic()
+        if clock >= self._next_prune:
+            self._next_prune = clock + self.options["PRUNE_INTERVAL"]
+            RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+            self._rebuild()
+        elif clock >= self._next_sync:
+            now = timezone.now()
+            recent = RevokedToken.objects.filter(
+                revoked_at__gte=self._synced_at - self.SYNC_OVERLAP
+            ).values_list("jti", flat=True)
+            for jti in recent:
+                self._bloom.add(jti)
+            self._synced_at = now
+            self._next_sync = clock + self.options["SYNC_INTERVAL"]
+
+
+revoked_tokens = RevokedTokenStore()
@@ -0,0 +1,156 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+from .catalog_cache import catalog_recently_changed
+
+
+# Read replicas. Views that opt in with `replica_reads = True` (the catalog)
+# have their GET/HEAD reads of catalog tables sent to one of
+# REPLICA_ROUTING["ALIASES"]; everything else, including the user and token
+# lookups of those same requests, and every write stays on the primary.
+#
+# Replicas lag a little, so reads stick to the primary for STICKY_SECONDS:
+# - for a client after any write of theirs (a cookie set on the response to
+#   a POST/PUT/PATCH/DELETE, so it works across workers), e.g. the stock
+#   shown right after add_item;
+# - for everyone after a catalog write (the catalog version bump), so a
+#   lagging replica can't fill the fresh cache entries with old rows.
+
+# the current request's ReplicaReads, set and reset by the middleware in the
+# same context (sync or async) around the whole request, and around each
+# chunk of a streaming response's body, which is read after it returned
+replica_reads = ContextVar("replica_reads", default=None)
+# (app label, model name), the link table included
+CATALOG_MODELS = {("ecommerce", "product"), ("ecommerce", "category"), ("ecommerce", "product_category")}
+
+
+def options():
+    return settings.REPLICA_ROUTING
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = options()["ALIASES"]
+        request_reads = replica_reads.get()
+        if (
+            not replicas
+            or request_reads is None
+            or (model._meta.app_label, model._meta.model_name) not in CATALOG_MODELS
+            or not request_reads.enabled
+        ):
+            # also keeps related lookups on instances loaded from a replica
+            # off the replica outside replica-read views
+            return DEFAULT_DB_ALIAS
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db in replicas:
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaReads:
+    # decided on the request's first catalog read, when the view is known;
+    # no process_view hook, which ASGI would run through sync_to_async
+    def __init__(self, request):
+        self.request = request
+        self._enabled = None
+
+    @property
+    def enabled(self):
+        if self._enabled is None:
+            match = self.request.resolver_match
+            if match is None:
+                return False  # not routed yet
+            view = getattr(match.func, "cls", None)
+            self._enabled = bool(
+                self.request.method in SAFE_METHODS
+                and getattr(view, "replica_reads", False)
+                and options()["COOKIE_NAME"] not in self.request.COOKIES
+                and not catalog_recently_changed()
+            )
+        return self._enabled
+
+
+def stream_with(reads, content):
+    # set and reset around each chunk: between chunks (and under ASGI, in
+    # another thread for each) the context isn't the request's any more
+    iterator = iter(content)
+    while True:
+        token = replica_reads.set(reads)
+        try:
+            chunk = next(iterator, None)
+        finally:
+            replica_reads.reset(token)
+        if chunk is None:
+            return
+        yield chunk
+
+
+async def astream_with(reads, content):
+    iterator = aiter(content)
+    while True:
+        token = replica_reads.set(reads)
+        try:
+            chunk = await anext(iterator, None)
+        finally:
+            replica_reads.reset(token)
+        if chunk is None:
+            return
+        yield chunk
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        reads = ReplicaReads(request)
+        token = replica_reads.set(reads)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        return self.finish(request, response, reads)
+
+    async def __acall__(self, request):
+        reads = ReplicaReads(request)
+        token = replica_reads.set(reads)
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        return self.finish(request, response, reads)
+
+    def finish(self, request, response, reads):
+        if response.streaming:
+            # e.g. the catalog export, whose queries run as the body is sent
+            wrap = astream_with if response.is_async else stream_with
+            response.streaming_content = wrap(reads, response.streaming_content)
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                options()["COOKIE_NAME"],
+                "1",
+                max_age=options()["STICKY_SECONDS"],
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -0,0 +1,79 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+
+# Full-text search over product name/description.
+#
+# Postgres: ecommerce_product.search_vector, a stored generated tsvector
+# column with a GIN index (name weighted above description).
+# SQLite: ecommerce_product_fts, an FTS5 external-content table kept in
+# sync by triggers. Both are created by migration 0013_product_search.
+#
+# search_products() returns None when the database has neither, so callers
+# can fall back to the plain icontains search.
+
+FTS_TABLE = "ecommerce_product_fts"
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fts5_query(terms):
+    # quote every token so user input can't inject FTS5 syntax; prefix-match
+    return " ".join(f'"{token}"*' for token in TOKEN_RE.findall(terms))
+
+
+def _search_postgres(queryset, terms):
+    vector = RawSQL(
+        f'"{queryset.model._meta.db_table}"."search_vector"',
+        [],
+        output_field=SearchVectorField(),
+    )
+    query = SearchQuery(terms, config="english", search_type="websearch")
+    return (
+        queryset.alias(search_vector=vector)
+        .filter(search_vector=query)
+        .annotate(search_rank=SearchRank(vector, query))
+        .order_by("-search_rank", "-id")
+    )
+
+
+def _search_sqlite(queryset, terms):
+    match = fts5_query(terms)
+    if not match:
+        return queryset.none()
+    table = queryset.model._meta.db_table
+    return (
+        queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,))
+        )
+        .annotate(
+            # bm25() is lower for better matches
+            search_rank=RawSQL(
+                f"(SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id)",
+                (match,),
+            )
+        )
+        .order_by("-search_rank", "-id")
+    )
+
+
+def search_products(queryset, terms):
+    vendor = connections[queryset.db].vendor
+    if vendor == "postgresql":
+        return _search_postgres(queryset, terms)
+    if vendor == "sqlite" and fts5_available(queryset.db):
+        return _search_sqlite(queryset, terms)
+    return None
+
+
+_fts5_tables = {}
+
+
+def fts5_available(alias):
+    if alias not in _fts5_tables:
+        connection = connections[alias]
+        _fts5_tables[alias] = FTS_TABLE in connection.introspection.table_names()
+    return _fts5_tables[alias]
@@ -1,3 +1,4 @@
 from .auth import UserRegistrationSerializer, UserDetailSerializer
 from .product import ProductSerializer, ProductDetailSerializer, CategorySerializer
-from .cart import CartSerializer, CartItemSerializer
+from .cart import CartSerializer, CartItemSerializer, CartBatchLineSerializer
+from .order import OrderSerializer, OrderLineSerializer
@@ -32,3 +32,20 @@ class CartSerializer(ModelSerializer):
     class Meta:
         model = Cart
         fields = ["id", "user", "status", "items", "total_price", "created_at"]
+
+
+class CartBatchLineSerializer(serializers.Serializer):
+    OPS = ["add", "remove", "set"]
+
+    product_id = serializers.IntegerField()
+    # add/remove: units to add or take away (remove without it drops the line)
+    # set: the final quantity, 0 drops the line
+    quantity = serializers.IntegerField(min_value=0, required=False)
+    op = serializers.ChoiceField(choices=OPS, default="add")
+
+    def validate(self, attrs):
+        if attrs["op"] == "add" and attrs.get("quantity", 1) < 1:
+            raise serializers.ValidationError({"quantity": "Quantity must be at least 1."})
+        if attrs["op"] == "set" and "quantity" not in attrs:
+            raise serializers.ValidationError({"quantity": "Quantity is required for set."})
+        return attrs
@@ -0,0 +1,94 @@
+from collections import defaultdict
+
+from ..models import CartItem, Product
+from .cart import CartSerializer
+from .product import ProductSerializer
+
+
+# Fast path for the hot read endpoints (product list, carts): rows come from
+# values() and category names from one query on the link table, and are put
+# together as plain dicts in the same shape, key order and value types as
+# ProductSerializer / CartSerializer give. Scalars that need formatting go
+# through the real serializer field, so the output can't drift from it.
+# Categories are listed in id order on both paths.
+
+PRODUCT_LIST_VALUES = ("id", "name", "price", "created_at")
+CART_VALUES = ("id", "user__username", "status", "total_amount", "created_at")
+
+
+def category_names(product_ids):
+    """{product id: [category names]} in one query."""
+    names = defaultdict(list)
+    links = (
+        Product.category.through.objects.filter(product_id__in=product_ids)
+        .order_by("product_id", "category_id")
+        .values_list("product_id", "category__name")
+    )
+    for product_id, name in links:
+        names[product_id].append(name)
+    return names
+
+
+def product_list_rows(rows):
+    """ProductSerializer(many=True).data for dicts with PRODUCT_LIST_VALUES."""
+    rows = list(rows)
+    price = ProductSerializer().fields["price"]
+    names = category_names([row["id"] for row in rows])
+    return [
+        {
+            "name": row["name"],
+            "category": names.get(row["id"], []),
+            "price": price.to_representation(row["price"]),
+        }
+        for row in rows
+    ]
+
+
+def cart_rows(carts):
+    """CartSerializer(many=True).data for dicts with CART_VALUES."""
+    carts = list(carts)
+    items = defaultdict(list)
+    for item in (
+        CartItem.objects.filter(cart_id__in=[cart["id"] for cart in carts])
+        .order_by("pk")
+        .values("cart_id", "product_id", "quantity", "product__name", "product__price")
+    ):
+        items[item["cart_id"]].append(item)
+    names = category_names({item["product_id"] for lines in items.values() for item in lines})
+
+    price = ProductSerializer().fields["price"]
+    created_at = CartSerializer().fields["created_at"]
+    return [
+        {
+            "id": cart["id"],
+            "user": cart["user__username"],
+            "status": cart["status"],
+            "items": [
+                {
+                    "product": {
+                        "name": item["product__name"],
+                        "category": names.get(item["product_id"], []),
+                        "price": price.to_representation(item["product__price"]),
+                    },
+                    "quantity": item["quantity"],
+                    "subtotal": item["quantity"] * item["product__price"],
+                }
+                for item in items[cart["id"]]
+            ],
+            # Cart.total_price, as the ReadOnlyField passes it through
+            "total_price": (cart["total_amount"], 2),
+            "created_at": created_at.to_representation(cart["created_at"]),
+        }
+        for cart in carts
+    ]
+
+
+def cart_values(cart):
+    """CART_VALUES of a loaded Cart, for cart_rows()."""
+    return {
+        "id": cart.pk,
+        "user__username": cart.user.username,
+        "status": cart.status,
+        "total_amount": cart.total_amount,
+        "created_at": cart.created_at,
+    }
@@ -0,0 +1,20 @@
+from rest_framework import serializers
+from rest_framework.serializers import ModelSerializer
+
+from ..models import Order, OrderLine
+
+
+class OrderLineSerializer(ModelSerializer):
+    subtotal = serializers.ReadOnlyField()
+
+    class Meta:
+        model = OrderLine
+        fields = ["product_id", "product_name", "unit_price", "quantity", "subtotal"]
+
+
+class OrderSerializer(ModelSerializer):
+    lines = OrderLineSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ["id", "item_count", "total_amount", "created_at", "paid_at", "lines"]
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 
+from .. import inventory
 from ..models import Product, Category
 
 
@@ -28,6 +29,7 @@ class ProductDetailSerializer(ModelSerializer):
         model = Product
         fields = fields = [
             "id",
+            "sku",
             "name",
             "description",
             "category",
@@ -36,6 +38,20 @@ class ProductDetailSerializer(ModelSerializer):
             "created_at",
         ]
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.stock_shards:
+            # the stock is spread over StockShard rows, see inventory.py
+            data["in_stock"] = inventory.stock_level(instance.pk)
+        return data
+
+    def update(self, instance, validated_data):
+        in_stock = validated_data.pop("in_stock", None) if instance.stock_shards else None
+        instance = super().update(instance, validated_data)
+        if in_stock is not None:
+            inventory.shard_stock(instance.pk, instance.stock_shards, total=in_stock)
+        return instance
+
 
 class CategorySerializer(ModelSerializer):
     class Meta:
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .authentication import user_cache
+from .catalog_cache import bump_catalog_version
+from .metrics import db_execute_wrapper
+from .models import Category, Product
+
+
+# --- Catalog cache invalidation --- #
+# Covers writes from the API, the admin and the shell alike.
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_on_write(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Category)
+def invalidate_catalog_on_category_save(sender, instance, created, **kwargs):
+    if not created:
+        # a rename shows up in every product of the category
+        instance.products.update(updated_at=timezone.now())
+    bump_catalog_version()
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def invalidate_catalog_on_category_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    # keep updated_at (incremental exports) honest for the products whose categories changed
+    if not reverse:
+        Product.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+    elif pk_set:
+        Product.objects.filter(pk__in=pk_set).update(updated_at=timezone.now())
+    bump_catalog_version()
+
+
+# --- Auth user cache invalidation --- #
+# password changes, deactivation and deletes must not be served from cache
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+
+# --- Request metrics --- #
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # first in the list, so `with connection.execute_wrapper(...)` blocks
+    # opened before the connection still pop their own wrapper
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, db_execute_wrapper)
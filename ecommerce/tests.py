@@ -1,3 +1,1661 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+import stripe
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.models import F
+from django.core.handlers.asgi import ASGIHandler
+from django.http import Http404
+from django.test import AsyncClient, AsyncRequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import catalog_cache, inventory
+from .authentication import user_cache
+from .hashing import hashing_pool
+from .metrics import registry as metrics_registry
+from .orders import OrderTotalMismatch, freeze_carts
+from .renderers import FastJSONRenderer
+from .serializers import CartItemSerializer
+from .payments import (
+    CircuitBreaker,
+    PaymentError,
+    PaymentUnavailable,
+    StripeGateway,
+    get_gateway,
+)
+from .revocation import BloomFilter, revoked_tokens
+from .throttling import TokenBucketThrottle
+from .pagination import ProductPagination
+from .models import (
+    Cart,
+    CartItem,
+    Category,
+    IdempotencyKey,
+    Order,
+    PaymentEvent,
+    Product,
+    RevokedToken,
+    StockReservation,
+    StockShard,
+)
+from .views import AsyncLoginView, AsyncRegisterView, CartItemViewSet, CartViewSet
+from .views.cart import get_active_cart
+from .views.mixins import FastListMixin
+from .views.product import ProductViewSet
+
+
+# --- Helpers --- #
+class CartTestMixin:
+    def setUp(self):
+        cache.clear()  # throttle buckets live there
+        self.user = User.objects.create_user(username="buyer", password="pass12345")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name="Books")
+
+    def make_product(self, name="Product", price="10.00", in_stock=100):
+        product = Product.objects.create(
+            name=name, description="", price=Decimal(price), in_stock=in_stock
+        )
+        product.category.add(self.category)
+        return product
+
+    def fill_cart(self, cart, n_items):
+        for i in range(n_items):
+            CartItem.objects.create(
+                cart=cart, product=self.make_product(name=f"P{i}"), quantity=2
+            )
+        Cart.objects.filter(pk=cart.pk).rebuild_totals()
+
+
+# --- Cart read path --- #
+class CartQueryCountTests(CartTestMixin, TestCase):
+    # cart (get_or_create) + items/products + categories
+    MY_CART_QUERIES = 3
+
+    def test_my_cart_query_count_is_constant(self):
+        cart = Cart.objects.create(user=self.user)
+        self.fill_cart(cart, 2)
+        with self.assertNumQueries(self.MY_CART_QUERIES):
+            small = self.client.get("/cart/my_cart/")
+
+        self.fill_cart(cart, 20)
+        with self.assertNumQueries(self.MY_CART_QUERIES):
+            large = self.client.get("/cart/my_cart/")
+
+        self.assertEqual(len(small.data["items"]), 2)
+        self.assertEqual(len(large.data["items"]), 22)
+        self.assertEqual(Decimal(large.data["total_price"][0]), Decimal("440.00"))
+
+    def test_cart_list_query_count_is_constant(self):
+        for _ in range(5):
+            cart = Cart.objects.create(user=self.user, status="Paid")
+            self.fill_cart(cart, 3)
+
+        # count + carts + items/products + categories
+        with self.assertNumQueries(4):
+            response = self.client.get("/cart/")
+
+        self.assertEqual(response.data["count"], 5)
+        self.assertEqual(len(response.data["results"][0]["items"]), 3)
+
+
+# --- Cart totals --- #
+class CartTotalsTests(CartTestMixin, TestCase):
+    def assertTotals(self, cart, item_count, total_amount):
+        cart.refresh_from_db()
+        self.assertEqual(cart.item_count, item_count)
+        self.assertEqual(cart.total_amount, Decimal(total_amount))
+
+    def test_mutations_keep_totals_in_sync(self):
+        book = self.make_product(name="Book", price="12.50")
+        pen = self.make_product(name="Pen", price="1.25")
+
+        self.client.post("/cart/add_item/", {"product_id": book.pk, "quantity": 2})
+        response = self.client.post("/cart/add_item/", {"product_id": pen.pk, "quantity": 4})
+        cart = Cart.objects.get(user=self.user, status="Active")
+        self.assertTotals(cart, 6, "30.00")
+        self.assertEqual(Decimal(response.data["total_price"][0]), Decimal("30.00"))
+
+        self.client.post("/cart/remove_item/", {"product_id": pen.pk, "quantity": 1})
+        self.assertTotals(cart, 5, "28.75")
+
+        item = CartItem.objects.get(cart=cart, product=book)
+        self.client.patch(f"/cart_items/{item.pk}/", {"quantity": 1})
+        self.assertTotals(cart, 4, "16.25")
+
+        self.client.delete(f"/cart_items/{item.pk}/")
+        self.assertTotals(cart, 3, "3.75")
+
+        self.client.post("/cart/remove_item/", {"product_id": pen.pk})
+        self.assertTotals(cart, 0, "0.00")
+
+    def test_cart_item_writes_reread_the_item_under_the_cart_lock(self):
+        # as if a concurrent request changed the item after get_object()
+        product = self.make_product(in_stock=10)
+        self.client.post("/cart/add_item/", {"product_id": product.pk})
+        stale = CartItem.objects.get()
+        self.client.patch(f"/cart_items/{stale.pk}/", {"quantity": 3})
+        view = CartItemViewSet(request=APIRequestFactory().patch("/"))
+        view.request.user = self.user
+
+        serializer = CartItemSerializer(stale, data={"quantity": 2}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        view.perform_update(serializer)
+        product.refresh_from_db()
+        self.assertEqual(product.in_stock, 8)  # 3 -> 2, not 1 -> 2
+
+        view.perform_destroy(stale)
+        with self.assertRaises(Http404):
+            view.perform_destroy(stale)  # the second DELETE restocks nothing
+        product.refresh_from_db()
+        self.assertEqual(product.in_stock, 10)
+        self.assertTotals(Cart.objects.get(user=self.user), 0, "0.00")
+
+    def test_price_change_updates_active_carts_only(self):
+        product = self.make_product(price="10.00")
+        active = Cart.objects.create(user=self.user)
+        paid = Cart.objects.create(user=self.user, status="Paid")
+        for cart in (active, paid):
+            CartItem.objects.create(cart=cart, product=product, quantity=3)
+        Cart.objects.rebuild_totals()
+
+        product = Product.objects.get(pk=product.pk)
+        product.price = Decimal("20.00")
+        product.save()
+
+        self.assertTotals(active, 3, "60.00")
+        self.assertTotals(paid, 3, "30.00")
+
+    def test_bulk_price_update_resyncs_active_carts(self):
+        lamp, desk = self.make_product(price="10.00"), self.make_product(price="50.00")
+        self.client.post("/cart/batch/", [{"product_id": lamp.pk, "quantity": 2}], format="json")
+        cart = Cart.objects.get(user=self.user)
+
+        revision = Cart.objects.get(pk=cart.pk).revision
+        Product.objects.filter(pk=desk.pk).update(price=Decimal("60.00"))  # not in the cart
+        self.assertEqual(Cart.objects.get(pk=cart.pk).revision, revision)
+        Product.objects.filter(pk__in=[lamp.pk, desk.pk]).update(price=F("price") + 1)
+
+        self.assertTotals(cart, 2, "22.00")
+        self.assertEqual(Cart.objects.get(pk=cart.pk).revision, revision + 1)
+        Product.objects.filter(pk=lamp.pk).update(price=Decimal("11.00"), name="Lamp")  # same price
+        self.assertEqual(Cart.objects.get(pk=cart.pk).revision, revision + 1)
+
+    def test_rebuild_cart_totals_command(self):
+        cart = Cart.objects.create(user=self.user)
+        self.fill_cart(cart, 2)
+        Cart.objects.filter(pk=cart.pk).update(item_count=0, total_amount=0)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_cart_totals", "--verify", stdout=StringIO())
+
+        call_command("rebuild_cart_totals", stdout=StringIO())
+        self.assertTotals(cart, 4, "40.00")
+        call_command("rebuild_cart_totals", "--verify", stdout=StringIO())
+
+
+# --- Batch cart endpoint --- #
+class CartBatchTests(CartTestMixin, TestCase):
+    def test_batch_applies_lines_and_reports_failures(self):
+        book = self.make_product(name="Book", price="10.00", in_stock=5)
+        pen = self.make_product(name="Pen", price="1.00", in_stock=1)
+        mug = self.make_product(name="Mug", price="4.00", in_stock=5)
+        self.client.post("/cart/add_item/", {"product_id": mug.pk, "quantity": 3})
+
+        response = self.client.post(
+            "/cart/batch/",
+            [
+                {"product_id": book.pk, "quantity": 2},
+                {"product_id": book.pk, "quantity": 1, "op": "add"},
+                {"product_id": pen.pk, "quantity": 2},
+                {"product_id": 9999, "quantity": 1},
+                {"product_id": mug.pk, "quantity": 1, "op": "set"},
+            ],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 207)
+        statuses = [result["status"] for result in response.data["results"]]
+        self.assertEqual(statuses, ["ok", "ok", "error", "error", "ok"])
+        self.assertEqual(response.data["results"][2]["error"], "Insufficient stock. Only 1 left.")
+        self.assertEqual(Decimal(response.data["cart"]["total_price"][0]), Decimal("34.00"))
+
+        stock = dict(Product.objects.values_list("name", "in_stock"))
+        self.assertEqual(stock, {"Book": 2, "Pen": 1, "Mug": 4})
+        self.assertEqual(StockReservation.objects.count(), 2)
+
+    def test_batch_remove_and_query_count(self):
+        products = [self.make_product(name=f"P{i}") for i in range(10)]
+        self.client.post(
+            "/cart/batch/",
+            [{"product_id": p.pk, "quantity": 1} for p in products],
+            format="json",
+        )
+        # savepoint, cart, in_bulk, items, restock, delete (3), totals,
+        # response cart + items, release: the same for any number of lines
+        with self.assertNumQueries(12):
+            response = self.client.post(
+                "/cart/batch/",
+                {"items": [{"product_id": p.pk, "op": "remove"} for p in products]},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["cart"]["items"], [])
+        self.assertEqual(set(Product.objects.values_list("in_stock", flat=True)), {100})
+
+    def test_batch_rejects_malformed_lines(self):
+        response = self.client.post(
+            "/cart/batch/", [{"product_id": 1, "op": "set"}], format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+# --- Inventory --- #
+class InventoryTests(CartTestMixin, TestCase):
+    def test_take_stock_refuses_to_oversell(self):
+        product = self.make_product(in_stock=3)
+        inventory.take_stock(product.pk, 2)
+        with self.assertRaises(inventory.InsufficientStock) as ctx:
+            inventory.take_stock(product.pk, 2)
+        self.assertEqual(ctx.exception.available, 1)
+        product.refresh_from_db()
+        self.assertEqual(product.in_stock, 1)
+
+    def test_clear_active_cart_restocks_in_one_update(self):
+        cart = Cart.objects.create(user=self.user)
+        self.fill_cart(cart, 5)
+        # read the lines + a single UPDATE for every product
+        with self.assertNumQueries(2):
+            inventory.restock_many(cart.items.values_list("product_id", "quantity"))
+        self.assertEqual(set(Product.objects.values_list("in_stock", flat=True)), {102})
+
+        response = self.client.post("/cart/clear_active_cart/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(set(Product.objects.values_list("in_stock", flat=True)), {104})
+
+    def test_add_item_reports_insufficient_stock(self):
+        product = self.make_product(in_stock=1)
+        response = self.client.post("/cart/add_item/", {"product_id": product.pk, "quantity": 2})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], "Insufficient stock. Only 1 left.")
+
+
+class ShardedStockTests(CartTestMixin, TestCase):
+    def shards(self, product):
+        return list(StockShard.objects.filter(product=product).order_by("shard").values_list("in_stock", flat=True))
+
+    def test_shard_and_unshard(self):
+        product = self.make_product(in_stock=10)
+        self.assertEqual(inventory.shard_stock(product.pk, 4), 10)
+        product.refresh_from_db()
+        self.assertEqual((product.in_stock, product.stock_shards), (0, 4))
+        self.assertEqual(self.shards(product), [3, 3, 2, 2])
+        self.assertEqual(inventory.stock_level(product.pk), 10)
+
+        inventory.shard_stock(product.pk, 0)
+        product.refresh_from_db()
+        self.assertEqual((product.in_stock, product.stock_shards), (10, 0))
+        self.assertEqual(self.shards(product), [])
+
+    def test_cart_takes_from_and_gives_back_to_shards(self):
+        product = self.make_product(in_stock=100)
+        inventory.shard_stock(product.pk, 4)
+        self.client.post("/cart/add_item/", {"product_id": product.pk, "quantity": 3})
+        self.assertEqual(sorted(self.shards(product)), [22, 25, 25, 25])
+        self.assertEqual(self.client.get(f"/products/{product.pk}/").data["in_stock"], 97)
+
+        self.client.post("/cart/remove_item/", {"product_id": product.pk, "quantity": 1})
+        self.assertEqual(inventory.stock_level(product.pk), 98)
+        self.client.post("/cart/clear_active_cart/")
+        self.assertEqual(inventory.stock_level(product.pk), 100)
+        product.refresh_from_db()
+        self.assertEqual(product.in_stock, 0)
+
+    def test_low_shards_are_rebalanced(self):
+        product = self.make_product(in_stock=8)
+        inventory.shard_stock(product.pk, 4)  # 2 per shard
+        inventory.take_stock(product.pk, 3)  # no shard holds 3
+        self.assertEqual(self.shards(product), [2, 1, 1, 1])
+
+        with self.assertRaises(inventory.InsufficientStock) as ctx:
+            inventory.take_stock(product.pk, 6)
+        self.assertEqual(ctx.exception.available, 5)
+        self.assertEqual(sum(self.shards(product)), 5)
+
+    def test_stock_writes_reset_the_shards(self):
+        product = self.make_product(in_stock=10)
+        product.sku = "HOT-1"
+        product.save()
+        inventory.shard_stock(product.pk, 2)
+        self.user.is_staff = True
+        self.user.save()
+
+        response = self.client.patch(f"/products/{product.pk}/", {"in_stock": 7}, format="json")
+        self.assertEqual(response.data["in_stock"], 7)
+        self.assertEqual(self.shards(product), [4, 3])
+
+        path = os.path.join(tempfile.mkdtemp(), "catalog.jsonl")
+        with open(path, "w") as f:
+            f.write(json.dumps({"sku": "HOT-1", "name": "Hot", "price": "1.00", "in_stock": 5}) + "\n")
+        call_command("import_products", path, stdout=StringIO())
+        self.assertEqual(self.shards(product), [3, 2])
+        self.assertEqual(inventory.stock_level(product.pk), 5)
+
+
+class ReservationTests(CartTestMixin, TestCase):
+    def test_expired_reservations_give_stock_back(self):
+        kept = self.make_product(name="Kept", price="5.00", in_stock=10)
+        stale = self.make_product(name="Stale", price="2.00", in_stock=10)
+        self.client.post("/cart/add_item/", {"product_id": kept.pk, "quantity": 1})
+        self.client.post("/cart/add_item/", {"product_id": stale.pk, "quantity": 3})
+        cart = Cart.objects.get(user=self.user, status="Active")
+        StockReservation.objects.filter(cart_item__product=stale).update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+
+        stats = inventory.expire_reservations(batch_size=1)
+
+        self.assertEqual(stats, {"batches": 1, "items": 1, "units": 3, "carts": 1})
+        stale.refresh_from_db()
+        self.assertEqual(stale.in_stock, 10)
+        self.assertEqual(list(cart.items.values_list("product", flat=True)), [kept.pk])
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.total_amount), (1, Decimal("5.00")))
+
+    def test_paid_carts_are_not_swept(self):
+        product = self.make_product(in_stock=10)
+        self.client.post("/cart/add_item/", {"product_id": product.pk, "quantity": 2})
+        Cart.objects.update(status="Paid")
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        out = StringIO()
+        call_command("expire_reservations", stdout=out)
+
+        self.assertIn("reclaimed 0 unit(s)", out.getvalue())
+        product.refresh_from_db()
+        self.assertEqual(product.in_stock, 8)
+
+    def test_carts_being_paid_keep_their_stock(self):
+        product = self.make_product(in_stock=10)
+        self.client.post("/cart/add_item/", {"product_id": product.pk, "quantity": 2})
+        Cart.objects.update(payment_intent_id="pi_1")
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(inventory.expire_reservations()["units"], 0)  # the webhook may still come
+
+        PaymentEvent.objects.create(
+            event_id="evt_1", type="payment_intent.payment_failed", payment_intent_id="pi_1", created=timezone.now()
+        )
+        self.assertEqual(inventory.expire_reservations()["units"], 2)
+        product.refresh_from_db()
+        self.assertEqual(product.in_stock, 10)
+
+    def test_abandoned_payments_give_stock_back_after_the_hold(self):
+        product = self.make_product(in_stock=10)
+        self.client.post("/cart/add_item/", {"product_id": product.pk, "quantity": 2})
+        Cart.objects.update(payment_intent_id="pi_1")
+        StockReservation.objects.update(
+            expires_at=timezone.now() - settings.CART_PAYMENT_HOLD - timedelta(minutes=1)
+        )
+
+        self.assertEqual(inventory.expire_reservations()["units"], 2)
+
+
+class InventoryConcurrencyTests(TransactionTestCase):
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 25
+    STOCK = 60
+
+    def test_hot_product_is_never_oversold(self):
+        product = Product.objects.create(
+            name="Hot", description="", price=Decimal("1.00"), in_stock=self.STOCK
+        )
+        self.assertEqual(self.buy_concurrently(product), self.STOCK)
+        product.refresh_from_db()
+        self.assertEqual(product.in_stock, 0)
+
+    def test_sharded_hot_product_is_never_oversold(self):
+        product = Product.objects.create(
+            name="Hot", description="", price=Decimal("1.00"), in_stock=self.STOCK
+        )
+        inventory.shard_stock(product.pk, 4)
+        self.assertEqual(self.buy_concurrently(product), self.STOCK)
+        self.assertEqual(inventory.stock_level(product.pk), 0)
+
+    def test_contention_benchmark_runs(self):
+        out = StringIO()
+        call_command("benchmark_stock_contention", threads=2, seconds=0.2, hold_ms=0, stdout=out)
+        self.assertIn("sharded / single row", out.getvalue())
+
+    def buy_concurrently(self, product):
+        sold = []
+        start = threading.Barrier(self.THREADS)
+
+        def buyer():
+            start.wait()
+            try:
+                for _ in range(self.ATTEMPTS_PER_THREAD):
+                    while True:
+                        try:
+                            inventory.take_stock(product.pk, 1)
+                            sold.append(1)
+                        except inventory.InsufficientStock:
+                            pass
+                        except OperationalError:
+                            # SQLite serializes writers; retry when the table is locked
+                            continue
+                        break
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return len(sold)
+
+
+# --- Catalog cache --- #
+class CatalogCacheTests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.anonymous = APIClient()
+        self.product = self.make_product(name="Lamp", price="30.00", in_stock=4)
+
+    def test_list_is_served_from_cache_until_catalog_changes(self):
+        first = self.anonymous.get("/products/", {"ordering": "price", "page": 1})
+        with self.assertNumQueries(0):
+            # same query string in another order hits the same entry
+            cached = self.anonymous.get("/products/?page=1&ordering=price")
+        self.assertEqual(cached.data, first.data)
+
+        self.make_product(name="Desk")
+        fresh = self.anonymous.get("/products/?page=1&ordering=price")
+        self.assertEqual(fresh.data["count"], 2)
+
+    def test_category_and_m2m_writes_invalidate(self):
+        self.anonymous.get("/products/")
+        other = Category.objects.create(name="Lighting")
+        self.product.category.add(other)
+        response = self.anonymous.get("/products/")
+        self.assertEqual(response.data["results"][0]["category"], ["Books", "Lighting"])
+
+    def test_detail_reads_live_stock(self):
+        url = f"/products/{self.product.pk}/"
+        self.anonymous.get(url)
+        inventory.take_stock(self.product.pk, 3)  # F() update, no signal
+        with self.assertNumQueries(1):
+            response = self.anonymous.get(url)
+        self.assertEqual(response.data["in_stock"], 1)
+        self.assertEqual(self.anonymous.get("/products/9999/").status_code, 404)
+
+    def test_concurrent_miss_waits_for_lock_holder(self):
+        key = "catalog:test"
+        cache.add(f"{key}:lock", 1)
+        timer = threading.Timer(0.1, cache.set, args=(key, "filled"))
+        timer.start()
+        computed = []
+        value = catalog_cache.get_or_compute(key, lambda: computed.append(1) or "mine")
+        timer.join()
+        self.assertEqual(value, "filled")
+        self.assertEqual(computed, [])
+
+
+# --- Conditional GET --- #
+class ConditionalGetTests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.product = self.make_product(name="Lamp", in_stock=4)
+
+    def test_product_list_etag(self):
+        etag = self.client.get("/products/")["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get("/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        self.make_product(name="Desk")
+        self.assertEqual(self.client.get("/products/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_product_detail_etag(self):
+        url = f"/products/{self.product.pk}/"
+        first = self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+        inventory.take_stock(self.product.pk, 1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["in_stock"], 3)
+
+    def test_product_detail_has_no_last_modified(self):
+        # stock changes leave updated_at alone, a date check would serve stale stock
+        url = f"/products/{self.product.pk}/"
+        self.assertNotIn("Last-Modified", self.client.get(url))
+        inventory.take_stock(self.product.pk, 1)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["in_stock"], 3)
+
+    def test_my_cart_etag_follows_cart_revision(self):
+        self.client.post("/cart/add_item/", {"product_id": self.product.pk})
+        etag = self.client.get("/cart/my_cart/")["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get("/cart/my_cart/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post("/cart/add_item/", {"product_id": self.product.pk})
+        response = self.client.get("/cart/my_cart/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["items"][0]["quantity"], 2)
+
+    def test_my_cart_etag_follows_product_renames(self):
+        self.client.post("/cart/add_item/", {"product_id": self.product.pk})
+        etag = self.client.get("/cart/my_cart/")["ETag"]
+
+        self.product.name = "Renamed"
+        self.product.save()
+        response = self.client.get("/cart/my_cart/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["items"][0]["product"]["name"], "Renamed")
+
+
+# --- Keyset pagination --- #
+class KeysetPaginationTests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # duplicate prices make the id tiebreaker matter
+        for i in range(25):
+            self.make_product(name=f"P{i:02}", price=f"{i % 4}.00")
+
+    def walk(self, url):
+        names = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("count", response.data)
+            names += [row["name"] for row in response.data["results"]]
+            last = response
+            url = response.data["next"]
+        return names, last
+
+    def test_walks_every_row_once_in_order(self):
+        names, last = self.walk("/products/?paginate=cursor&ordering=-price")
+        expected = list(
+            Product.objects.order_by("-price", "-id").values_list("name", flat=True)
+        )
+        self.assertEqual(names, expected)
+
+        previous = self.client.get(last.data["previous"])
+        self.assertEqual(
+            [row["name"] for row in previous.data["results"]], expected[10:20]
+        )
+
+    def test_deep_page_runs_no_count_or_offset(self):
+        first = self.client.get("/products/?paginate=cursor&ordering=price")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first.data["next"])
+        sql = " ".join(query["sql"] for query in queries).upper()
+        self.assertNotIn("COUNT(", sql)
+        self.assertNotIn("OFFSET", sql)
+
+    def test_approximate_count_and_bad_cursor(self):
+        response = self.client.get("/products/?paginate=cursor&count=approx")
+        self.assertEqual(response.data["count"], 25)
+        self.assertTrue(response.data["count_is_approximate"])
+        self.assertEqual(self.client.get("/products/?cursor=garbage").status_code, 404)
+
+    def test_page_numbers_still_default(self):
+        response = self.client.get("/products/?page=3")
+        self.assertEqual(response.data["count"], 25)
+        self.assertEqual(len(response.data["results"]), 5)
+
+
+# --- Full-text search --- #
+class ProductSearchTests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        lamp = self.make_product(name="Desk lamp", price="40.00")
+        lamp.description = "Warm LED light for reading"
+        lamp.save()
+        self.make_product(name="Reading glasses", price="15.00")
+        self.make_product(name="Oak desk", price="250.00")
+
+    def names(self, **params):
+        response = self.client.get("/products/", params)
+        self.assertEqual(response.status_code, 200)
+        return [row["name"] for row in response.data["results"]]
+
+    def test_ranks_name_matches_first(self):
+        self.assertEqual(self.names(search="reading"), ["Reading glasses", "Desk lamp"])
+
+    def test_prefix_match_and_syntax_is_escaped(self):
+        self.assertEqual(self.names(search='des"*('), ["Oak desk", "Desk lamp"])
+
+    def test_combines_with_filters_and_ordering(self):
+        self.assertEqual(self.names(search="desk", max_price="100"), ["Desk lamp"])
+        self.assertEqual(self.names(search="desk", ordering="-price"), ["Oak desk", "Desk lamp"])
+
+    def test_index_follows_updates_and_deletes(self):
+        product = Product.objects.get(name="Oak desk")
+        product.name = "Oak table"
+        product.save()
+        self.assertEqual(self.names(search="table"), ["Oak table"])
+        product.delete()
+        self.assertEqual(self.names(search="oak"), [])
+
+
+# --- Schema: constraints and query plans --- #
+class ActiveCartConstraintTests(CartTestMixin, TestCase):
+    def test_second_active_cart_is_rejected(self):
+        Cart.objects.create(user=self.user)
+        Cart.objects.create(user=self.user, status="Paid")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cart.objects.create(user=self.user)
+
+    def test_get_active_cart_reuses_the_single_cart(self):
+        first = get_active_cart(self.user)
+        self.assertEqual(get_active_cart(self.user).pk, first.pk)
+
+
+class QueryPlanTests(CartTestMixin, TestCase):
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(
+            any(name in plan for name in index_names),
+            f"expected one of {index_names} in plan:\n{plan}",
+        )
+
+    def test_active_cart_lookup(self):
+        self.assertUsesIndex(
+            Cart.objects.filter(user=self.user, status="Active"),
+            "one_active_cart_per_user",
+            "cart_user_status_created_idx",
+        )
+
+    def test_order_history(self):
+        self.assertUsesIndex(
+            Cart.objects.filter(user=self.user).order_by("status", "-created_at"),
+            "cart_user_status_created_idx",
+        )
+
+    def test_catalog_ordering_and_price_filter(self):
+        self.assertUsesIndex(Product.objects.order_by("price", "id"), "product_price_id_idx")
+        self.assertUsesIndex(
+            Product.objects.order_by("-created_at", "-id"), "product_created_id_idx"
+        )
+        self.assertUsesIndex(
+            Product.objects.filter(price__gte=10, price__lte=20), "product_price_id_idx"
+        )
+
+
+# --- Authentication user cache --- #
+class AuthUserCacheTests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        user_cache.clear()
+        revoked_tokens.is_revoked("warm-up")  # load the revocation filter
+        self.client = APIClient()
+        self.client.cookies["access_token"] = str(AccessToken.for_user(self.user))
+
+    def test_user_is_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.client.get("/user/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/user/")
+        self.assertEqual(response.data["username"], "buyer")
+
+    def test_password_change_and_deactivation_invalidate(self):
+        self.client.get("/user/")
+        self.user.set_password("another-pass-123")
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.client.get("/user/")
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/user/").status_code, 401)
+
+    def test_catalog_reads_are_stateless(self):
+        self.client.get("/products/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/products/")
+        self.assertEqual(response.status_code, 200)
+
+
+# --- Token revocation --- #
+class RevokedTokenTests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        revoked_tokens.reset()
+        self.client = APIClient()
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client.cookies["refresh_token"] = str(self.refresh)
+        self.client.cookies["access_token"] = str(self.refresh.access_token)
+
+    def test_logout_revokes_refresh_and_access_tokens(self):
+        old_cookies = {key: morsel.value for key, morsel in self.client.cookies.items()}
+        self.assertEqual(self.client.get("/user/").status_code, 200)
+        self.client.post("/logout/")
+
+        for key, value in old_cookies.items():
+            self.client.cookies[key] = value
+        self.assertEqual(self.client.get("/user/").status_code, 401)
+        self.assertEqual(self.client.post("/refresh/").status_code, 401)
+
+    def test_refresh_rotates_and_rejects_reuse(self):
+        response = self.client.post("/refresh/")
+        self.assertEqual(response.status_code, 200)
+        new_refresh = response.cookies["refresh_token"].value
+        self.assertNotEqual(new_refresh, str(self.refresh))
+
+        self.client.cookies["refresh_token"] = str(self.refresh)
+        self.assertEqual(self.client.post("/refresh/").status_code, 401)
+        self.client.cookies["refresh_token"] = new_refresh
+        self.assertEqual(self.client.post("/refresh/").status_code, 200)
+
+    def test_refresh_rotated_by_another_worker_is_refused(self):
+        revoked_tokens.is_revoked("warm-up")  # this worker's filter is loaded
+        # the same cookie just rotated elsewhere, not synced here yet
+        RevokedToken.objects.create(jti=self.refresh["jti"], expires_at=timezone.now() + timedelta(days=1))
+        response = self.client.post("/refresh/")
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn("access_token", response.cookies)
+
+    def test_unrevoked_check_needs_no_query_and_expired_rows_are_pruned(self):
+        revoked_tokens.is_revoked("warm-up")
+        with self.assertNumQueries(0):
+            self.assertFalse(revoked_tokens.is_revoked("never-revoked"))
+
+        RevokedToken.objects.create(jti="old", expires_at=timezone.now() - timedelta(days=1))
+        with self.settings(REVOKED_TOKENS={**settings.REVOKED_TOKENS, "PRUNE_INTERVAL": 0}):
+            revoked_tokens.reset()
+            revoked_tokens.is_revoked("anything")
+        self.assertFalse(RevokedToken.objects.filter(jti="old").exists())
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        items = [f"jti-{i}" for i in range(1000)]
+        for item in items:
+            bloom.add(item)
+        self.assertTrue(all(item in bloom for item in items))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class AsyncAuthViewTests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        hashing_pool.reset()
+        self.addCleanup(hashing_pool.reset)
+        self.factory = AsyncRequestFactory()
+
+    async def login(self, password):
+        request = self.factory.post(
+            "/login/", {"username": "buyer", "password": password}, content_type="application/json"
+        )
+        return await AsyncLoginView.as_view()(request)
+
+    async def test_login_sets_cookies(self):
+        response = await self.login("pass12345")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access_token", response.cookies)
+        self.assertIn("refresh_token", response.cookies)
+
+        self.assertEqual((await self.login("wrong")).status_code, 401)
+
+    async def test_register_hashes_password(self):
+        request = self.factory.post(
+            "/register/",
+            {"username": "newbie", "email": "new@example.com", "password": "pw123456", "password2": "pw123456"},
+            content_type="application/json",
+        )
+        response = await AsyncRegisterView.as_view()(request)
+        self.assertEqual(response.status_code, 201)
+        user = await User.objects.aget(username="newbie")
+        self.assertTrue(user.check_password("pw123456"))
+
+    async def test_login_through_the_asgi_middleware_chain(self):
+        # every middleware async capable: no sync_to_async hop per request
+        with self.settings(DEBUG=True), self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler()
+        with self.settings(ROOT_URLCONF="ecommerce.management.commands.benchmark_login_storm"):
+            response = await AsyncClient().post(
+                "/bench/async-login/", {"username": "buyer", "password": "pass12345"}, content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access_token", response.cookies)
+
+    async def test_saturated_pool_answers_503(self):
+        with self.settings(AUTH_HASHING={**settings.AUTH_HASHING, "MAX_PENDING": 1, "RETRY_AFTER": 7}):
+            hashing_pool.reset()
+            _, slots = hashing_pool._ensure_started()
+            slots.acquire()  # a login already hashing
+            try:
+                response = await self.login("pass12345")
+            finally:
+                slots.release()
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response["Retry-After"], "7")
+            self.assertEqual((await self.login("pass12345")).status_code, 200)
+
+
+class LoginStormBenchmarkTests(TransactionTestCase):
+    def test_benchmark_runs_past_the_login_rate(self):
+        rates = {**settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"], "login": "1/min"}
+        out = StringIO()
+        with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": rates}):
+            call_command("benchmark_login_storm", requests=2, concurrency=2, stdout=out)
+        self.assertIn("async login", out.getvalue())
+
+
+class PaymentGatewayTests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        options = {**settings.PAYMENT_GATEWAY, "BACKEND": "ecommerce.payments.FakeGateway"}
+        overrider = self.settings(PAYMENT_GATEWAY=options)
+        overrider.enable()
+        self.addCleanup(overrider.disable)
+        self.product = self.make_product(price="12.50")
+        self.client.post("/cart/batch/", [{"product_id": self.product.id, "quantity": 2}], format="json")
+
+    def test_retried_checkout_reuses_the_intent(self):
+        first = self.client.post("/cart/checkout/").json()
+        self.assertEqual(self.client.post("/cart/checkout/").json()["clientSecret"], first["clientSecret"])
+
+        self.client.post("/cart/batch/", [{"product_id": self.product.id, "quantity": 1}], format="json")
+        changed = self.client.post("/cart/checkout/").json()
+        self.assertNotEqual(changed["clientSecret"], first["clientSecret"])
+        self.assertEqual(get_gateway().backend.intents[changed["clientSecret"].removesuffix("_secret")]["amount"], 3750)
+
+    def test_open_breaker_fails_fast_with_503(self):
+        gateway = get_gateway()
+        for _ in range(gateway.breaker.threshold):
+            gateway.breaker.record_failure()
+        response = self.client.post("/cart/checkout/")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(gateway.backend.intents, {})
+
+    def test_breaker_half_opens_after_reset_timeout(self):
+        breaker = CircuitBreaker(threshold=2, reset_timeout=0)
+        failing = [PaymentUnavailable("down")] * 2
+
+        def call():
+            if failing:
+                raise failing.pop()
+            return "ok"
+
+        for _ in range(2):
+            with self.assertRaises(PaymentUnavailable):
+                breaker.call(call)
+        self.assertEqual(breaker.state, "half-open")
+        self.assertEqual(breaker.call(call), "ok")
+        self.assertEqual(breaker.state, "closed")
+
+        breaker = CircuitBreaker(threshold=1, reset_timeout=60)
+        breaker.record_failure()
+        with self.assertRaises(PaymentUnavailable):
+            breaker.call(self.fail)  # not called while open
+
+    def test_stripe_errors_are_classified(self):
+        gateway = StripeGateway(settings.PAYMENT_GATEWAY)
+
+        def raising(exc):
+            def call(*args, **kwargs):
+                raise exc
+            return call
+
+        with self.assertRaises(PaymentUnavailable):
+            gateway._call(raising(stripe.APIConnectionError("timed out")))
+        with self.assertRaises(PaymentUnavailable):
+            gateway._call(raising(stripe.APIError("boom", http_status=502)))
+        with self.assertRaises(PaymentError) as caught:
+            gateway._call(raising(stripe.InvalidRequestError("bad amount", None, http_status=400)))
+        self.assertNotIsInstance(caught.exception, PaymentUnavailable)
+
+
+class StripeWebhookTests(CartTestMixin, TestCase):
+    SECRET = "whsec_test"
+
+    def setUp(self):
+        super().setUp()
+        options = {**settings.PAYMENT_GATEWAY, "BACKEND": "ecommerce.payments.FakeGateway"}
+        overrider = self.settings(PAYMENT_GATEWAY=options, STRIPE_WEBHOOK_SECRET=self.SECRET)
+        overrider.enable()
+        self.addCleanup(overrider.disable)
+        product = self.make_product(price="12.50")
+        self.client.post("/cart/batch/", [{"product_id": product.id, "quantity": 2}], format="json")
+        self.intent_id = self.client.post("/cart/checkout/").json()["clientSecret"].removesuffix("_secret")
+        self.cart = Cart.objects.get(user=self.user)
+
+    def send(self, event_id, event_type, secret=SECRET):
+        intent = get_gateway().backend.intents[self.intent_id]
+        payload = json.dumps({
+            "id": event_id,
+            "object": "event",
+            "type": event_type,
+            "created": int(time.time()),
+            "data": {"object": {**intent, "object": "payment_intent"}},
+        })
+        timestamp = int(time.time())
+        signature = hmac.new(
+            secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256
+        ).hexdigest()
+        return APIClient().post(
+            "/webhooks/stripe/",
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+        )
+
+    def confirm(self):
+        return self.client.post("/cart/confirm_payment/", {"payment_intent_id": self.intent_id})
+
+    def test_succeeded_event_freezes_cart_into_order(self):
+        self.assertEqual(self.cart.payment_intent_id, self.intent_id)
+        self.assertEqual(self.confirm().status_code, 202)
+
+        self.assertEqual(self.send("evt_1", "payment_intent.succeeded").status_code, 200)
+        self.assertFalse(Cart.objects.filter(pk=self.cart.pk).exists())
+        self.assertFalse(StockReservation.objects.exists())
+        order = Order.objects.get(source_cart=self.cart.pk)
+        self.assertEqual((order.payment_intent_id, order.total_amount), (self.intent_id, Decimal("25.00")))
+
+        with self.assertNumQueries(2):  # order + lines
+            response = self.confirm()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["order"]["id"], order.pk)
+
+    def test_replayed_and_out_of_order_events_are_safe(self):
+        self.send("evt_1", "payment_intent.succeeded")
+        self.send("evt_1", "payment_intent.succeeded")
+        self.send("evt_2", "payment_intent.succeeded")  # a second delivery path
+        self.send("evt_0", "payment_intent.payment_failed")  # older failure arriving late
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(PaymentEvent.objects.count(), 3)
+        self.assertEqual(self.confirm().status_code, 200)
+
+    def test_payment_for_an_edited_cart_is_not_converted(self):
+        expensive = self.make_product(name="Expensive", price="500.00")
+        self.client.post("/cart/add_item/", {"product_id": expensive.pk, "quantity": 1})
+        stock = Product.objects.get(pk=expensive.pk).in_stock
+
+        with self.assertLogs("ecommerce.views.webhooks", "ERROR"):
+            self.assertEqual(self.send("evt_1", "payment_intent.succeeded").status_code, 200)
+        cart = Cart.objects.get(pk=self.cart.pk)
+        self.assertEqual((cart.status, cart.item_count, cart.total_amount), ("Active", 3, Decimal("525.00")))
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(PaymentEvent.objects.filter(event_id="evt_1", cart=cart).exists())
+        self.assertEqual(Product.objects.get(pk=expensive.pk).in_stock, stock)
+        self.assertEqual(self.confirm().status_code, 409)
+
+    def test_order_total_is_the_amount_charged(self):
+        cart = Cart.objects.get(pk=self.cart.pk)
+        with self.assertRaises(OrderTotalMismatch):
+            freeze_carts([cart], amounts={cart.pk: Decimal("24.99")})
+
+        self.send("evt_1", "payment_intent.succeeded")
+        order = Order.objects.get(source_cart=self.cart.pk)
+        charged = get_gateway().backend.intents[self.intent_id]["amount"]
+        self.assertEqual(order.total_amount * 100, charged)
+        self.assertEqual(sum(line.subtotal for line in order.lines.all()), order.total_amount)
+
+    def test_payment_whose_lines_disagree_is_left_for_review(self):
+        # changed behind the cart's back: its stored total is what was charged
+        CartItem.objects.filter(cart=self.cart).update(quantity=3)
+
+        with self.assertLogs("ecommerce.views.webhooks", "ERROR"):
+            self.assertEqual(self.send("evt_1", "payment_intent.succeeded").status_code, 200)
+        self.assertEqual(self.send("evt_1", "payment_intent.succeeded").status_code, 200)  # not redelivered again
+        self.assertEqual(Cart.objects.get(pk=self.cart.pk).status, "Active")
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(PaymentEvent.objects.filter(event_id="evt_1").exists())
+        self.assertEqual(self.confirm().status_code, 409)
+
+    def test_bad_signature_is_rejected(self):
+        response = self.send("evt_1", "payment_intent.succeeded", secret="whsec_other")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentEvent.objects.exists())
+        self.assertEqual(Cart.objects.get(pk=self.cart.pk).status, "Active")
+
+
+class OrderHistoryTests(CartTestMixin, TestCase):
+    def test_orders_keep_the_price_they_were_paid_at(self):
+        product = self.make_product(name="Lamp", price="10.00")
+        for _ in range(3):
+            cart = Cart.objects.create(user=self.user, status="Paid")
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        other = User.objects.create_user(username="other", password="pass12345")
+        Cart.objects.create(user=other, status="Paid")
+        Cart.objects.create(user=self.user)  # live carts stay
+
+        out = StringIO()
+        call_command("freeze_paid_carts", batch_size=2, stdout=out)
+        self.assertIn("Froze 4 paid cart(s) into orders in 2 batch(es)", out.getvalue())
+        self.assertEqual(list(Cart.objects.values_list("status", flat=True)), ["Active"])
+
+        product.price = Decimal("99.00")
+        product.save()
+
+        with self.assertNumQueries(3):  # count + orders + lines
+            response = self.client.get("/orders/")
+        self.assertEqual(response.data["count"], 3)
+        first = response.data["results"][0]
+        self.assertEqual(Decimal(first["total_amount"]), Decimal("20.00"))
+        self.assertEqual(first["lines"][0]["product_name"], "Lamp")
+        self.assertEqual(Decimal(first["lines"][0]["unit_price"]), Decimal("10.00"))
+
+        call_command("freeze_paid_carts", stdout=StringIO())  # nothing left to do
+        self.assertEqual(Order.objects.count(), 4)
+
+    def test_order_history_uses_index(self):
+        plan = Order.objects.filter(user=self.user).order_by("-paid_at", "-id").explain()
+        self.assertIn("order_user_paid_idx", plan)
+
+
+class DatasetBenchmarkTests(TestCase):
+    def generate(self, seed=7):
+        call_command(
+            "generate_dataset", products=60, categories=4, users=6, active_carts=3, orders=5,
+            batch_size=25, seed=seed, clear=True, stdout=StringIO(),
+        )
+        return list(Product.objects.order_by("pk").values_list("name", "price", "in_stock"))
+
+    def test_dataset_is_deterministic(self):
+        first = self.generate()
+        self.assertEqual(len(first), 60)
+        self.assertEqual(Cart.objects.filter(status="Active", item_count__gt=0).count(), 3)
+        self.assertEqual(Order.objects.count(), 5)
+        self.assertEqual(self.generate(), first)
+        self.assertNotEqual(self.generate(seed=8), first)
+
+    def test_benchmark_saves_and_compares_baseline(self):
+        self.generate()
+        path = os.path.join(tempfile.mkdtemp(), "baseline.json")
+        self.addCleanup(os.remove, path)
+        call_command("benchmark_api", requests=3, warmup=1, save=path, stdout=StringIO())
+        with open(path) as f:
+            scenarios = json.load(f)["scenarios"]
+        self.assertEqual(sum(result["errors"] for result in scenarios.values()), 0)
+        self.assertGreater(scenarios["add_item"]["queries"], 0)
+
+        with open(path, "w") as f:
+            json.dump({"scenarios": {"my_cart": {"p95_ms": 1e6, "queries": 0.01}}}, f)
+        with self.assertRaisesMessage(CommandError, "my_cart queries"):
+            call_command("benchmark_api", requests=3, warmup=0, scenario=["my_cart"], compare=path, stdout=StringIO())
+
+
+class ImportProductsTests(CartTestMixin, TestCase):
+    def write(self, name, text):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_csv_upserts_links_categories_and_rejects_bad_rows(self):
+        existing = self.make_product(name="Old name", price="10.00")
+        Product.objects.filter(pk=existing.pk).update(sku="SKU-1")
+        self.client.post("/cart/add_item/", {"product_id": existing.pk, "quantity": 2})
+        path = self.write("catalog.csv", (
+            "sku,name,description,price,in_stock,categories\n"
+            "SKU-1,New name,,12.50,7,Books|Lamps\n"
+            "SKU-2,Desk lamp,Bright,30,3,Lamps\n"
+            ",No sku,,1,1,\n"
+            "SKU-3,Bad price,,abc,1,\n"
+        ))
+        version = catalog_cache.catalog_version()
+
+        out = StringIO()
+        call_command("import_products", path, stdout=out)
+
+        self.assertIn("Imported 2 product(s) from 4 row(s)", out.getvalue())
+        existing.refresh_from_db()
+        # 7 on hand, 2 of them in the cart
+        self.assertEqual((existing.name, existing.price, existing.in_stock), ("New name", Decimal("12.50"), 5))
+        self.assertEqual(
+            sorted(existing.category.values_list("name", flat=True)), ["Books", "Lamps"]
+        )
+        self.assertEqual(Product.objects.get(sku="SKU-2").category.get().name, "Lamps")
+        self.assertEqual(Cart.objects.get(user=self.user).total_amount, Decimal("25.00"))
+        self.assertNotEqual(catalog_cache.catalog_version(), version)
+        with open(path + ".rejects.csv") as f:
+            rejects = f.read()
+        self.assertIn("sku is required", rejects)
+        self.assertIn("invalid price 'abc'", rejects)
+
+    def test_jsonl_batches_use_a_fixed_number_of_queries(self):
+        lines = [
+            json.dumps({"sku": f"J-{i}", "name": f"Item {i}", "price": "1.00", "categories": ["Books"]})
+            for i in range(40)
+        ]
+        path = self.write("catalog.jsonl", "\n".join(lines + ["{not json"]) + "\n")
+
+        # the category and sharded product lookups once, then per batch:
+        # savepoint, existing rows, upsert, delete + insert links, release
+        # (no cart totals: no price changed)
+        with self.assertNumQueries(2 * 6 + 2):
+            call_command("import_products", path, batch_size=20, stdout=StringIO())
+
+        self.assertEqual(Product.objects.filter(sku__startswith="J-").count(), 40)
+        with open(path + ".rejects.jsonl") as f:
+            self.assertIn("invalid JSON", json.loads(f.readline())["error"])
+
+
+    def test_reimport_at_the_same_price_leaves_carts_alone(self):
+        product = self.make_product(name="Lamp", price="10.00")
+        Product.objects.filter(pk=product.pk).update(sku="SKU-1")
+        self.client.post("/cart/add_item/", {"product_id": product.pk})
+        revision = Cart.objects.get(user=self.user).revision
+        path = self.write("catalog.csv", "sku,name,description,price,in_stock,categories\nSKU-1,Lamp,,10.00,5,\n")
+
+        call_command("import_products", path, stdout=StringIO())
+
+        # a payment in flight is checked against the revision
+        self.assertEqual(Cart.objects.get(user=self.user).revision, revision)
+        product.refresh_from_db()
+        self.assertEqual(product.in_stock, 4)
+
+class CatalogExportTests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+        self.user.save()
+        for i in range(5):
+            product = self.make_product(name=f"Item {i}")
+            product.category.add(self.category)
+
+    def lines(self, response):
+        return b"".join(response.streaming_content).decode().splitlines()
+
+    def test_staff_only(self):
+        self.client.force_authenticate(User.objects.create_user(username="shopper"))
+        self.assertEqual(self.client.get("/products/export/").status_code, 403)
+        self.assertEqual(self.client.get("/products/export/?output=xml").status_code, 403)
+
+    def test_ndjson_and_csv(self):
+        response = self.client.get("/products/export/")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in self.lines(response)]
+        self.assertEqual([row["name"] for row in rows], [f"Item {i}" for i in range(5)])
+        self.assertEqual(rows[0]["categories"], ["Books"])
+
+        response = self.client.get("/products/export/?output=csv")
+        lines = self.lines(response)
+        self.assertTrue(lines[0].startswith("id,sku,name,description,price"))
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(self.client.get("/products/export/?output=xml").status_code, 400)
+
+    def test_gzip_and_since(self):
+        response = self.client.get("/products/export/", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(len(gzip.decompress(b"".join(response.streaming_content)).splitlines()), 5)
+
+        since = timezone.now()
+        Product.objects.filter(name="Item 3").update(updated_at=since + timedelta(seconds=1))
+        response = self.client.get("/products/export/", {"since": since.isoformat()})
+        rows = [json.loads(line) for line in self.lines(response)]
+        self.assertEqual([row["name"] for row in rows], ["Item 3"])
+        # stock moves without touching updated_at, incremental rows don't claim it
+        self.assertNotIn("in_stock", rows[0])
+        response = self.client.get("/products/export/", {"since": since.isoformat(), "output": "csv"})
+        self.assertNotIn("in_stock", self.lines(response)[0])
+        self.assertEqual(self.client.get("/products/export/?since=yesterday").status_code, 400)
+
+    def test_queries_per_chunk_are_constant(self):
+        for i in range(5, 9):
+            self.make_product(name=f"Item {i}").category.add(self.category)
+        ProductViewSet.EXPORT_CHUNK_SIZE = 3
+        self.addCleanup(setattr, ProductViewSet, "EXPORT_CHUNK_SIZE", 2000)
+        response = self.client.get("/products/export/")
+        # one cursor over the products, then one category prefetch per chunk
+        with self.assertNumQueries(1 + 3):
+            self.assertEqual(len(self.lines(response)), 9)
+
+
+class MetricsTests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        metrics_registry.reset()
+        self.addCleanup(metrics_registry.reset)
+
+    def scrape(self, **headers):
+        with self.settings(DEBUG=True):  # open without a token
+            response = self.client.get("/metrics", **headers)
+        return response, response.content.decode()
+
+    def test_routes_are_recorded_with_queries_and_size(self):
+        self.make_product()
+        self.client.get("/products/")
+        self.client.post("/cart/add_item/", {"product_id": 1, "quantity": 1})
+        self.client.get("/nowhere/")
+
+        response, body = self.scrape()
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        labels = 'view="product-list",method="GET",status="200"'
+        self.assertIn(f'ecommerce_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1', body)
+        self.assertIn(f"ecommerce_http_request_db_queries_count{{{labels}}} 1", body)
+        self.assertIn(f"ecommerce_http_request_serializer_seconds_total{{{labels}}}", body)
+        self.assertIn('view="cart-add-item",method="POST",status="201"', body)
+        self.assertIn('view="unmatched",method="GET",status="404"', body)
+        self.assertNotIn(f"ecommerce_http_request_db_queries_sum{{{labels}}} 0", body)
+
+    def test_server_timing_is_opt_in(self):
+        self.assertNotIn("Server-Timing", self.client.get("/products/"))
+        with self.settings(METRICS={**settings.METRICS, "SERVER_TIMING": True}):
+            timing = self.client.get("/products/")["Server-Timing"]
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_token_protects_the_endpoint(self):
+        with self.settings(METRICS={**settings.METRICS, "TOKEN": "s3cret"}):
+            self.assertEqual(self.scrape()[0].status_code, 401)
+            self.assertEqual(self.scrape(HTTP_AUTHORIZATION="Bearer s3cret")[0].status_code, 200)
+
+    def test_closed_without_a_token(self):
+        with self.settings(METRICS={**settings.METRICS, "TOKEN": None}):
+            self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+    def test_overhead_benchmark_runs(self):
+        out = StringIO()
+        call_command("benchmark_metrics", requests=4, rounds=2, stdout=out)
+        self.assertIn("product-list", out.getvalue())
+
+
+class FastSerializerParityTests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        lamps = Category.objects.create(name="Lamps")
+        art = Category.objects.create(name="Art")
+        for i, price in enumerate(["10.00", "0.50", "1234.56", "7.10"]):
+            product = self.make_product(name=f"Lamp \u2028 n\u00ba{i}", price=price)
+            product.category.add(*[lamps, art][: i % 3])
+        for product in Product.objects.order_by("-pk")[:3]:
+            self.client.post("/cart/add_item/", {"product_id": product.pk, "quantity": 2})
+
+    def test_fast_list_views_set_values_and_rows(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "fast_list_rows"):
+            type("HalfFastViewSet", (FastListMixin,), {"fast_list_values": ("id",)})
+
+    def both(self, path, params=None):
+        bodies = []
+        for fast in (False, True):
+            catalog_cache.bump_catalog_version()
+            with self.settings(FAST_SERIALIZERS=fast):
+                response = self.client.get(path, params or {})
+            self.assertEqual(response.status_code, 200)
+            bodies.append(response.content)
+        return bodies
+
+    def test_responses_are_byte_identical(self):
+        for path, params in [
+            ("/products/", {}),
+            ("/products/", {"ordering": "-price", "category": self.category.pk}),
+            ("/products/", {"search": "lamp", "paginate": "cursor"}),
+            ("/cart/", {}),
+            ("/cart/my_cart/", {}),
+        ]:
+            slow, fast = self.both(path, params)
+            self.assertEqual(slow, fast, (path, params))
+        self.assertIn(b"\\u2028", fast)
+
+    def test_cursor_pages_match(self):
+        ProductPagination.page_size = 2
+        self.addCleanup(delattr, ProductPagination, "page_size")
+        slow, fast = self.both("/products/", {"paginate": "cursor", "ordering": "price"})
+        self.assertEqual(slow, fast)
+        cursor = parse_qs(urlsplit(json.loads(fast)["next"]).query)["cursor"][0]
+        self.assertEqual(*self.both("/products/", {"cursor": cursor, "ordering": "price"}))
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            "decimal": Decimal("12.50"),
+            "when": timezone.now(),
+            "day": timezone.now().date(),
+            "text": "\u00e9t\u00e9 \u2029",
+            "tuple": (Decimal("1.10"), 2),
+            1: [None, True, 1.5, 2**40],
+            "big": 2**70,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, "application/json; indent=2"),
+            JSONRenderer().render(data, "application/json; indent=2"),
+        )
+
+    def test_fast_list_queries(self):
+        # page count + page rows + one query for every category on the page
+        catalog_cache.bump_catalog_version()
+        with self.assertNumQueries(3):
+            self.client.get("/products/")
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    # a second local SQLite database stands in for the read replica; the two
+    # hold different rows, so each response shows which one served it. It is
+    # added for this class only, which "__all__" then picks up.
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(tempfile.mkdtemp(), "replica.sqlite3")
+        replica = {"ENGINE": "django.db.backends.sqlite3", "NAME": path}
+        connections.settings["replica"] = connections.configure_settings(
+            {"default": {}, "replica": replica}
+        )["replica"]
+        call_command("migrate", database="replica", verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+
+    def setUp(self):
+        routing = {**settings.REPLICA_ROUTING, "ALIASES": ["replica"]}
+        self.enterContext(self.settings(REPLICA_ROUTING=routing))
+        self.user = User.objects.create_user(username="buyer", password="pass12345")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(name="On primary", description="", price=Decimal("5.00"), in_stock=10)
+        Product.objects.using("replica").create(
+            pk=self.product.pk, name="On replica", description="", price=Decimal("5.00"), in_stock=10
+        )
+        cache.clear()
+
+    def names(self):
+        cache.clear()  # the catalog cache would hide where the rows came from
+        return [row["name"] for row in self.client.get("/products/").json()["results"]]
+
+    def test_catalog_reads_go_to_the_replica(self):
+        self.assertEqual(self.names(), ["On replica"])
+        self.assertEqual(self.client.get(f"/products/{self.product.pk}/").json()["name"], "On replica")
+        # not a replica-read view: the cart is read on the primary
+        self.client.post("/cart/add_item/", {"product_id": self.product.pk, "quantity": 1})
+        self.client.cookies.clear()
+        cart = self.client.get("/cart/my_cart/").json()
+        self.assertEqual(cart["items"][0]["product"]["name"], "On primary")
+        with self.settings(REPLICA_ROUTING={**settings.REPLICA_ROUTING, "ALIASES": []}):
+            self.assertEqual(self.names(), ["On primary"])
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        response = self.client.post("/cart/add_item/", {"product_id": self.product.pk, "quantity": 3})
+        cookie = response.cookies[settings.REPLICA_ROUTING["COOKIE_NAME"]]
+        self.assertEqual(cookie["max-age"], settings.REPLICA_ROUTING["STICKY_SECONDS"])
+        cache.clear()
+        detail = self.client.get(f"/products/{self.product.pk}/").json()
+        self.assertEqual((detail["name"], detail["in_stock"]), ("On primary", 7))
+
+        self.client.cookies.clear()
+        self.assertEqual(self.names(), ["On replica"])
+
+    def test_catalog_writes_pin_everyone_to_the_primary(self):
+        catalog_cache.bump_catalog_version()
+        self.assertEqual(self.client.get("/products/").json()["results"][0]["name"], "On primary")
+
+    def test_streamed_export_reads_the_replica(self):
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get("/products/export/")
+        # the rows are read as the body is consumed, after the middleware returned
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["name"] for line in lines], ["On replica"])
+
+    async def test_replica_reads_under_asgi(self):
+        client = AsyncClient()
+        response = await client.get("/products/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["name"] for row in response.json()["results"]], ["On replica"])
+        detail = await client.get(f"/products/{self.product.pk}/")
+        self.assertEqual(detail.json()["name"], "On replica")
+
+        await User.objects.filter(pk=self.user.pk).aupdate(is_staff=True)
+        client.cookies["access_token"] = str(AccessToken.for_user(self.user))
+        response = await client.get("/products/export/")
+        # consumed the way ASGIHandler sends it, in a thread after the view returned
+        lines = b"".join([chunk async for chunk in response]).decode().splitlines()
+        self.assertEqual([json.loads(line)["name"] for line in lines], ["On replica"])
+
+
+class TokenBucketThrottleTests(CartTestMixin, TestCase):
+    RATES = {"login": "2/min", "register": "2/min", "add_item": "3/min", "checkout": "1/min"}
+
+    def setUp(self):
+        super().setUp()
+        rest_framework = {**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": self.RATES}
+        overrides = self.settings(REST_FRAMEWORK=rest_framework)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.now = 1_000_000.0
+        TokenBucketThrottle.timer = lambda throttle: self.now
+        self.addCleanup(delattr, TokenBucketThrottle, "timer")
+
+    def login(self):
+        return APIClient().post("/login/", {"username": "buyer", "password": "wrong"})
+
+    def test_login_burst_then_retry_after(self):
+        self.assertEqual([self.login().status_code for _ in range(2)], [401, 401])
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")  # one token every 30s
+
+        self.now += 30
+        self.assertEqual(self.login().status_code, 401)
+        self.assertEqual(self.login().status_code, 429)
+
+    def test_hammering_does_not_extend_the_lockout(self):
+        for _ in range(2):
+            self.login()
+        for _ in range(50):
+            response = self.login()
+            self.assertEqual(response.status_code, 429)
+            self.assertLessEqual(int(response["Retry-After"]), 60)  # one period at most
+        self.now += int(response["Retry-After"])
+        self.assertEqual(self.login().status_code, 401)
+
+    def test_add_item_is_per_user_and_shared_with_batch(self):
+        product = self.make_product()
+        add_item = {"product_id": product.pk, "quantity": 1}
+        self.assertEqual([self.client.post("/cart/add_item/", add_item).status_code for _ in range(2)], [201, 200])
+        self.assertEqual(self.client.post("/cart/batch/", [add_item], format="json").status_code, 200)
+        self.assertEqual(self.client.post("/cart/add_item/", add_item).status_code, 429)
+        self.assertEqual(self.client.get("/cart/my_cart/").status_code, 200)  # reads aren't limited
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username="other", password="pass12345"))
+        self.assertEqual(other.post("/cart/add_item/", add_item).status_code, 201)
+
+    def test_checkout_is_throttled(self):
+        self.client.post("/cart/checkout/")
+        response = self.client.post("/cart/checkout/")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "60")
+
+    async def test_async_login_is_throttled(self):
+        async def login():
+            request = AsyncRequestFactory().post(
+                "/login/", {"username": "buyer", "password": "wrong"}, content_type="application/json"
+            )
+            return await AsyncLoginView.as_view()(request)
+
+        hashing_pool.reset()
+        self.addCleanup(hashing_pool.reset)
+        self.assertEqual([(await login()).status_code for _ in range(2)], [401, 401])
+        response = await login()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+
+    def test_benchmark_runs(self):
+        out = StringIO()
+        call_command("benchmark_throttles", checks=50, rate="10/min", stdout=out)
+        self.assertIn("TokenBucketThrottle  over limit", out.getvalue())
+
+
+class IdempotencyKeyTests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        options = {**settings.PAYMENT_GATEWAY, "BACKEND": "ecommerce.payments.FakeGateway"}
+        overrider = self.settings(PAYMENT_GATEWAY=options)
+        overrider.enable()
+        self.addCleanup(overrider.disable)
+        self.product = self.make_product(in_stock=10)
+
+    def add_item(self, key, quantity=1):
+        return self.client.post(
+            "/cart/add_item/", {"product_id": self.product.pk, "quantity": quantity}, HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retried_add_item_is_replayed(self):
+        first = self.add_item("k1")
+        retry = self.add_item("k1")
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((retry.status_code, retry.content), (201, first.content))
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertNotIn("Idempotent-Replayed", first)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.in_stock, 9)
+
+        self.assertEqual(self.add_item("k2").status_code, 200)  # a new key runs again
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.in_stock, 8)
+
+    def test_replay_runs_no_view_queries(self):
+        self.add_item("k1")
+        with CaptureQueriesContext(connection) as queries:
+            self.add_item("k1")
+        tables = " ".join(query["sql"] for query in queries.captured_queries)
+        self.assertNotIn("ecommerce_product", tables)
+        self.assertNotIn("ecommerce_cart", tables)
+
+    def test_retried_checkout_creates_one_intent(self):
+        self.add_item("k1", quantity=2)
+        first = self.client.post("/cart/checkout/", HTTP_IDEMPOTENCY_KEY="pay-1")
+        retry = self.client.post("/cart/checkout/", HTTP_IDEMPOTENCY_KEY="pay-1")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(len(get_gateway().backend.intents), 1)
+
+    def test_key_reused_for_another_request_is_refused(self):
+        self.add_item("k1")
+        self.assertEqual(self.add_item("k1", quantity=2).status_code, 422)
+        self.assertEqual(self.client.post("/cart/checkout/", HTTP_IDEMPOTENCY_KEY="k1").status_code, 422)
+        self.assertEqual(self.add_item("x" * 256).status_code, 400)
+
+    def test_key_in_progress(self):
+        self.add_item("k1")
+        record = IdempotencyKey.objects.get()
+        IdempotencyKey.objects.update(status_code=None)  # as if still running
+        with self.settings(IDEMPOTENCY={**settings.IDEMPOTENCY, "WAIT": 0}):
+            self.assertEqual(self.add_item("k1").status_code, 409)
+
+            # left in progress by a request that died: taken over
+            IdempotencyKey.objects.filter(pk=record.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+            self.assertEqual(self.add_item("k1").status_code, 200)
+        self.assertEqual(IdempotencyKey.objects.get(pk=record.pk).status_code, 200)
+
+    def test_failures_are_not_stored(self):
+        self.add_item("k1")
+        gateway = get_gateway()
+        for _ in range(gateway.breaker.threshold):
+            gateway.breaker.record_failure()
+        self.assertEqual(self.client.post("/cart/checkout/", HTTP_IDEMPOTENCY_KEY="pay-1").status_code, 503)
+        self.assertFalse(IdempotencyKey.objects.filter(key="pay-1").exists())
+
+    def test_crash_before_the_response_is_stored_rolls_back(self):
+        class CrashingCartViewSet(CartViewSet):
+            def finalize_response(self, request, response, *args, **kwargs):
+                raise RuntimeError("worker died")
+
+        request = APIRequestFactory().post(
+            "/cart/add_item/", {"product_id": self.product.pk}, format="json", HTTP_IDEMPOTENCY_KEY="k1"
+        )
+        force_authenticate(request, self.user)
+        with self.assertRaises(RuntimeError):
+            CrashingCartViewSet.as_view({"post": "add_item"})(request)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.in_stock, 10)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.assertEqual(self.add_item("k1").status_code, 201)  # the retry runs it once
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.in_stock, 9)
+
+    def test_expired_keys_run_again(self):
+        self.add_item("k1")
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.add_item("k1").status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.in_stock, 8)
+
+
+class IdempotencyConcurrencyTests(TransactionTestCase):
+    def test_concurrent_duplicate_waits_for_the_first(self):
+        user = User.objects.create_user(username="buyer", password="pass12345")
+        product = Product.objects.create(name="P", description="", price=Decimal("5.00"), in_stock=10)
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=product, quantity=1)
+        Cart.objects.filter(pk=cart.pk).rebuild_totals()
+        # the first checkout sits in the gateway while the duplicate arrives
+        options = {**settings.PAYMENT_GATEWAY, "BACKEND": "ecommerce.payments.FakeGateway", "LATENCY": 0.3}
+        responses = {}
+
+        def checkout(name, delay):
+            time.sleep(delay)
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                responses[name] = client.post("/cart/checkout/", HTTP_IDEMPOTENCY_KEY="pay-1")
+            finally:
+                connection.close()
+
+        with self.settings(PAYMENT_GATEWAY=options):
+            # warm up (urlconf, views) so the first one reaches the gateway
+            # before the duplicate arrives; in-memory SQLite can't queue writers
+            warm = APIClient()
+            warm.force_authenticate(user)
+            warm.get("/cart/my_cart/")
+            threads = [
+                threading.Thread(target=checkout, args=("first", 0)),
+                threading.Thread(target=checkout, args=("duplicate", 0.1)),
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(get_gateway().backend.intents), 1)
+
+        self.assertEqual(responses["first"].status_code, 200)
+        self.assertEqual(responses["duplicate"].content, responses["first"].content)
+        self.assertEqual(responses["duplicate"]["Idempotent-Replayed"], "true")
@@ -0,0 +1,86 @@
+import math
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import ScopedRateThrottle, SimpleRateThrottle
+
+
+# Token buckets kept in the cache, so every worker sharing it (Redis via
+# REDIS_URL) enforces one limit. A bucket is a single integer, the time in
+# milliseconds at which it will be full again (GCRA, "theoretical arrival
+# time"); a request adds one token's worth of time to it. While a client is
+# using its bucket that is one atomic cache.incr() per check, where
+# SimpleRateThrottle reads, trims and writes back a list of timestamps
+# (two round trips, and a pickled list as long as the rate).
+#
+# A rate of "10/min" is a bucket of 10 requests refilled at one every 6
+# seconds. Rejected requests give their token back, so a client that keeps
+# hammering (or an office behind one IP) gets in again at the rate, and
+# Retry-After is never more than one token's worth of time.
+
+KEY_TTL_PERIODS = 10  # idle buckets are dropped after this many periods
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    cache_format = "throttle:bucket:%(scope)s:%(ident)s"
+
+    def get_rate(self):
+        # read when called, so rates changed with override_settings apply
+        self.THROTTLE_RATES = api_settings.DEFAULT_THROTTLE_RATES
+        return super().get_rate()
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        interval = max(1, round(self.duration * 1000 / self.num_requests))  # ms per token
+        capacity = interval * self.num_requests
+        now = int(self.timer() * 1000)
+        full_at = self.consume(now, interval)
+        allowed = full_at - now <= capacity
+        if not allowed:
+            # refund: charging rejections would push the bucket out without bound
+            try:
+                self.cache.decr(self.key, interval)
+            except ValueError:
+                pass  # evicted in between
+            full_at -= interval
+        # the next request fits once another token's worth of time has passed
+        self.wait_ms = full_at + interval - capacity - now
+        return allowed
+
+    def consume(self, now, interval):
+        try:
+            full_at = self.cache.incr(self.key, interval)
+        except ValueError:
+            full_at = None
+        if full_at is None and self.cache.add(self.key, now + interval, self.duration * KEY_TTL_PERIODS):
+            return now + interval
+        if full_at is None:
+            # another worker created the bucket in between
+            full_at = self.cache.incr(self.key, interval)
+        if full_at < now + interval:
+            # the bucket had been full for a while, count from now; a
+            # concurrent request lost here is at most one token given away
+            self.cache.set(self.key, now + interval, self.duration * KEY_TTL_PERIODS)
+            return now + interval
+        return full_at
+
+    def wait(self):
+        return math.ceil(self.wait_ms / 1000) if self.wait_ms > 0 else None
+
+
+class ScopedTokenBucketThrottle(ScopedRateThrottle, TokenBucketThrottle):
+    """
+    Token bucket per client for views with a `throttle_scope`, at the rate
+    REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"] sets for it. Clients are the
+    user when authenticated, the IP address otherwise.
+    """
+
+    def get_cache_key(self, request, view):
+        # plain Django requests (the async auth views) may have no user
+        user = getattr(request, "user", None)
+        ident = user.pk if user is not None and user.is_authenticated else self.get_ident(request)
+        return self.cache_format % {"scope": self.scope, "ident": ident}
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
@@ -6,19 +7,29 @@ from .views import (
     ProductViewSet,
     CartViewSet,
     CartItemViewSet,
+    OrderViewSet,
     RegisterView,
     LoginView,
+    AsyncRegisterView,
+    AsyncLoginView,
     LogoutView,
     UserView,
     CookieTokenRefreshView,
+    StripeWebhookView,
+    metrics_view,
 )
 
 
+# under ASGI, login/register hash passwords off the event loop (see hashing.py)
+if settings.ASYNC_AUTH_VIEWS:
+    RegisterView, LoginView = AsyncRegisterView, AsyncLoginView
+
 app_name = "products"
 router = DefaultRouter()
 router.register(r"products", ProductViewSet, basename="product")
 router.register(r"cart", CartViewSet, basename="cart")
 router.register(r"cart_items", CartItemViewSet, basename="cart_items")
+router.register(r"orders", OrderViewSet, basename="orders")
 
 urlpatterns = [
     # Main API routes
@@ -30,4 +41,8 @@ urlpatterns = [
     path("logout/", LogoutView.as_view(), name="logout"),
     path("refresh/", CookieTokenRefreshView.as_view(), name="token_refresh"),
     path("api-auth/", include("rest_framework.urls")),
+    # Payment provider callbacks
+    path("webhooks/stripe/", StripeWebhookView.as_view(), name="stripe_webhook"),
+    # Prometheus scrape target, no trailing slash by convention
+    path("metrics", metrics_view, name="metrics"),
 ]
@@ -1,3 +1,7 @@
 from .auth import LoginView, RegisterView, LogoutView, UserView, CookieTokenRefreshView
+from .auth_async import AsyncLoginView, AsyncRegisterView
 from .product import ProductViewSet
 from .cart import CartViewSet, CartItemViewSet
+from .order import OrderViewSet
+from .webhooks import StripeWebhookView
+from .metrics import metrics_view
@@ -4,9 +4,12 @@ from rest_framework.response import Response
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.conf import settings
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 
+from ..revocation import revoked_tokens
+from ..throttling import ScopedTokenBucketThrottle
 from ..serializers import UserRegistrationSerializer, UserDetailSerializer
 
 
@@ -19,16 +22,42 @@ def get_tokens_for_user(user):
     }
 
 
+def set_auth_cookies(response, tokens):
+    # Set Access Token Cookie
+    response.set_cookie(
+        key="access_token",
+        value=tokens["access"],
+        httponly=True,
+        secure=not settings.DEBUG,
+        samesite="Lax",
+        max_age=3600,  # 1 hour
+    )
+
+    # Set Refresh Token Cookie
+    response.set_cookie(
+        key="refresh_token",
+        value=tokens["refresh"],
+        httponly=True,
+        secure=not settings.DEBUG,
+        samesite="Lax",
+        max_age=604800,  # 7 days
+    )
+
+
 # --- Registration --- #
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [ScopedTokenBucketThrottle]
+    throttle_scope = "register"
     serializer_class = UserRegistrationSerializer
 
 
 # --- Login Authentication --- #
 class LoginView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [ScopedTokenBucketThrottle]
+    throttle_scope = "login"
 
     def post(self, request) -> Response:
         username = request.data.get("username")
@@ -41,25 +70,7 @@ class LoginView(APIView):
                 {"message": "Login successful"}, status=status.HTTP_200_OK
             )
 
-            # Set Access Token Cookie
-            response.set_cookie(
-                key="access_token",
-                value=tokens["access"],
-                httponly=True,
-                secure=not settings.DEBUG,
-                samesite="Lax",
-                max_age=3600,  # 1 hour
-            )
-
-            # Set Refresh Token Cookie
-            response.set_cookie(
-                key="refresh_token",
-                value=tokens["refresh"],
-                httponly=True,
-                secure=not settings.DEBUG,
-                samesite="Lax",
-                max_age=604800,  # 7 days
-            )
+            set_auth_cookies(response, tokens)
             return response
 
         return Response(
@@ -69,6 +80,19 @@ class LoginView(APIView):
 
 class LogoutView(APIView):
     def post(self, request) -> Response:
+        # revoke both tokens so copies of the cookies stop working too
+        for cookie, token_class in (
+            ("refresh_token", RefreshToken),
+            ("access_token", AccessToken),
+        ):
+            raw_token = request.COOKIES.get(cookie)
+            if not raw_token:
+                continue
+            try:
+                revoked_tokens.revoke(token_class(raw_token))
+            except TokenError:
+                pass  # expired or invalid, nothing to revoke
+
         response = Response({"message": "Logout successful"})
         response.delete_cookie("access_token")
         response.delete_cookie("refresh_token")
@@ -90,12 +114,36 @@ class CookieTokenRefreshView(APIView):
         try:
             refresh = RefreshToken(refresh_token)
 
+            # 2. Refuse tokens that were logged out or already rotated. A
+            # rotated token is used up here, before anything is issued: of
+            # concurrent refreshes with it, on any worker, only one gets through
+            rotate = jwt_settings.ROTATE_REFRESH_TOKENS
+            if rotate and jwt_settings.BLACKLIST_AFTER_ROTATION:
+                if not revoked_tokens.claim(refresh):
+                    raise InvalidToken("Token is revoked")
+            elif revoked_tokens.is_revoked(refresh[jwt_settings.JTI_CLAIM], exact=True):
+                raise InvalidToken("Token is revoked")
+
             new_access_token = str(refresh.access_token)
 
             response = Response(
                 {"message": "Access token refreshed"}, status=status.HTTP_200_OK
             )
 
+            # 3. Rotate the refresh token, the old one can't be used again
+            if rotate:
+                refresh.set_jti()
+                refresh.set_exp()
+                refresh.set_iat()
+                response.set_cookie(
+                    key="refresh_token",
+                    value=str(refresh),
+                    httponly=True,
+                    secure=not settings.DEBUG,
+                    samesite="Lax",
+                    max_age=604800,  # 7 days
+                )
+
             # 4. Set the NEW Access Token in the cookie
             response.set_cookie(
                 key="access_token",
@@ -0,0 +1,150 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import User
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+
+from ..hashing import HashingSaturated, hashing_pool
+from ..serializers import UserRegistrationSerializer
+from ..throttling import ScopedTokenBucketThrottle
+from .auth import get_tokens_for_user, set_auth_cookies
+
+
+# Async twins of RegisterView and LoginView for the ASGI entry point (routed
+# by urls.py when ASYNC_AUTH_VIEWS is on). Database access goes through the
+# async ORM and password hashing through hashing_pool, so a login spike no
+# longer occupies the thread every sync view shares under ASGI.
+
+
+def read_payload(request):
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+def saturated_response(exc):
+    response = JsonResponse(
+        {"error": "Too many logins in progress, try again shortly"},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    response["Retry-After"] = str(exc.retry_after)
+    return response
+
+
+async def throttled_response(request, view):
+    # the same buckets as the DRF views; request.user may need the database
+    throttle = ScopedTokenBucketThrottle()
+    if await sync_to_async(throttle.allow_request)(request, view):
+        return None
+    response = JsonResponse(
+        {"error": "Too many requests, try again later"},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+    )
+    response["Retry-After"] = str(throttle.wait())
+    return response
+
+
+def malformed_response():
+    return JsonResponse(
+        {"error": "Malformed request body"}, status=status.HTTP_400_BAD_REQUEST
+    )
+
+
+def verify_password(password, encoded):
+    # runs on the hashing pool; also returns the re-hashed password when the
+    # stored one uses outdated hasher settings, like User.check_password does
+    upgraded = []
+    valid = check_password(password, encoded, setter=lambda raw: upgraded.append(make_password(raw)))
+    return valid, upgraded[0] if upgraded else None
+
+
+# --- Registration --- #
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncRegisterView(View):
+    http_method_names = ["post"]
+    throttle_scope = "register"
+
+    async def post(self, request):
+        throttled = await throttled_response(request, self)
+        if throttled is not None:
+            return throttled
+        data = read_payload(request)
+        if data is None:
+            return malformed_response()
+
+        serializer = UserRegistrationSerializer(data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        validated = serializer.validated_data
+        try:
+            encoded = await hashing_pool.run(make_password, validated["password"])
+        except HashingSaturated as exc:
+            return saturated_response(exc)
+
+        # same normalisation as UserManager.create_user
+        user = User(
+            username=User.normalize_username(validated["username"]),
+            email=User.objects.normalize_email(validated.get("email")),
+            password=encoded,
+        )
+        await user.asave()
+        return JsonResponse(
+            UserRegistrationSerializer(user).data, status=status.HTTP_201_CREATED
+        )
+
+
+# --- Login Authentication --- #
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncLoginView(View):
+    http_method_names = ["post"]
+    throttle_scope = "login"
+
+    async def post(self, request):
+        throttled = await throttled_response(request, self)
+        if throttled is not None:
+            return throttled
+        data = read_payload(request)
+        if data is None:
+            return malformed_response()
+        username = data.get("username")
+        password = data.get("password")
+
+        user = None
+        if username is not None and password is not None:
+            try:
+                user = await User._default_manager.aget(**{User.USERNAME_FIELD: username})
+            except User.DoesNotExist:
+                pass
+
+        try:
+            if user is None:
+                if password is not None:
+                    # hash anyway so unknown usernames take as long as wrong
+                    # passwords (same as ModelBackend)
+                    await hashing_pool.run(make_password, password)
+                valid = False
+            else:
+                valid, upgraded = await hashing_pool.run(verify_password, password, user.password)
+                if valid and upgraded:
+                    await User._default_manager.filter(pk=user.pk).aupdate(password=upgraded)
+        except HashingSaturated as exc:
+            return saturated_response(exc)
+
+        if not valid or not user.is_active:
+            return JsonResponse(
+                {"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED
+            )
+
+        response = JsonResponse({"message": "Login successful"}, status=status.HTTP_200_OK)
+        set_auth_cookies(response, get_tokens_for_user(user))
+        return response
@@ -3,35 +3,93 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied
 from django.db import transaction
+from django.db.models import prefetch_related_objects
 from django.shortcuts import get_object_or_404
 from django.conf import settings
-import stripe
 
-from ..models import Cart, CartItem, Product
-from ..serializers import CartSerializer, CartItemSerializer
+from .. import inventory
+from ..payments import PaymentError, PaymentUnavailable, checkout_idempotency_key, get_gateway
+from ..catalog_cache import catalog_version
+from ..conditional import make_etag, not_modified, set_validators
+from ..models import Cart, CartItem, Order, PaymentEvent, Product, cart_items_prefetch
+from ..serializers import CartSerializer, CartItemSerializer, CartBatchLineSerializer, OrderSerializer
+from ..serializers.fast import CART_VALUES, cart_rows, cart_values
+from ..idempotency import idempotent
+from ..metrics import timed
+from ..throttling import ScopedTokenBucketThrottle
+from .mixins import FastListMixin
+from .webhooks import PAYMENT_FAILED, PAYMENT_SUCCEEDED
 
-def get_active_cart(user):
-    cart, created = Cart.objects.get_or_create(user=user, status="Active")
+def get_active_cart(user, queryset=None):
+    if queryset is None:
+        queryset = Cart.objects.all()
+    cart, created = queryset.get_or_create(user=user, status="Active")
+    # the cart belongs to `user`, spare the serializer a query for it
+    cart.user = user
     return cart
 
+
+def get_cart_for_response(cart):
+    # re-read the cart with items/products/categories prefetched for serializing
+    return Cart.objects.with_items().get(pk=cart.pk)
+
+
+def payment_unavailable_response(exc):
+    response = Response(
+        {"error": "Payment provider unavailable, try again shortly"},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    if exc.retry_after:
+        response["Retry-After"] = str(exc.retry_after)
+    return response
+
 class CartViewSet(
+    FastListMixin,
     mixins.ListModelMixin,
     viewsets.GenericViewSet,
 ):
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
+    fast_list_values = CART_VALUES
+    fast_list_rows = staticmethod(cart_rows)
+    throttle_scope = None  # set by the throttled actions
     permission_classes = [permissions.IsAuthenticated]
+    BATCH_MAX_LINES = 100
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user).order_by("status", "-created_at")
+        return (
+            Cart.objects.filter(user=self.request.user)
+            .with_items()
+            .order_by("status", "-created_at")
+        )
 
     @action(detail=False, methods=["get"], url_path="my_cart")
     def retrieve_active_cart(self, request):
         cart = get_active_cart(request.user)
-        serializer = self.get_serializer(cart)
-        return Response(serializer.data)
+        # lines carry product names and categories, which move the
+        # catalog version rather than the cart's revision
+        etag = make_etag("cart", cart.pk, cart.revision, catalog_version())
+        response = not_modified(request, etag=etag)
+        if response is not None:
+            return response
+
+        if settings.FAST_SERIALIZERS:
+            with timed("serialize"):
+                data = cart_rows([cart_values(cart)])[0]
+        else:
+            prefetch_related_objects([cart], cart_items_prefetch())
+            data = self.get_serializer(cart).data
+        return set_validators(Response(data), etag=etag)
 
-    @action(detail=False, methods=["post"], serializer_class=CartItemSerializer, url_path="add_item")
+    @action(
+        detail=False,
+        methods=["post"],
+        serializer_class=CartItemSerializer,
+        url_path="add_item",
+        throttle_classes=[ScopedTokenBucketThrottle],
+        throttle_scope="add_item",
+    )
+    @idempotent
     def add_item(self, request):
         user = request.user
         product_id = request.data.get("product_id")
@@ -46,23 +104,24 @@ class CartViewSet(
         if not product_id: return Response({"error": "Product ID is required."}, status=400)
 
         with transaction.atomic():
-            cart = get_active_cart(user)
+            cart = get_active_cart(user, Cart.objects.select_for_update())
             if cart.status != "Active": return Response({"error": "Cart is closed."}, status=403)
 
             product = get_object_or_404(Product, pk=product_id)
-            if product.in_stock < quantity:
-                return Response({"error": f"Insufficient stock. Only {product.in_stock} left."}, status=400)
+            try:
+                inventory.take_stock(product.pk, quantity)
+            except inventory.InsufficientStock as e:
+                return Response({"error": str(e)}, status=400)
 
             cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product, defaults={"quantity": 0})
             
             cart_item.quantity += quantity
             cart_item.save()
-            
-            product.in_stock -= quantity
-            product.save()
+            inventory.reserve(cart_item)
+
+            cart.adjust_totals(quantity, product.price)
 
-            cart.refresh_from_db()
-            serializer = CartSerializer(cart)
+            serializer = CartSerializer(get_cart_for_response(cart))
             return Response(serializer.data, status=200 if not created else 201)
 
     @action(detail=False, methods=["post"], url_path="remove_item")
@@ -73,11 +132,11 @@ class CartViewSet(
         if not product_id: return Response({"error": "Product ID required"}, status=400)
 
         with transaction.atomic():
-            cart = get_active_cart(request.user)
+            cart = get_active_cart(request.user, Cart.objects.select_for_update())
             if cart.status != "Active": return Response({"error": "Cart closed"}, status=403)
 
             try:
-                cart_item = CartItem.objects.get(cart=cart, product_id=product_id)
+                cart_item = CartItem.objects.select_related("cart", "product").get(cart=cart, product_id=product_id)
             except CartItem.DoesNotExist:
                 return Response({"error": "Item not found"}, status=404)
 
@@ -94,73 +153,188 @@ class CartViewSet(
                 else:
                     cart_item.quantity -= qty
                     cart_item.save()
-                    cart_item.product.in_stock += qty
-                    cart_item.product.save()
+                    inventory.restock(cart_item.product_id, qty)
+                    cart.adjust_totals(-qty, cart_item.product.price)
                     msg = "Quantity updated."
             else:
                 self._delete_item(cart_item)
                 msg = "Item removed completely."
 
-            cart.refresh_from_db()
-            serializer = CartSerializer(cart)
+            serializer = CartSerializer(get_cart_for_response(cart))
             return Response({"message": msg, "cart": serializer.data})
 
+    # shares the add_item bucket, a batch adds items too
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="batch",
+        throttle_classes=[ScopedTokenBucketThrottle],
+        throttle_scope="add_item",
+    )
+    @idempotent
+    def batch(self, request):
+        # body: [{"product_id": 1, "quantity": 2, "op": "add"}, ...] (or {"items": [...]})
+        lines = request.data.get("items") if isinstance(request.data, dict) else request.data
+        if not isinstance(lines, list) or not lines:
+            return Response({"error": "A non-empty list of items is required."}, status=400)
+        if len(lines) > self.BATCH_MAX_LINES:
+            return Response({"error": f"At most {self.BATCH_MAX_LINES} items per batch."}, status=400)
+
+        line_serializer = CartBatchLineSerializer(data=lines, many=True)
+        line_serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            cart = get_active_cart(request.user, Cart.objects.select_for_update())
+            if cart.status != "Active": return Response({"error": "Cart closed"}, status=403)
+            results = self._apply_batch(cart, line_serializer.validated_data)
+
+            serializer = CartSerializer(get_cart_for_response(cart))
+
+        failed = any(result["status"] == "error" for result in results)
+        return Response(
+            {"results": results, "cart": serializer.data},
+            status=status.HTTP_207_MULTI_STATUS if failed else status.HTTP_200_OK,
+        )
+
+    def _apply_batch(self, cart, lines):
+        products = Product.objects.only("pk").in_bulk({line["product_id"] for line in lines})
+        items = {item.product_id: item for item in CartItem.objects.filter(cart=cart)}
+        original = {product_id: item.quantity for product_id, item in items.items()}
+
+        # play the lines against in-memory quantities; only stock is touched per line
+        quantities = dict(original)
+        restocks = []
+        results = []
+        for line in lines:
+            product_id, op = line["product_id"], line["op"]
+            result = {"product_id": product_id, "op": op}
+            results.append(result)
+
+            if product_id not in products:
+                result.update(status="error", error="Product not found.")
+                continue
+            current = quantities.get(product_id, 0)
+            if op == "add":
+                new_qty = current + line.get("quantity", 1)
+            elif op == "set":
+                new_qty = line["quantity"]
+            else:
+                if not current:
+                    result.update(status="error", error="Item not found.")
+                    continue
+                new_qty = max(current - line["quantity"], 0) if line.get("quantity") else 0
+
+            diff = new_qty - current
+            try:
+                if diff > 0:
+                    inventory.take_stock(product_id, diff)
+            except inventory.InsufficientStock as e:
+                result.update(status="error", error=str(e))
+                continue
+            if diff < 0:
+                restocks.append((product_id, -diff))
+
+            quantities[product_id] = new_qty
+            result.update(status="ok", quantity=new_qty)
+
+        inventory.restock_many(restocks)
+
+        # write the net result of the batch with a few bulk statements
+        to_create, to_update, to_delete = [], [], []
+        for product_id, qty in quantities.items():
+            if qty == original.get(product_id, 0):
+                continue
+            if qty == 0:
+                to_delete.append(items[product_id].pk)
+            elif product_id in items:
+                items[product_id].quantity = qty
+                to_update.append(items[product_id])
+            else:
+                to_create.append(CartItem(cart=cart, product_id=product_id, quantity=qty))
+
+        CartItem.objects.filter(pk__in=to_delete).delete()
+        CartItem.objects.bulk_update(to_update, ["quantity"])
+        created = CartItem.objects.bulk_create(to_create)
+        inventory.reserve_many(to_update + created)
+        Cart.objects.filter(pk=cart.pk).rebuild_totals()
+        return results
+
     def _delete_item(self, cart_item):
-        cart_item.product.in_stock += cart_item.quantity
-        cart_item.product.save()
+        inventory.restock(cart_item.product_id, cart_item.quantity)
+        cart_item.cart.adjust_totals(-cart_item.quantity, cart_item.product.price)
         cart_item.delete()
 
     # --- Stripe Logic ---
-    @action(detail=False, methods=["post"], url_path="checkout")
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="checkout",
+        throttle_classes=[ScopedTokenBucketThrottle],
+        throttle_scope="checkout",
+    )
+    @idempotent
     def checkout(self, request):
-        stripe.api_key = settings.STRIPE_SECRET_KEY
         cart = get_active_cart(request.user)
 
         if cart.status != "Active": return Response({"error": "Cart closed"}, status=400)
-        if not cart.items.exists(): return Response({"error": "Empty cart"}, status=400)
+        if cart.item_count == 0: return Response({"error": "Empty cart"}, status=400)
 
-        amount_cents = int(cart.total_price[0] * 100)
+        amount_cents = int(cart.total_amount * 100)
         try:
-            intent = stripe.PaymentIntent.create(
+            intent = get_gateway().create_intent(
                 amount=amount_cents,
                 currency="usd",
-                automatic_payment_methods={"enabled": True, "allow_redirects": "never"},
+                idempotency_key=checkout_idempotency_key(cart, amount_cents),
+                metadata={"cart_id": str(cart.pk), "revision": str(cart.revision)},
             )
-            return Response({
-                "clientSecret": intent["client_secret"],
-                "publishableKey": settings.STRIPE_PUBLISHABLE_KEY,
-                "amount": cart.total_price[0],
-            })
-        except Exception as e:
+        except PaymentUnavailable as e:
+            return payment_unavailable_response(e)
+        except PaymentError as e:
             return Response({"error": str(e)}, status=400)
+        # keep the stock held while the customer is paying; written after the
+        # gateway call, so a keyed request (see idempotency.py) holds no locks
+        # while it waits on Stripe
+        inventory.extend_reservations(cart)
+        # not a cart change: leaves the revision (and the idempotency key) alone
+        Cart.objects.filter(pk=cart.pk).update(payment_intent_id=intent["id"])
+        return Response({
+            "clientSecret": intent["client_secret"],
+            "publishableKey": settings.STRIPE_PUBLISHABLE_KEY,
+            "amount": cart.total_amount,
+        })
 
     @action(detail=False, methods=["post"], url_path="confirm_payment")
     def confirm_payment(self, request):
-        stripe.api_key = settings.STRIPE_SECRET_KEY
         payment_intent_id = request.data.get("payment_intent_id")
         if not payment_intent_id: return Response({"error": "Missing ID"}, status=400)
 
-        cart = get_active_cart(request.user)
-        try:
-            intent = stripe.PaymentIntent.retrieve(payment_intent_id)
-            if intent["status"] == "succeeded":
-                if cart.status != "Paid":
-                    cart.status = "Paid"
-                    cart.save()
-                serializer = CartSerializer(cart)
-                return Response({"message": "Paid!", "order": serializer.data})
+        # the webhook (views/webhooks.py) records the outcome, polling is a local read
+        order = (
+            Order.objects.filter(user=request.user, payment_intent_id=payment_intent_id)
+            .prefetch_related("lines")
+            .first()
+        )
+        if order is not None:
+            return Response({"message": "Paid!", "order": OrderSerializer(order).data})
+        events = set(
+            PaymentEvent.objects.filter(payment_intent_id=payment_intent_id).values_list("type", flat=True)
+        )
+        if PAYMENT_SUCCEEDED in events:
+            # paid, but for the cart as it was before an edit (see webhooks.py)
+            return Response(
+                {"error": "Payment doesn't match the cart, it is being reviewed"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if PAYMENT_FAILED in events:
             return Response({"error": "Payment failed"}, status=400)
-        except Exception as e:
-            return Response({"error": str(e)}, status=400)
+        return Response({"status": "pending"}, status=status.HTTP_202_ACCEPTED)
 
     @action(detail=False, methods=["post"])
     def clear_active_cart(self, request):
-        cart = get_active_cart(request.user)
-        if cart.status != "Active": return Response({"error": "Cart closed"}, status=403)
         with transaction.atomic():
-            for item in cart.items.all():
-                item.product.in_stock += item.quantity
-                item.product.save()
+            cart = get_active_cart(request.user, Cart.objects.select_for_update())
+            if cart.status != "Active": return Response({"error": "Cart closed"}, status=403)
+            inventory.restock_many(cart.items.values_list("product_id", "quantity"))
             cart.delete()
         return Response(status=204)
 
@@ -172,31 +346,36 @@ class CartItemViewSet(
 
     def get_queryset(self):
         active_cart = get_active_cart(self.request.user)
-        return CartItem.objects.filter(cart=active_cart)
+        return CartItem.objects.filter(cart=active_cart).select_related("cart", "product")
+
+    def _locked_item(self, pk):
+        # lock the cart like the CartViewSet mutations, then read the item
+        # again: the one get_object() returned may be stale by now
+        cart = get_active_cart(self.request.user, Cart.objects.select_for_update())
+        if cart.status != "Active": raise PermissionDenied("Cart closed")
+        queryset = CartItem.objects.select_for_update().select_related("cart", "product")
+        return get_object_or_404(queryset, pk=pk, cart=cart)
 
     def perform_update(self, serializer):
-        cart_item = self.get_object()
         with transaction.atomic():
-            if cart_item.cart.status != "Active": raise PermissionDenied("Cart closed")
-            
+            cart_item = serializer.instance = self._locked_item(serializer.instance.pk)
+
             new_qty = serializer.validated_data.get("quantity")
             old_qty = cart_item.quantity
             if new_qty is None: return serializer.save()
 
             diff = new_qty - old_qty
-            if diff > 0:
-                if cart_item.product.in_stock < diff:
-                    raise PermissionDenied("Insufficient stock")
-                cart_item.product.in_stock -= diff
-            elif diff < 0:
-                cart_item.product.in_stock += abs(diff)
-            
-            cart_item.product.save()
-            serializer.save()
+            try:
+                inventory.adjust_stock(cart_item.product_id, diff)
+            except inventory.InsufficientStock:
+                raise PermissionDenied("Insufficient stock")
+
+            cart_item.cart.adjust_totals(diff, cart_item.product.price)
+            inventory.reserve(serializer.save())
 
     def perform_destroy(self, instance):
         with transaction.atomic():
-            if instance.cart.status != "Active": raise PermissionDenied("Cart closed")
-            instance.product.in_stock += instance.quantity
-            instance.product.save()
+            instance = self._locked_item(instance.pk)
+            inventory.restock(instance.product_id, instance.quantity)
+            instance.cart.adjust_totals(-instance.quantity, instance.product.price)
             instance.delete()
\ No newline at end of file
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+from ..metrics import registry
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@require_GET
+def metrics_view(request):
+    # a plain Django view: scrapes skip DRF's authentication and negotiation
+    token = settings.METRICS["TOKEN"]
+    if not token:
+        # closed unless configured: per-route traffic and errors aren't public
+        if not settings.DEBUG:
+            raise Http404
+    elif not constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return HttpResponse(status=401, headers={"WWW-Authenticate": "Bearer"})
+    return HttpResponse(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
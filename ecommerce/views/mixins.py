@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.response import Response
+
+from ..metrics import timed
+
+
+class FastListMixin:
+    # with settings.FAST_SERIALIZERS, list() reads `fast_list_values` and hands
+    # the page to `fast_list_rows`, which builds the serializer's output as
+    # plain dicts (see serializers/fast.py) without model instances or
+    # serializer fields. Both are required, checked when the view is defined:
+    #   fast_list_values = PRODUCT_LIST_VALUES
+    #   fast_list_rows = staticmethod(product_list_rows)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        missing = [name for name in ("fast_list_values", "fast_list_rows") if not hasattr(cls, name)]
+        if missing:
+            raise ImproperlyConfigured(f"{cls.__name__} must set {' and '.join(missing)}.")
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.prefetch_related(None).values(*self.fast_list_values)
+        page = self.paginate_queryset(rows)
+        with timed("serialize"):
+            data = self.fast_list_rows(rows if page is None else page)
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
@@ -0,0 +1,17 @@
+from rest_framework import viewsets, permissions
+
+from ..models import Order
+from ..serializers import OrderSerializer
+
+
+class OrderViewSet(viewsets.ReadOnlyModelViewSet):
+    # order history: frozen snapshots of paid carts, newest first
+    serializer_class = OrderSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return (
+            Order.objects.filter(user=self.request.user)
+            .prefetch_related("lines")
+            .order_by("-paid_at", "-id")
+        )
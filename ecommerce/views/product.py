@@ -1,14 +1,80 @@
-from rest_framework import viewsets, filters
+from rest_framework import viewsets, filters, permissions
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError as BadRequest
+from rest_framework.response import Response
+from django.core.exceptions import ValidationError
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
 
-from ..models import Product
+from ..models import Category, Product, product_stock
 from ..serializers import ProductSerializer, ProductDetailSerializer
+from ..serializers.fast import PRODUCT_LIST_VALUES, product_list_rows
 from ..permissions import IsAdminOrReadOnly
-from ..filters import ProductFilter
+from ..filters import ProductFilter, ProductSearchFilter
+from ..pagination import ProductPagination
+from ..catalog_cache import catalog_key, get_or_compute
+from ..conditional import make_etag, not_modified, set_validators
+from ..export import CONTENT_TYPES, stream_catalog
+from .mixins import FastListMixin
 
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+class CatalogCacheMixin:
+    # serve list/retrieve from the versioned catalog cache (see catalog_cache.py)
+    # and answer conditional GETs from the same cheap state
+
+    def list(self, request, *args, **kwargs):
+        key = catalog_key(request, "list")
+        etag = make_etag(key)
+        response = not_modified(request, etag=etag)
+        if response is not None:
+            return response
+
+        data = get_or_compute(
+            key,
+            lambda: super(CatalogCacheMixin, self).list(request, *args, **kwargs).data,
+        )
+        return set_validators(Response(data), etag=etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        try:
+            # stock moves with every cart change without bumping the catalog
+            # version, so read it fresh (a primary-key lookup, plus the
+            # shards of a sharded product)
+            live = Product.objects.filter(pk=pk).values(stock=product_stock()).first()
+        except (TypeError, ValueError, ValidationError):
+            live = None
+        if live is None:
+            raise Http404
+
+        key = catalog_key(request, "retrieve", pk)
+        # no Last-Modified: the stock UPDATEs don't touch updated_at, so only
+        # the ETag, which covers the stock, says whether the detail changed
+        etag = make_etag(key, live["stock"])
+        response = not_modified(request, etag=etag)
+        if response is not None:
+            return response
+
+        data = get_or_compute(
+            key,
+            lambda: super(CatalogCacheMixin, self).retrieve(request, *args, **kwargs).data,
+        )
+        if "in_stock" in data:
+            data = dict(data)
+            data["in_stock"] = live["stock"]
+        return set_validators(Response(data), etag=etag)
+
+
+class ProductViewSet(CatalogCacheMixin, FastListMixin, viewsets.ModelViewSet):
+    # categories in id order, the order the fast list path uses too
+    queryset = Product.objects.prefetch_related(
+        Prefetch("category", queryset=Category.objects.order_by("pk"))
+    )
+    fast_list_values = PRODUCT_LIST_VALUES
+    fast_list_rows = staticmethod(product_list_rows)
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -16,11 +82,53 @@ class ProductViewSet(viewsets.ModelViewSet):
         return ProductDetailSerializer
 
     permission_classes = [IsAdminOrReadOnly]
+    # reads don't need the user row, build it from the token claims
+    stateless_auth = True
+    # GETs may be served by a read replica (see routers.py)
+    replica_reads = True
+    pagination_class = ProductPagination
     ordering_fields = ["price", "created_at"]
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter,
+        ProductSearchFilter,
         filters.OrderingFilter,
     ]
     filterset_class = ProductFilter
     search_fields = ["name", "description"]
+
+    # --- Export --- #
+    EXPORT_CHUNK_SIZE = 2000
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="export",
+        permission_classes=[permissions.IsAdminUser],
+        # is_staff has to come from the user row, not the token
+        stateless_auth=False,
+    )
+    def export(self, request):
+        output = request.query_params.get("output", "ndjson")
+        if output not in CONTENT_TYPES:
+            raise BadRequest({"output": f"Choose one of {sorted(CONTENT_TYPES)}."})
+        since = request.query_params.get("since")
+        if since is not None:
+            since = parse_datetime(since)
+            if since is None:
+                raise BadRequest({"since": "Expected an ISO 8601 datetime."})
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        # rows changed while streaming may be missed; pass this as the next ?since=
+        watermark = timezone.now()
+        gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+        response = StreamingHttpResponse(
+            stream_catalog(output, since, self.EXPORT_CHUNK_SIZE, gzip=gzip),
+            content_type=CONTENT_TYPES[output],
+        )
+        response["Content-Disposition"] = f'attachment; filename="catalog.{output}"'
+        response["X-Export-Watermark"] = watermark.isoformat()
+        response["Vary"] = "Accept-Encoding"
+        if gzip:
+            response["Content-Encoding"] = "gzip"
+        return response
@@ -0,0 +1,111 @@
+import logging
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ..models import PAYMENT_FAILED, PAYMENT_SUCCEEDED, Cart, PaymentEvent
+from ..orders import OrderTotalMismatch, freeze_carts
+
+
+PAYMENT_EVENTS = {PAYMENT_SUCCEEDED, PAYMENT_FAILED}
+
+logger = logging.getLogger(__name__)
+
+
+def find_cart(intent):
+    carts = Cart.objects.select_for_update()
+    cart_id = (intent.get("metadata") or {}).get("cart_id")
+    if cart_id and str(cart_id).isdigit():
+        return carts.filter(pk=cart_id).first()
+    return carts.filter(payment_intent_id=intent["id"]).first()
+
+
+def paid_for_cart(intent, cart):
+    # the intent was created for the cart as it is now: same revision (any
+    # edit or price change bumps it) and the amount checkout charges for it
+    revision = (intent.get("metadata") or {}).get("revision")
+    if revision is not None and str(revision) != str(cart.revision):
+        return False
+    return intent.get("amount") == int(cart.total_amount * 100)
+
+
+def apply_payment_event(event):
+    """
+    Record a Stripe payment event and freeze its cart into an Order on success.
+
+    Safe to replay and to receive out of order: each event id is stored once,
+    and the only transition is active cart -> order, so a late failure can't
+    undo a payment and a second success for a frozen cart changes nothing.
+    A success for an intent that doesn't match the cart any more (edited
+    after checkout), or whose lines don't add up to the amount charged, is
+    recorded but leaves the cart alone, for review.
+    Returns False when the event was ignored or already seen.
+    """
+    if event["type"] not in PAYMENT_EVENTS:
+        return False
+    intent = event["data"]["object"]
+    with transaction.atomic():
+        cart = find_cart(intent)
+        _, created = PaymentEvent.objects.get_or_create(
+            event_id=event["id"],
+            defaults={
+                "type": event["type"],
+                "payment_intent_id": intent["id"],
+                "cart": cart,
+                "created": datetime.fromtimestamp(event["created"], tz=dt_timezone.utc),
+            },
+        )
+        if not created:
+            return False
+        if event["type"] == PAYMENT_SUCCEEDED and cart is not None and cart.status == "Active":
+            if not paid_for_cart(intent, cart):
+                logger.error(
+                    "Payment %s (%s cents) doesn't match cart %s (revision %s, %s); left for review",
+                    intent["id"], intent.get("amount"), cart.pk, cart.revision, cart.total_amount,
+                )
+                return True
+            # record the intent that was actually paid, which may predate the
+            # cart's latest checkout; the stock is sold, reservations go with the cart
+            cart.payment_intent_id = intent["id"]
+            # the total is what was charged; the lines must add up to it
+            try:
+                with transaction.atomic():
+                    freeze_carts(
+                        [cart], paid_at=timezone.now(), amounts={cart.pk: Decimal(intent["amount"]) / 100}
+                    )
+            except OrderTotalMismatch as e:
+                # a 500 would roll the event back and Stripe redeliver it forever
+                logger.error("Payment %s can't be frozen into an order (%s); left for review", intent["id"], e)
+    return True
+
+
+class StripeWebhookView(APIView):
+    # Stripe authenticates with the signature header, not a user session
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            return Response(
+                {"error": "Webhook not configured"}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        try:
+            event = stripe.Webhook.construct_event(
+                request.body,
+                request.META.get("HTTP_STRIPE_SIGNATURE", ""),
+                settings.STRIPE_WEBHOOK_SECRET,
+            )
+        except ValueError:
+            return Response({"error": "Invalid payload"}, status=status.HTTP_400_BAD_REQUEST)
+        except stripe.SignatureVerificationError:
+            return Response({"error": "Invalid signature"}, status=status.HTTP_400_BAD_REQUEST)
+
+        apply_payment_event(event)
+        return Response({"received": True})